@@ -0,0 +1,270 @@
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.routing import Match
+
+from . import database
+from .cache import REDIS_URL
+from .metrics import REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# Tokens each client earns per second, and the most it can save up; a
+# request spends its route's cost. A rate of 0 disables rate limiting.
+RATE_LIMIT_RATE = float(getenv("RATE_LIMIT_RATE", "50"))
+RATE_LIMIT_BURST = float(getenv("RATE_LIMIT_BURST", "200"))
+# "memory" (per process) or "redis" (shared between workers, at REDIS_URL)
+RATE_LIMIT_BACKEND = getenv("RATE_LIMIT_BACKEND", "memory").lower()
+# Clients tracked by the memory backend; the least recent are forgotten
+RATE_LIMIT_MAX_CLIENTS = 10000
+# Requests handled at once by a process before others are shed with 503;
+# 0 disables the limit
+SHED_MAX_IN_FLIGHT = int(getenv("SHED_MAX_IN_FLIGHT", "200"))
+# Recent wait for a database connection beyond which requests are shed
+# with 503; 0 disables the check
+SHED_POOL_WAIT_SECONDS = float(getenv("SHED_POOL_WAIT_SECONDS", "1.0"))
+SHED_RETRY_AFTER = 1
+
+API_KEY_HEADER = "x-api-key"
+DEFAULT_COST = 1
+
+# Routes costing more than one token: lists, exports and searches scan many
+# rows, signups run bcrypt and bulk writes touch up to BULK_MAX_ITEMS rows
+ROUTE_COSTS = {
+    ("GET", "/appointments/"): 5,
+    ("GET", "/appointments/export"): 20,
+    ("GET", "/availability"): 5,
+    ("GET", "/billings/"): 5,
+    ("GET", "/billings/export"): 20,
+    ("GET", "/billings/summary"): 5,
+    ("GET", "/changes"): 5,
+    ("GET", "/jobs/"): 5,
+    ("GET", "/users/{user_id}/chart"): 5,
+    ("GET", "/users/{user_id}/medical-records"): 5,
+    ("GET", "/users/{user_id}/medical-records/search"): 5,
+    ("GET", "/users/{user_id}/notes"): 5,
+    ("GET", "/users/{user_id}/notes/search"): 5,
+    ("POST", "/users/"): 10,
+    ("POST", "/appointments/bulk"): 10,
+    ("PUT", "/appointments/bulk"): 10,
+    ("POST", "/billings/bulk"): 10,
+    ("PUT", "/billings/bulk"): 10,
+    ("POST", "/billings/runs"): 10,
+}
+
+# Operational reads, cheap and needed most when the API is overloaded: never
+# limited or shed
+EXEMPT_ROUTES = {
+    ("GET", "/metrics"),
+    ("GET", "/internal/pool"),
+    ("GET", "/internal/replicas"),
+    ("GET", "/internal/cache"),
+    ("GET", "/internal/profiles"),
+    ("GET", "/internal/profiles/{profile_id}"),
+}
+
+
+class MemoryBuckets:
+    """
+    Token buckets of the clients of this process.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, client: str, cost: float) -> float:
+        """
+        Spend `cost` tokens of a client's bucket.
+
+        Returns:
+            float: 0 if the tokens were spent, otherwise the seconds until
+            the bucket holds enough of them.
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            # A forgotten client starts again with a full bucket
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def close(self) -> None:
+        self._buckets.clear()
+
+
+# Refill and spend in one atomic step on the server, with its clock
+_REDIS_TAKE = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """
+    Token buckets shared by every worker, in Redis.
+
+    Requests are let through while Redis is unreachable, so an outage of the
+    limiter does not become an outage of the API.
+    """
+
+    def __init__(self, client, rate: float, burst: float, prefix: str = "amigo:rl:"):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+
+    async def take(self, client: str, cost: float) -> float:
+        try:
+            wait = await self.client.eval(
+                _REDIS_TAKE, 1, self.prefix + client, self.rate, self.burst, cost
+            )
+        except Exception:
+            logger.warning("Rate limiting skipped, Redis failed", exc_info=True)
+            return 0.0
+        return float(wait)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_buckets():
+    """
+    Build the token bucket backend selected by RATE_LIMIT_BACKEND.
+    """
+    if RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        return RedisBuckets(
+            redis.Redis.from_url(REDIS_URL), RATE_LIMIT_RATE, RATE_LIMIT_BURST
+        )
+    return MemoryBuckets(RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_MAX_CLIENTS)
+
+
+buckets = create_buckets()
+
+
+def client_id(scope) -> str:
+    """
+    Who a request is rate limited as: its API key, or else its address.
+    """
+    api_key = Headers(scope=scope).get(API_KEY_HEADER)
+    if api_key:
+        # Hashed, so keys are never held in memory or Redis as sent
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def _match_route(scope):
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def _reject(status: int, detail: str, retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class AdmissionMiddleware:
+    """
+    Turn requests away before they reach the database when a client exceeds
+    its rate, with 429, or when this process is overloaded, with 503.
+
+    Each client has a token bucket refilled at RATE_LIMIT_RATE, from which a
+    request spends its route's cost in ROUTE_COSTS. The process is
+    overloaded when SHED_MAX_IN_FLIGHT requests are already running, or when
+    requests recently waited over SHED_POOL_WAIT_SECONDS for a database
+    connection; shedding then keeps the latency of admitted requests
+    bounded instead of queueing everyone. The operational reads in
+    EXEMPT_ROUTES, such as /metrics, are never limited.
+    """
+
+    def __init__(self, app, buckets=buckets):
+        self.app = app
+        self.buckets = buckets
+        self.in_flight = 0
+
+    def overloaded(self) -> Optional[str]:
+        """
+        Why the process should shed requests right now, if it should.
+        """
+        if SHED_MAX_IN_FLIGHT and self.in_flight >= SHED_MAX_IN_FLIGHT:
+            return "in_flight"
+        if (
+            SHED_POOL_WAIT_SECONDS
+            and database.pool_metrics.recent_wait() > SHED_POOL_WAIT_SECONDS
+        ):
+            return "pool_wait"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = _match_route(scope)
+        path = getattr(route, "path", None)
+        if route is not None:
+            # Also lets the metrics label rejected requests with their route
+            scope["route"] = route
+        if (scope["method"], path) in EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self.overloaded()
+        if reason is not None:
+            REJECTIONS.inc((reason,))
+            response = _reject(503, "Server overloaded", SHED_RETRY_AFTER)
+            await response(scope, receive, send)
+            return
+
+        if self.buckets.rate > 0:
+            cost = ROUTE_COSTS.get((scope["method"], path), DEFAULT_COST)
+            # A cost above the burst could never be paid
+            wait = await self.buckets.take(
+                client_id(scope), min(cost, self.buckets.burst)
+            )
+            if wait > 0:
+                REJECTIONS.inc(("rate_limited",))
+                response = _reject(429, "Rate limit exceeded", math.ceil(wait))
+                await response(scope, receive, send)
+                return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
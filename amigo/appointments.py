@@ -1,13 +1,57 @@
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models, schemas
+from .bulk import bulk_create, bulk_update
+from .cache import cache_key, invalidate, read_through, serialize
+from .conditional import make_etag
 from .database import get_db
+from .export import ExportFormat, export_response
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from .replicas import get_read_db, read_bind
+from .scheduling import (
+    check_bulk_conflicts,
+    check_interval,
+    ensure_no_conflict,
+    find_availability,
+    rejecting_overlaps,
+)
+from .serialization import json_response
+from .writes import delete_returning, insert_returning, update_returning
 
 router = APIRouter()
 
+# Bounds on availability searches, so each one stays a small range scan
+MAX_AVAILABILITY_WINDOW = timedelta(days=31)
+MAX_AVAILABILITY_USERS = 50
+
+
+def filter_appointments(
+    user_id: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+) -> Select:
+    """
+    Build the appointment select shared by the list and export endpoints.
+
+    Appointments can be filtered by user and by a window: only appointments
+    starting at or after `start_time` and ending at or before `end_time`
+    are selected.
+    """
+    statement = select(models.Appointment)
+    if user_id is not None:
+        statement = statement.where(models.Appointment.user_id == user_id)
+    if start_time is not None:
+        statement = statement.where(models.Appointment.start_time >= start_time)
+    if end_time is not None:
+        statement = statement.where(models.Appointment.end_time <= end_time)
+    return statement
+
 
 @router.post(
     "/appointments/",
@@ -15,28 +59,109 @@ router = APIRouter()
     response_model=schemas.Appointment,
     status_code=status.HTTP_201_CREATED,
 )
-def create_appointment(
-    appointment: schemas.AppointmentCreate, db: Session = Depends(get_db)
+async def create_appointment(
+    appointment: schemas.AppointmentCreate, db: AsyncSession = Depends(get_db)
 ) -> models.Appointment:
     """
     Create a new appointment in the database.
+
+    Appointments of the same user may not overlap; an overlapping appointment
+    is rejected with 409.
     """
-    new_appointment = models.Appointment(**appointment.model_dump())
-    db.add(new_appointment)
-    db.commit()
-    db.refresh(new_appointment)
+    await ensure_no_conflict(
+        db, appointment.user_id, appointment.start_time, appointment.end_time
+    )
+    async with rejecting_overlaps(db):
+        new_appointment = await insert_returning(
+            db, models.Appointment, appointment.model_dump()
+        )
+        await db.commit()
     return new_appointment
 
 
 @router.get(
-    "/appointments/", tags=["appointments"], response_model=List[schemas.Appointment]
+    "/appointments/",
+    tags=["appointments"],
+    response_model=schemas.Page[schemas.Appointment],
 )
-def get_appointments(db: Session = Depends(get_db)) -> List[models.Appointment]:
+async def get_appointments(
+    statement: Select = Depends(filter_appointments),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
     """
-    Retrieve all appointments from the database.
+    Retrieve one page of appointments, ordered by ID.
+
+    Pass the `next_cursor` of a page as `cursor` to fetch the following one.
     """
-    appointments = db.query(models.Appointment).all()
-    return appointments
+    page = await paginate(db, statement, models.Appointment.id, cursor, limit)
+    return json_response(schemas.Page[schemas.Appointment], page)
+
+
+@router.get(
+    "/appointments/export", tags=["appointments"], response_class=StreamingResponse
+)
+async def export_appointments(
+    format: ExportFormat = "ndjson",
+    statement: Select = Depends(filter_appointments),
+    bind=Depends(read_bind),
+) -> StreamingResponse:
+    """
+    Stream every appointment matching the filters as NDJSON or CSV.
+    """
+    return export_response(
+        models.Appointment,
+        statement,
+        schemas.Appointment,
+        format,
+        "appointments",
+        bind=bind,
+    )
+
+
+@router.post(
+    "/appointments/bulk", tags=["appointments"], response_model=schemas.BulkResponse
+)
+async def create_appointments_bulk(
+    request: schemas.BulkRequest, db: AsyncSession = Depends(get_db)
+) -> dict:
+    """
+    Create many appointments in a single transaction.
+
+    Every item is validated as an AppointmentCreate and checked for overlaps
+    with existing appointments and the rest of the batch. When `atomic` is
+    true (the default) any invalid item rejects the whole batch with 422;
+    otherwise the valid items are created and the others reported as errors.
+    """
+    # Concurrent inserts escaping the overlap check still get 409, not 500
+    async with rejecting_overlaps(db):
+        return await bulk_create(
+            db,
+            models.Appointment,
+            schemas.AppointmentCreate,
+            request,
+            check=check_bulk_conflicts,
+        )
+
+
+@router.put(
+    "/appointments/bulk", tags=["appointments"], response_model=schemas.BulkResponse
+)
+async def update_appointments_bulk(
+    request: schemas.BulkRequest, db: AsyncSession = Depends(get_db)
+) -> dict:
+    """
+    Update many appointments, identified by their `id`, in a single transaction.
+    """
+    async with rejecting_overlaps(db):
+        return await bulk_update(
+            db,
+            models.Appointment,
+            schemas.AppointmentBulkUpdate,
+            request,
+            check=check_bulk_conflicts,
+        )
 
 
 @router.get(
@@ -44,20 +169,26 @@ def get_appointments(db: Session = Depends(get_db)) -> List[models.Appointment]:
     tags=["appointments"],
     response_model=schemas.Appointment,
 )
-def get_appointment(
-    appointment_id: int, db: Session = Depends(get_db)
-) -> models.Appointment:
+async def get_appointment(
+    appointment_id: int, request: Request, db: AsyncSession = Depends(get_read_db)
+) -> Response:
     """
-    Retrieve a specific appointment by its ID.
+    Retrieve a specific appointment by its ID, from the cache when possible.
+
+    The response carries an ETag; a request whose If-None-Match lists it is
+    answered with an empty 304.
     """
-    appointment = (
-        db.query(models.Appointment)
-        .filter(models.Appointment.id == appointment_id)
-        .first()
-    )
-    if appointment is None:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    return appointment
+
+    async def load():
+        appointment = await db.get(models.Appointment, appointment_id)
+        if appointment is None:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        return make_etag(appointment.version), serialize(
+            schemas.Appointment, appointment
+        )
+
+    key = cache_key(models.Appointment, appointment_id)
+    return await read_through(request, key, load)
 
 
 @router.put(
@@ -65,25 +196,41 @@ def get_appointment(
     tags=["appointments"],
     response_model=schemas.Appointment,
 )
-def update_appointment(
+async def update_appointment(
     appointment_id: int,
     updated_appointment: schemas.AppointmentUpdate,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
 ) -> models.Appointment:
     """
     Update an existing appointment.
+
+    With an If-Match header the update only applies to the version the
+    client last read; otherwise it is rejected with 412.
     """
-    appointment = (
-        db.query(models.Appointment)
-        .filter(models.Appointment.id == appointment_id)
-        .first()
-    )
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    appointment_data = updated_appointment.model_dump(exclude_unset=True)
-    for key, value in appointment_data.items():
-        setattr(appointment, key, value)
-    db.commit()
+    check_interval(updated_appointment.start_time, updated_appointment.end_time)
+    async with rejecting_overlaps(db):
+        # Updated first, so a missing or stale row is reported as such rather
+        # than as an overlap; the check then runs in the same transaction
+        appointment = await update_returning(
+            db,
+            models.Appointment,
+            appointment_id,
+            updated_appointment.model_dump(exclude_unset=True),
+            request,
+            "Appointment not found",
+        )
+        await ensure_no_conflict(
+            db,
+            updated_appointment.user_id,
+            updated_appointment.start_time,
+            updated_appointment.end_time,
+            exclude_id=appointment_id,
+        )
+        await db.commit()
+    await invalidate(models.Appointment, [appointment_id])
+    response.headers["ETag"] = make_etag(appointment.version)
     return appointment
 
 
@@ -92,16 +239,83 @@ def update_appointment(
     tags=["appointments"],
     status_code=status.HTTP_204_NO_CONTENT,
 )
-def delete_appointment(appointment_id: int, db: Session = Depends(get_db)) -> None:
+async def delete_appointment(
+    appointment_id: int, db: AsyncSession = Depends(get_db)
+) -> None:
     """
     Delete an appointment from the database.
     """
-    appointment = (
-        db.query(models.Appointment)
-        .filter(models.Appointment.id == appointment_id)
-        .first()
+    await delete_returning(
+        db, models.Appointment, appointment_id, "Appointment not found"
+    )
+    await db.commit()
+    await invalidate(models.Appointment, [appointment_id])
+
+
+def availability_window(
+    window_start: datetime = Query(alias="from"),
+    window_end: datetime = Query(alias="to"),
+    duration: int = Query(30, ge=1, le=24 * 60, description="Minutes"),
+) -> Tuple[datetime, datetime, timedelta]:
+    """
+    Validate the window and slot length shared by the availability endpoints.
+    Aware bounds are converted to naive UTC, as the appointment times are.
+    """
+    window_start = schemas.naive_utc(window_start)
+    window_end = schemas.naive_utc(window_end)
+    if window_end <= window_start:
+        raise HTTPException(status_code=422, detail="'to' must be after 'from'")
+    if window_end - window_start > MAX_AVAILABILITY_WINDOW:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Window may span at most {MAX_AVAILABILITY_WINDOW.days} days",
+        )
+    return window_start, window_end, timedelta(minutes=duration)
+
+
+def _availability(user_id: int, free: list) -> dict:
+    return {
+        "user_id": user_id,
+        "free": [{"start_time": start, "end_time": end} for start, end in free],
+    }
+
+
+@router.get(
+    "/users/{user_id}/availability",
+    tags=["appointments"],
+    response_model=schemas.Availability,
+)
+async def get_user_availability(
+    user_id: int,
+    window: Tuple[datetime, datetime, timedelta] = Depends(availability_window),
+    db: AsyncSession = Depends(get_read_db),
+) -> dict:
+    """
+    List the free slots of at least `duration` minutes in a user's calendar
+    between `from` and `to`.
+    """
+    if await db.get(models.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    availability = await find_availability(db, [user_id], *window)
+    return _availability(user_id, availability[user_id])
+
+
+@router.get(
+    "/availability",
+    tags=["appointments"],
+    response_model=List[schemas.Availability],
+)
+async def get_availability(
+    user_ids: List[int] = Query(min_length=1, max_length=MAX_AVAILABILITY_USERS),
+    window: Tuple[datetime, datetime, timedelta] = Depends(availability_window),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    List the free slots of several users at once, e.g. every clinician shown
+    by the booking page, with a single query.
+    """
+    availability = await find_availability(db, list(dict.fromkeys(user_ids)), *window)
+    return json_response(
+        List[schemas.Availability],
+        [_availability(user_id, free) for user_id, free in availability.items()],
     )
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    db.delete(appointment)
-    db.commit()
@@ -1,13 +1,59 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models, schemas
+from .billing_summary import summarize_billings
+from .bulk import bulk_create, bulk_update
+from .cache import cache_key, invalidate, read_through, serialize
+from .conditional import make_etag
 from .database import get_db
+from .export import ExportFormat, export_response
+from .jobs import submit_job
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from .replicas import get_read_db, read_bind
+from .serialization import json_response
+from .writes import delete_returning, insert_returning, update_returning
 
 router = APIRouter()
 
+# Users per multi-user summary request
+MAX_SUMMARY_USERS = 100
+
+
+def filter_billings(
+    user_id: Optional[int] = None,
+    paid: Optional[bool] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Select:
+    """
+    Build the billing select shared by the list and export endpoints.
+
+    Parameters:
+    - user_id: Only select billing records for this user
+    - paid: Only select paid (true) or unpaid (false) billing records
+    - date_from: Only select billing records dated at or after this time
+    - date_to: Only select billing records dated at or before this time
+
+    Returns:
+    - The filtered select statement
+    """
+    statement = select(models.Billing)
+    if user_id is not None:
+        statement = statement.where(models.Billing.user_id == user_id)
+    if paid is not None:
+        statement = statement.where(models.Billing.paid == paid)
+    if date_from is not None:
+        statement = statement.where(models.Billing.date >= date_from)
+    if date_to is not None:
+        statement = statement.where(models.Billing.date <= date_to)
+    return statement
+
 
 @router.post(
     "/billings/",
@@ -15,8 +61,8 @@ router = APIRouter()
     response_model=schemas.Billing,
     status_code=status.HTTP_201_CREATED,
 )
-def create_billing(
-    billing: schemas.BillingCreate, db: Session = Depends(get_db)
+async def create_billing(
+    billing: schemas.BillingCreate, db: AsyncSession = Depends(get_db)
 ) -> models.Billing:
     """
     Create a new billing record.
@@ -28,29 +74,210 @@ def create_billing(
     Returns:
     - The created billing record as a Billing model instance
     """
-    new_billing = models.Billing(**billing.model_dump())
-    db.add(new_billing)
-    db.commit()
-    db.refresh(new_billing)
+    new_billing = await insert_returning(db, models.Billing, billing.model_dump())
+    await db.commit()
     return new_billing
 
 
-@router.get("/billings/", tags=["billings"], response_model=List[schemas.Billing])
-def get_billings(db: Session = Depends(get_db)) -> List[models.Billing]:
+@router.get(
+    "/billings/", tags=["billings"], response_model=schemas.Page[schemas.Billing]
+)
+async def get_billings(
+    statement: Select = Depends(filter_billings),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Retrieve one page of billing records, ordered by ID.
+
+    Parameters:
+    - statement: The billing select filtered by user, paid status and date
+    - cursor: The `next_cursor` returned with the previous page
+    - limit: Maximum number of billing records in the page
+    - db: Database session dependency
+
+    Returns:
+    - A page of billing records and the cursor for the next page, if any
+
+    Raises:
+    - HTTPException: 400 error if the cursor is malformed
+    """
+    page = await paginate(db, statement, models.Billing.id, cursor, limit)
+    return json_response(schemas.Page[schemas.Billing], page)
+
+
+@router.get("/billings/export", tags=["billings"], response_class=StreamingResponse)
+async def export_billings(
+    format: ExportFormat = "ndjson",
+    statement: Select = Depends(filter_billings),
+    bind=Depends(read_bind),
+) -> StreamingResponse:
+    """
+    Stream every billing record matching the filters as NDJSON or CSV.
+
+    Parameters:
+    - format: "ndjson" (one JSON object per line) or "csv"
+    - statement: The billing select filtered by user, paid status and date
+
+    Returns:
+    - The streamed export, read from the database in batches
+    """
+    return export_response(
+        models.Billing, statement, schemas.Billing, format, "billings", bind=bind
+    )
+
+
+@router.post("/billings/bulk", tags=["billings"], response_model=schemas.BulkResponse)
+async def create_billings_bulk(
+    request: schemas.BulkRequest, db: AsyncSession = Depends(get_db)
+) -> dict:
+    """
+    Create many billing records in a single transaction.
+
+    Parameters:
+    - request: The BillingCreate items and whether the batch is atomic
+    - db: Database session dependency
+
+    Returns:
+    - The number of created and failed items, and a result for each item
+
+    Raises:
+    - HTTPException: 422 error if the batch is atomic and any item is invalid
+    """
+    return await bulk_create(db, models.Billing, schemas.BillingCreate, request)
+
+
+@router.put("/billings/bulk", tags=["billings"], response_model=schemas.BulkResponse)
+async def update_billings_bulk(
+    request: schemas.BulkRequest, db: AsyncSession = Depends(get_db)
+) -> dict:
+    """
+    Update many billing records, identified by their `id`, in a single transaction.
+
+    Parameters:
+    - request: The BillingBulkUpdate items and whether the batch is atomic
+    - db: Database session dependency
+
+    Returns:
+    - The number of updated and failed items, and a result for each item
+
+    Raises:
+    - HTTPException: 422 error if the batch is atomic and any item is invalid
+      or does not exist
+    """
+    return await bulk_update(db, models.Billing, schemas.BillingBulkUpdate, request)
+
+
+@router.post(
+    "/billings/runs",
+    tags=["billings"],
+    response_model=schemas.Job,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def submit_billing_run(
+    run: schemas.BillingRunRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+) -> models.Job:
+    """
+    Queue a billing run: the creation of up to JOB_MAX_ITEMS billing records
+    by the background workers, in batches.
+
+    Parameters:
+    - run: The BillingCreate items; invalid items and unknown users are
+      reported on the job instead of failing the run
+
+    Returns:
+    - The queued job, with its URL in the Location header
+    """
+    job = await submit_job(db, "billing_run", run.model_dump(), total=len(run.items))
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
+
+
+@router.post(
+    "/billings/mark-paid",
+    tags=["billings"],
+    response_model=schemas.Job,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def submit_mark_paid(
+    filters: schemas.MarkPaidRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+) -> models.Job:
     """
-    Retrieve all billing records from the database.
+    Queue the marking as paid of every unpaid billing record matching the
+    filters, by the background workers, in batches.
 
     Parameters:
+    - filters: Only mark the records of this user, and dated within this range
+
+    Returns:
+    - The queued job, with its URL in the Location header
+    """
+    job = await submit_job(db, "mark_paid", filters.model_dump(mode="json"))
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
+
+
+@router.get(
+    "/billings/summary",
+    tags=["billings"],
+    response_model=List[schemas.BillingSummary],
+)
+async def get_billing_summaries(
+    user_ids: List[int] = Query(min_length=1, max_length=MAX_SUMMARY_USERS),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Summarize the billing records of several users with a single query.
+
+    Parameters:
+    - user_ids: The users to summarize
     - db: Database session dependency
 
     Returns:
-    - A list of billing records as Billing model instances
+    - For each user: record counts, the billed total, the unpaid balance, and
+      the same figures per month
+    """
+    summaries = await summarize_billings(db, list(dict.fromkeys(user_ids)))
+    return json_response(List[schemas.BillingSummary], summaries)
+
+
+@router.get(
+    "/users/{user_id}/billing-summary",
+    tags=["billings"],
+    response_model=schemas.BillingSummary,
+)
+async def get_user_billing_summary(
+    user_id: int, db: AsyncSession = Depends(get_read_db)
+) -> dict:
     """
-    return db.query(models.Billing).all()
+    Summarize a user's billing records, including their outstanding balance.
+
+    Parameters:
+    - user_id: The user to summarize
+    - db: Database session dependency
+
+    Returns:
+    - Record counts, the billed total and the unpaid balance, overall and per
+      month
+
+    Raises:
+    - HTTPException: 404 error if the user is not found
+    """
+    if await db.get(models.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    (summary,) = await summarize_billings(db, [user_id])
+    return summary
 
 
 @router.get("/billings/{billing_id}", tags=["billings"], response_model=schemas.Billing)
-def get_billing(billing_id: int, db: Session = Depends(get_db)) -> models.Billing:
+async def get_billing(
+    billing_id: int, request: Request, db: AsyncSession = Depends(get_read_db)
+) -> Response:
     """
     Retrieve a specific billing record by its ID.
 
@@ -59,20 +286,29 @@ def get_billing(billing_id: int, db: Session = Depends(get_db)) -> models.Billin
     - db: Database session dependency
 
     Returns:
-    - The requested billing record as a Billing model instance
+    - The requested billing record, served from the cache when possible, with
+      its ETag; 304 if If-None-Match lists the current ETag
 
     Raises:
     - HTTPException: 404 error if the billing record is not found
     """
-    billing = db.query(models.Billing).filter(models.Billing.id == billing_id).first()
-    if not billing:
-        raise HTTPException(status_code=404, detail="Billing record not found")
-    return billing
+
+    async def load():
+        billing = await db.get(models.Billing, billing_id)
+        if not billing:
+            raise HTTPException(status_code=404, detail="Billing record not found")
+        return make_etag(billing.version), serialize(schemas.Billing, billing)
+
+    return await read_through(request, cache_key(models.Billing, billing_id), load)
 
 
 @router.put("/billings/{billing_id}", tags=["billings"], response_model=schemas.Billing)
-def update_billing(
-    billing_id: int, billing: schemas.BillingUpdate, db: Session = Depends(get_db)
+async def update_billing(
+    billing_id: int,
+    billing: schemas.BillingUpdate,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
 ) -> models.Billing:
     """
     Update an existing billing record.
@@ -83,28 +319,30 @@ def update_billing(
     - db: Database session dependency
 
     Returns:
-    - The updated billing record as a Billing model instance
+    - The updated billing record as a Billing model instance, with its new ETag
 
     Raises:
     - HTTPException: 404 error if the billing record is not found
+    - HTTPException: 412 error if If-Match does not list the current ETag
     """
-    existing_billing = (
-        db.query(models.Billing).filter(models.Billing.id == billing_id).first()
+    existing_billing = await update_returning(
+        db,
+        models.Billing,
+        billing_id,
+        billing.model_dump(exclude_unset=True),
+        request,
+        "Billing record not found",
     )
-    if not existing_billing:
-        raise HTTPException(status_code=404, detail="Billing record not found")
-
-    for key, value in billing.model_dump(exclude_unset=True).items():
-        setattr(existing_billing, key, value)
-
-    db.commit()
+    await db.commit()
+    await invalidate(models.Billing, [billing_id])
+    response.headers["ETag"] = make_etag(existing_billing.version)
     return existing_billing
 
 
 @router.delete(
     "/billings/{billing_id}", tags=["billings"], status_code=status.HTTP_204_NO_CONTENT
 )
-def delete_billing(billing_id: int, db: Session = Depends(get_db)) -> None:
+async def delete_billing(billing_id: int, db: AsyncSession = Depends(get_db)) -> None:
     """
     Delete a billing record from the database.
 
@@ -118,9 +356,6 @@ def delete_billing(billing_id: int, db: Session = Depends(get_db)) -> None:
     Raises:
     - HTTPException: 404 error if the billing record is not found
     """
-    billing = db.query(models.Billing).filter(models.Billing.id == billing_id).first()
-    if not billing:
-        raise HTTPException(status_code=404, detail="Billing record not found")
-
-    db.delete(billing)
-    db.commit()
+    await delete_returning(db, models.Billing, billing_id, "Billing record not found")
+    await db.commit()
+    await invalidate(models.Billing, [billing_id])
@@ -0,0 +1,220 @@
+from os import getenv
+from typing import Iterable, List, Optional
+
+from sqlalchemy import DDL, Select, String, delete, event, false, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from . import models
+
+# Where summaries are read from: "billings" aggregates the billing rows on
+# every request, "table" reads the trigger-maintained billing_summaries table
+BILLING_SUMMARY_SOURCE = getenv("BILLING_SUMMARY_SOURCE", "billings").lower()
+
+
+class year_month(FunctionElement):
+    """
+    The "YYYY-MM" month of a timestamp.
+    """
+
+    type = String()
+    name = "year_month"
+    inherit_cache = True
+
+
+@compiles(year_month)
+def _year_month(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, 'YYYY-MM')"
+
+
+@compiles(year_month, "sqlite")
+def _year_month_sqlite(element, compiler, **kw):
+    return f"strftime('%Y-%m', {compiler.process(element.clauses, **kw)})"
+
+
+# The triggers move a billing row's amount out of the bucket of its old
+# (user, month, paid) key and into the bucket of its new one. DDL strings go
+# through %-formatting, hence the doubled percent signs.
+_SQLITE_REMOVE = """
+    UPDATE billing_summaries
+    SET count = count - 1, total = total - COALESCE(OLD.amount, 0)
+    WHERE user_id = OLD.user_id AND month = strftime('%%Y-%%m', OLD.date)
+      AND paid = COALESCE(OLD.paid, 0);
+    DELETE FROM billing_summaries
+    WHERE user_id = OLD.user_id AND month = strftime('%%Y-%%m', OLD.date)
+      AND paid = COALESCE(OLD.paid, 0) AND count = 0;
+"""
+_SQLITE_ADD = """
+    INSERT INTO billing_summaries (user_id, month, paid, count, total)
+    SELECT NEW.user_id, strftime('%%Y-%%m', NEW.date), COALESCE(NEW.paid, 0),
+           1, COALESCE(NEW.amount, 0)
+    WHERE NEW.user_id IS NOT NULL AND NEW.date IS NOT NULL
+    ON CONFLICT (user_id, month, paid) DO UPDATE
+    SET count = count + 1, total = total + excluded.total;
+"""
+SQLITE_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS billing_summaries_insert AFTER INSERT ON billings "
+    f"BEGIN {_SQLITE_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS billing_summaries_update "
+    f"AFTER UPDATE OF user_id, date, paid, amount ON billings "
+    f"BEGIN {_SQLITE_REMOVE} {_SQLITE_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS billing_summaries_delete AFTER DELETE ON billings "
+    f"BEGIN {_SQLITE_REMOVE} END",
+]
+
+POSTGRES_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION billing_summaries_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE billing_summaries
+            SET count = count - 1, total = total - COALESCE(OLD.amount, 0)
+            WHERE user_id = OLD.user_id
+              AND month = to_char(OLD.date, 'YYYY-MM')
+              AND paid = COALESCE(OLD.paid, false);
+            DELETE FROM billing_summaries
+            WHERE user_id = OLD.user_id
+              AND month = to_char(OLD.date, 'YYYY-MM')
+              AND paid = COALESCE(OLD.paid, false) AND count = 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE')
+           AND NEW.user_id IS NOT NULL AND NEW.date IS NOT NULL THEN
+            INSERT INTO billing_summaries AS s (user_id, month, paid, count, total)
+            VALUES (NEW.user_id, to_char(NEW.date, 'YYYY-MM'),
+                    COALESCE(NEW.paid, false), 1, COALESCE(NEW.amount, 0))
+            ON CONFLICT (user_id, month, paid) DO UPDATE
+            SET count = s.count + 1, total = s.total + EXCLUDED.total;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS billing_summaries_sync ON billings",
+    "CREATE TRIGGER billing_summaries_sync "
+    "AFTER INSERT OR DELETE OR UPDATE OF user_id, date, paid, amount ON billings "
+    "FOR EACH ROW EXECUTE FUNCTION billing_summaries_apply()",
+]
+
+# Both tables must exist before the triggers, so install them once the whole
+# schema has been created (bootstrapping runs again after every upgrade, hence the
+# idempotent statements)
+for statement in SQLITE_TRIGGERS:
+    event.listen(
+        models.Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="sqlite"),
+    )
+for statement in POSTGRES_TRIGGERS:
+    event.listen(
+        models.Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
+
+
+def aggregate_billings(user_ids: Optional[Iterable[int]] = None) -> Select:
+    """
+    Aggregate billing rows into (user_id, month, paid, count, total) buckets,
+    for the given users or for everyone.
+    """
+    billing = models.Billing
+    month = year_month(billing.date)
+    paid = func.coalesce(billing.paid, false())
+    if user_ids is None:
+        users = billing.user_id.is_not(None)
+    else:
+        users = billing.user_id.in_(user_ids)
+    return (
+        select(
+            billing.user_id,
+            month,
+            paid,
+            func.count(),
+            func.coalesce(func.sum(billing.amount), 0),
+        )
+        .where(users, billing.date.is_not(None))
+        .group_by(billing.user_id, month, paid)
+    )
+
+
+def read_summary_table(user_ids: Iterable[int]) -> Select:
+    """
+    Read the same buckets as `aggregate_billings` from billing_summaries.
+    """
+    summary = models.BillingSummary
+    return select(
+        summary.user_id, summary.month, summary.paid, summary.count, summary.total
+    ).where(summary.user_id.in_(user_ids))
+
+
+def _bucket(**fields) -> dict:
+    return {
+        **fields,
+        "count": 0,
+        "total": 0.0,
+        "unpaid_count": 0,
+        "unpaid_balance": 0.0,
+    }
+
+
+def fold_buckets(user_ids: List[int], rows: Iterable) -> List[dict]:
+    """
+    Fold (user_id, month, paid, count, total) buckets into one summary per
+    user, with totals and a bucket per month in chronological order.
+    """
+    summaries = {user_id: _bucket(user_id=user_id) for user_id in user_ids}
+    months = {user_id: {} for user_id in user_ids}
+    for user_id, month, paid, count, total in rows:
+        bucket = months[user_id].get(month)
+        if bucket is None:
+            bucket = months[user_id][month] = _bucket(month=month)
+        for target in (summaries[user_id], bucket):
+            target["count"] += count
+            target["total"] += float(total)
+            if not paid:
+                target["unpaid_count"] += count
+                target["unpaid_balance"] += float(total)
+
+    for user_id, summary in summaries.items():
+        summary["months"] = [
+            months[user_id][month] for month in sorted(months[user_id])
+        ]
+        for target in (summary, *summary["months"]):
+            target["total"] = round(target["total"], 2)
+            target["unpaid_balance"] = round(target["unpaid_balance"], 2)
+    return list(summaries.values())
+
+
+async def summarize_billings(db: AsyncSession, user_ids: List[int]) -> List[dict]:
+    """
+    Compute the billing summaries of several users with a single query.
+
+    Args:
+        db (AsyncSession): The database session.
+        user_ids (List[int]): The users to summarize, without duplicates.
+
+    Returns:
+        List[dict]: A BillingSummary payload per user, in the given order.
+    """
+    if BILLING_SUMMARY_SOURCE == "table":
+        statement = read_summary_table(user_ids)
+    else:
+        statement = aggregate_billings(user_ids)
+    return fold_buckets(user_ids, await db.execute(statement))
+
+
+async def rebuild_billing_summaries(db: AsyncSession) -> None:
+    """
+    Recompute the billing_summaries table from the billing rows, e.g. after
+    enabling it on an existing database or loading billings with the
+    triggers disabled.
+    """
+    summary = models.BillingSummary
+    await db.execute(delete(summary))
+    await db.execute(
+        insert(summary).from_select(
+            ["user_id", "month", "paid", "count", "total"], aggregate_billings()
+        )
+    )
+    await db.commit()
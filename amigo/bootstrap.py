@@ -0,0 +1,32 @@
+"""
+Create the database schema: the tables, their indexes and constraints, the
+triggers maintaining billing_summaries, the change feed and the full-text
+search indexes.
+
+Run it once per database before starting the app, and again after upgrading
+to create any new tables; existing tables are left as they are:
+
+    python -m amigo.bootstrap
+"""
+
+import asyncio
+
+# The scheduling, billing summary, change feed and search modules attach DDL
+# to the metadata
+from . import billing_summary, changes, scheduling, search  # noqa: F401
+from .database import create_tables, dispose_engine
+from .models import Base
+
+
+async def bootstrap() -> None:
+    """
+    Create any missing part of the schema on the configured database.
+    """
+    try:
+        await create_tables(Base.metadata)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(bootstrap())
@@ -0,0 +1,214 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .cache import invalidate
+from .conditional import rejecting_stale_writes
+
+ValidItems = List[Tuple[int, BaseModel]]
+# Extra per-model checks run on the valid items before writing them
+BulkCheck = Callable[
+    [AsyncSession, ValidItems], Awaitable[Tuple[ValidItems, List[dict]]]
+]
+
+
+def validate_items(
+    items: List[Dict[str, Any]], schema: Type[BaseModel]
+) -> Tuple[ValidItems, List[dict]]:
+    """
+    Validate every item of a bulk request against `schema` in a single pass.
+
+    Args:
+        items (List[Dict[str, Any]]): The raw items sent by the client.
+        schema (Type[BaseModel]): The schema each item must satisfy.
+
+    Returns:
+        Tuple[ValidItems, List[dict]]: The (index, item) pairs that passed
+        validation, and an error result for each item that did not.
+    """
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as exc:
+            errors.append(
+                {
+                    "index": index,
+                    "status": "error",
+                    "detail": exc.errors(include_url=False, include_context=False),
+                }
+            )
+    return valid, errors
+
+
+def reject_duplicate_ids(valid: ValidItems) -> Tuple[ValidItems, List[dict]]:
+    """
+    Split out the items updating a row that an earlier item of the batch
+    already updates, since one row cannot take two versions in one write.
+    """
+    seen = set()
+    unique, errors = [], []
+    for index, item in valid:
+        if item.id in seen:
+            errors.append(
+                {"index": index, "status": "error", "detail": "Duplicate id in batch"}
+            )
+        else:
+            seen.add(item.id)
+            unique.append((index, item))
+    return unique, errors
+
+
+async def check_users_exist(
+    db: AsyncSession, valid: ValidItems
+) -> Tuple[ValidItems, List[dict]]:
+    """
+    Split out the items whose `user_id` does not exist, with one query for the
+    whole batch, so a single bad reference cannot fail the INSERT.
+    """
+    user_ids = {item.user_id for _, item in valid}
+    existing = set(
+        await db.scalars(select(models.User.id).where(models.User.id.in_(user_ids)))
+    )
+    missing = [
+        {"index": index, "status": "error", "detail": "User not found"}
+        for index, item in valid
+        if item.user_id not in existing
+    ]
+    return [(i, item) for i, item in valid if item.user_id in existing], missing
+
+
+def bulk_response(succeeded: ValidItems, results: List[dict], atomic: bool) -> dict:
+    """
+    Order the per-item results, or reject the whole batch in atomic mode.
+
+    Raises:
+        HTTPException: 422 error listing the failures if the request is atomic
+        and any item failed.
+    """
+    failed = [result for result in results if result["status"] == "error"]
+    if failed and atomic:
+        raise HTTPException(
+            status_code=422, detail=sorted(failed, key=lambda r: r["index"])
+        )
+    return {
+        "succeeded": len(succeeded),
+        "failed": len(failed),
+        "results": sorted(results, key=lambda r: r["index"]),
+    }
+
+
+async def bulk_create(
+    db: AsyncSession,
+    model: Type[models.Base],
+    schema: Type[BaseModel],
+    request: schemas.BulkRequest,
+    check: Optional[BulkCheck] = None,
+) -> dict:
+    """
+    Validate and insert a batch of rows in one transaction.
+
+    The rows are written with multi-row INSERT ... RETURNING statements, so
+    the whole batch costs a handful of round-trips instead of two per row.
+
+    Args:
+        db (AsyncSession): The database session.
+        model (Type[models.Base]): The model to insert.
+        schema (Type[BaseModel]): The create schema of the model.
+        request (schemas.BulkRequest): The items and the failure mode.
+        check (Optional[BulkCheck]): Extra checks for the model, if any.
+
+    Returns:
+        dict: A BulkResponse payload with one result per item.
+    """
+    valid, results = validate_items(request.items, schema)
+    valid, missing = await check_users_exist(db, valid)
+    results += missing
+    if check is not None:
+        valid, rejected = await check(db, valid)
+        results += rejected
+    if results and request.atomic:
+        return bulk_response([], results, atomic=True)
+
+    if valid:
+        ids = await db.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [item.model_dump() for _, item in valid],
+        )
+        await db.commit()
+        results += [
+            {"index": index, "status": "created", "id": row_id}
+            for (index, _), row_id in zip(valid, ids)
+        ]
+    return bulk_response(valid, results, request.atomic)
+
+
+async def bulk_update(
+    db: AsyncSession,
+    model: Type[models.Base],
+    schema: Type[BaseModel],
+    request: schemas.BulkRequest,
+    check: Optional[BulkCheck] = None,
+) -> dict:
+    """
+    Validate and apply a batch of updates by primary key in one transaction.
+
+    Args:
+        db (AsyncSession): The database session.
+        model (Type[models.Base]): The model to update.
+        schema (Type[BaseModel]): The bulk update schema, including `id`.
+        request (schemas.BulkRequest): The items and the failure mode.
+        check (Optional[BulkCheck]): Extra checks for the model, if any.
+
+    Returns:
+        dict: A BulkResponse payload with one result per item.
+    """
+    valid, results = validate_items(request.items, schema)
+    valid, duplicates = reject_duplicate_ids(valid)
+    results += duplicates
+    if "user_id" in schema.model_fields:
+        valid, missing = await check_users_exist(db, valid)
+        results += missing
+
+    ids = {item.id for _, item in valid}
+    # Versioned rows are updated with WHERE version = ..., so read them too
+    existing = dict(
+        (await db.execute(select(model.id, model.version).where(model.id.in_(ids))))
+        .tuples()
+        .all()
+    )
+    results += [
+        {"index": index, "status": "error", "detail": "Not found"}
+        for index, item in valid
+        if item.id not in existing
+    ]
+    valid = [(index, item) for index, item in valid if item.id in existing]
+    if check is not None:
+        valid, rejected = await check(db, valid)
+        results += rejected
+    if results and request.atomic:
+        return bulk_response([], results, atomic=True)
+
+    if valid:
+        async with rejecting_stale_writes(db):
+            await db.execute(
+                update(model),
+                [
+                    {
+                        **item.model_dump(exclude_unset=True),
+                        "version": existing[item.id],
+                    }
+                    for _, item in valid
+                ],
+            )
+            await db.commit()
+        await invalidate(model, [item.id for _, item in valid])
+        results += [
+            {"index": index, "status": "updated", "id": item.id}
+            for index, item in valid
+        ]
+    return bulk_response(valid, results, request.atomic)
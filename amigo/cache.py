@@ -0,0 +1,218 @@
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Awaitable, Callable, Iterable, Optional, Tuple, Type
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from .conditional import not_modified
+from .replicas import reads_from_replica, wrote_recently
+
+# "memory" (per process), "redis" (shared between workers) or "none"
+CACHE_BACKEND = getenv("CACHE_BACKEND", "memory").lower()
+CACHE_TTL = int(getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(getenv("CACHE_MAX_ENTRIES", "10000"))
+REDIS_URL = getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class CacheStats:
+    """
+    Hit, miss and eviction counters of a cache backend.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class NullCache:
+    """
+    Cache backend that stores nothing, for running without a cache.
+    """
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, value: bytes) -> None:
+        pass
+
+    async def delete(self, *keys: str) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCache:
+    """
+    In-process cache with a TTL per entry and LRU eviction beyond
+    `max_entries`.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.stats.evictions += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    async def close(self) -> None:
+        self._entries.clear()
+
+
+class RedisCache:
+    """
+    Cache backend shared between workers, speaking to any client with the
+    `redis.asyncio.Redis` get/set/delete interface.
+
+    Evictions happen on the Redis server and are reported by its INFO stats,
+    not by these counters.
+    """
+
+    def __init__(self, client, ttl: float, prefix: str = "amigo:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self.client.set(self.prefix + key, value, ex=int(self.ttl))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            removed = await self.client.delete(*(self.prefix + key for key in keys))
+            self.stats.invalidations += removed or 0
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_cache():
+    """
+    Build the cache backend selected by CACHE_BACKEND.
+    """
+    if CACHE_BACKEND == "none":
+        return NullCache()
+    if CACHE_BACKEND == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+        return RedisCache(redis.Redis.from_url(REDIS_URL), CACHE_TTL)
+    return MemoryCache(CACHE_TTL, CACHE_MAX_ENTRIES)
+
+
+cache = create_cache()
+
+
+def cache_key(model, ident) -> str:
+    """
+    Key under which the serialized `model` row with primary key `ident` is
+    cached, e.g. "users:1".
+    """
+    return f"{model.__tablename__}:{ident}"
+
+
+async def invalidate(model, idents: Iterable) -> None:
+    """
+    Drop the cached payloads of the given rows after they changed.
+    """
+    await cache.delete(*(cache_key(model, ident) for ident in idents))
+
+
+def serialize(schema: Type[BaseModel], obj) -> bytes:
+    """
+    Serialize an ORM object to the JSON body of its response schema.
+    """
+    return schema.model_validate(obj, from_attributes=True).model_dump_json().encode()
+
+
+async def read_through(
+    request: Request, key: str, load: Callable[[], Awaitable[Tuple[str, bytes]]]
+) -> Response:
+    """
+    Answer from the cache, or call `load` and cache its payload.
+
+    The ETag is cached along with the payload, so a conditional GET for an
+    unchanged resource is answered with 304 without touching the database.
+
+    Args:
+        request (Request): The incoming request, for If-None-Match.
+        key (str): The cache key of the resource.
+        load (Callable[[], Awaitable[Tuple[str, bytes]]]): Loads the resource
+            and returns its ETag and serialized payload; may raise
+            HTTPException, in which case nothing is cached.
+
+    Returns:
+        Response: The JSON response for the resource, or 304 Not Modified.
+    """
+    # A client pinned to the primary must not get an entry cached from a
+    # lagging replica, and replica reads are never cached: the write's
+    # invalidation may have happened before the replica caught up
+    entry = None if wrote_recently(request) else await cache.get(key)
+    if entry is None:
+        etag, payload = await load()
+        if not reads_from_replica(request):
+            await cache.set(key, etag.encode() + b"\n" + payload)
+    else:
+        etag_bytes, _, payload = entry.partition(b"\n")
+        etag = etag_bytes.decode()
+    response = not_modified(request, etag)
+    if response is None:
+        response = Response(
+            payload, media_type="application/json", headers={"ETag": etag}
+        )
+    return response
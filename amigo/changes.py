@@ -0,0 +1,211 @@
+import heapq
+from datetime import timedelta
+from os import getenv
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import Response
+from sqlalchemy import DDL, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .database import get_engine
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    plain_columns,
+)
+from .replicas import get_read_db
+from .serialization import json_response
+
+# On Postgres, changes younger than this are held back from the feed: the
+# sequence hands out numbers as rows are written, not as they commit, so a
+# transaction still open could commit a change numbered below a token already
+# returned. Write transactions are expected to commit well within it.
+CHANGE_FEED_SETTLE_SECONDS = float(getenv("CHANGE_FEED_SETTLE_SECONDS", "2"))
+
+# The tables of the change feed, with the schema their rows are sent as
+SYNCED = {
+    models.User: schemas.User,
+    models.Appointment: schemas.Appointment,
+    models.Billing: schemas.Billing,
+}
+
+router = APIRouter()
+
+# Triggers number every inserted and updated row of the synced tables from a
+# shared counter, and record deleted rows in tombstones, so no write path can
+# bypass the feed, bulk and worker writes included. On Postgres the counter is
+# a sequence; SQLite, which has none, keeps it in a one-row table and relies
+# on writes being serialized. The statements are idempotent so they also
+# upgrade existing databases. DDL strings go through %-formatting, hence the
+# doubled percent signs.
+_SQLITE_NOW = "strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now') || '000'"
+_SQLITE_NEXT = "UPDATE change_counter SET seq = seq + 1;"
+_SQLITE_SEQ = "(SELECT seq FROM change_counter)"
+
+SQLITE_TRIGGERS = [
+    "CREATE TABLE IF NOT EXISTS change_counter "
+    "(id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO change_counter (id, seq) VALUES (1, 0)",
+]
+POSTGRES_TRIGGERS = [
+    "CREATE SEQUENCE IF NOT EXISTS change_seq",
+    """
+    CREATE OR REPLACE FUNCTION changes_track() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_seq := nextval('change_seq');
+        NEW.updated_at := timezone('UTC', clock_timestamp());
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION changes_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO tombstones (change_seq, table_name, row_id, deleted_at)
+        VALUES (nextval('change_seq'), TG_TABLE_NAME, OLD.id,
+                timezone('UTC', clock_timestamp()));
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+]
+for _model in SYNCED:
+    _table = _model.__tablename__
+    # The trigger's own UPDATE only sets these two, so it does not fire again
+    _tracked = ", ".join(
+        column.name
+        for column in _model.__table__.columns
+        if column.name not in ("change_seq", "updated_at")
+    )
+    _touch = (
+        f"{_SQLITE_NEXT} UPDATE {_table} SET change_seq = {_SQLITE_SEQ}, "
+        f"updated_at = {_SQLITE_NOW} WHERE id = NEW.id;"
+    )
+    SQLITE_TRIGGERS += [
+        f"CREATE TRIGGER IF NOT EXISTS {_table}_changes_insert "
+        f"AFTER INSERT ON {_table} BEGIN {_touch} END",
+        f"CREATE TRIGGER IF NOT EXISTS {_table}_changes_update "
+        f"AFTER UPDATE OF {_tracked} ON {_table} BEGIN {_touch} END",
+        f"CREATE TRIGGER IF NOT EXISTS {_table}_changes_delete "
+        f"AFTER DELETE ON {_table} BEGIN {_SQLITE_NEXT} "
+        f"INSERT INTO tombstones (change_seq, table_name, row_id, deleted_at) "
+        f"VALUES ({_SQLITE_SEQ}, '{_table}', OLD.id, {_SQLITE_NOW}); END",
+    ]
+    POSTGRES_TRIGGERS += [
+        f"ALTER TABLE {_table} ADD COLUMN IF NOT EXISTS updated_at timestamp",
+        f"ALTER TABLE {_table} ADD COLUMN IF NOT EXISTS change_seq bigint",
+        f"CREATE INDEX IF NOT EXISTS ix_{_table}_change_seq "
+        f"ON {_table} (change_seq)",
+        f"DROP TRIGGER IF EXISTS {_table}_changes ON {_table}",
+        f"CREATE TRIGGER {_table}_changes BEFORE INSERT OR UPDATE ON {_table} "
+        f"FOR EACH ROW EXECUTE FUNCTION changes_track()",
+        f"DROP TRIGGER IF EXISTS {_table}_changes_delete ON {_table}",
+        f"CREATE TRIGGER {_table}_changes_delete AFTER DELETE ON {_table} "
+        f"FOR EACH ROW EXECUTE FUNCTION changes_tombstone()",
+        # Number the rows written before the triggers existed
+        f"UPDATE {_table} SET change_seq = NULL WHERE change_seq IS NULL",
+    ]
+
+for statement in SQLITE_TRIGGERS:
+    event.listen(
+        models.Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="sqlite"),
+    )
+for statement in POSTGRES_TRIGGERS:
+    event.listen(
+        models.Base.metadata,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
+
+
+def _change(model, row: dict) -> dict:
+    if model is models.Tombstone:
+        return {
+            "table": row["table_name"],
+            "id": row["row_id"],
+            "seq": row["change_seq"],
+            "updated_at": row["deleted_at"],
+            "deleted": True,
+        }
+    return {
+        "table": model.__tablename__,
+        "id": row["id"],
+        "seq": row["change_seq"],
+        "updated_at": row["updated_at"],
+        "data": SYNCED[model].model_validate(row),
+    }
+
+
+async def read_changes(db: AsyncSession, since: int, limit: int) -> dict:
+    """
+    Read the changes numbered after `since`, in order.
+
+    Each synced table and the tombstones are read with an index range scan on
+    change_seq of at most `limit + 1` rows, and the results are merged, so a
+    batch costs the same however large the tables are.
+
+    Args:
+        db (AsyncSession): The database session.
+        since (int): The last change the client has.
+        limit (int): The maximum number of changes to return.
+
+    Returns:
+        dict: A ChangeFeed payload.
+    """
+    cutoff = None
+    if get_engine().dialect.name == "postgresql" and CHANGE_FEED_SETTLE_SECONDS:
+        cutoff = func.timezone("UTC", func.clock_timestamp()) - timedelta(
+            seconds=CHANGE_FEED_SETTLE_SECONDS
+        )
+    batches = []
+    for model in (*SYNCED, models.Tombstone):
+        keys, columns = plain_columns(model)
+        statement = select(*columns).where(model.change_seq > since)
+        if cutoff is not None:
+            if model is models.Tombstone:
+                statement = statement.where(model.deleted_at < cutoff)
+            else:
+                statement = statement.where(model.updated_at < cutoff)
+        result = await db.execute(statement.order_by(model.change_seq).limit(limit + 1))
+        batches.append([_change(model, dict(zip(keys, row))) for row in result])
+    changes = list(heapq.merge(*batches, key=lambda change: change["seq"]))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    last = changes[-1]["seq"] if changes else since
+    return {
+        "changes": changes,
+        "next_token": encode_cursor(last, "changes"),
+        "has_more": has_more,
+    }
+
+
+@router.get("/changes", tags=["changes"], response_model=schemas.ChangeFeed)
+async def get_changes(
+    since: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Retrieve the users, appointments and billings written or deleted since a
+    token, oldest change first.
+
+    A row changed several times is listed once, at its latest change; a
+    deleted row is listed with `deleted` set and no data. Start without
+    `since` to read every row, then keep the `next_token` of each batch and
+    send it back as `since`, at once while `has_more` is set.
+
+    Parameters:
+    - since: The next_token of the previous batch
+
+    Raises:
+    - HTTPException: 400 error if the token is malformed
+    """
+    start = 0 if since is None else decode_cursor(since, "changes")
+    page = await read_changes(db, start, limit)
+    return json_response(schemas.ChangeFeed, page)
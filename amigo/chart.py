@@ -0,0 +1,78 @@
+from typing import List, Literal
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload, selectinload
+
+from . import models, schemas
+
+DEFAULT_CHART_LIMIT = 20
+MAX_CHART_LIMIT = 100
+
+ChartSection = Literal["appointments", "billings", "medical_records", "notes"]
+
+# The relationships a chart can include, with the column pointing at the user
+CHART_SECTIONS = {
+    "appointments": (models.User.appointments, models.Appointment.user_id),
+    "billings": (models.User.billings, models.Billing.user_id),
+    "medical_records": (models.User.medical_records, models.MedicalRecord.user_id),
+    "notes": (models.User.notes, models.Note.author_id),
+}
+
+
+def load_newest(relationship, column, user_id: int, limit: int):
+    """
+    Eagerly load the `limit` newest rows of a relationship, with one SELECT
+    for the whole collection whatever its size.
+    """
+    target = relationship.property.mapper.class_
+    newest = (
+        select(target.id)
+        .where(column == user_id)
+        .order_by(target.id.desc())
+        .limit(limit)
+    )
+    return selectinload(relationship.and_(target.id.in_(newest)))
+
+
+async def load_chart(
+    db: AsyncSession, user_id: int, include: List[ChartSection], limit: int
+) -> dict:
+    """
+    Load a user with the newest rows of the requested relationships.
+
+    Costs one query for the user plus one per included relationship; the
+    others are never loaded.
+
+    Args:
+        db (AsyncSession): The database session.
+        user_id (int): The user to chart.
+        include (List[ChartSection]): The relationships to include.
+        limit (int): The maximum number of rows per relationship.
+
+    Returns:
+        dict: A UserChart payload, newest rows first, each section telling
+        whether older rows were left out.
+
+    Raises:
+        HTTPException: 404 error if the user is not found.
+    """
+    options = [
+        # One more row than returned tells whether the slice is complete
+        load_newest(relationship, column, user_id, limit + 1)
+        if name in include
+        else noload(relationship)
+        for name, (relationship, column) in CHART_SECTIONS.items()
+    ]
+    user = await db.scalar(
+        select(models.User).where(models.User.id == user_id).options(*options)
+    )
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    chart = schemas.User.model_validate(user, from_attributes=True).model_dump()
+    for name in dict.fromkeys(include):
+        rows = sorted(getattr(user, name), key=lambda row: row.id, reverse=True)
+        chart[name] = {"items": rows[:limit], "has_more": len(rows) > limit}
+    return chart
@@ -0,0 +1,154 @@
+import zlib
+from os import getenv
+from typing import Mapping, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_BYTES = int(getenv("COMPRESSION_MIN_BYTES", "1024"))
+# Fast levels: dynamic responses are compressed on every request
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/",
+)
+
+
+def accepts_encoding(headers: Mapping[str, str], encoding: str) -> bool:
+    """
+    Whether the Accept-Encoding request header allows a body in `encoding`.
+    """
+    for item in headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in (encoding, "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+def negotiate(headers: Mapping[str, str]) -> Optional[str]:
+    """
+    The content coding to compress a response with, brotli first.
+    """
+    if brotli is not None and accepts_encoding(headers, "br"):
+        return "br"
+    if accepts_encoding(headers, "gzip"):
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    """
+    Incremental gzip or brotli compression of a response body.
+    """
+
+    def __init__(self, encoding: str):
+        self.brotli = encoding == "br"
+        if self.brotli:
+            self._stream = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """
+        Compress part of a streamed body and flush it, so the client gets
+        every chunk as soon as it is produced.
+        """
+        if self.brotli:
+            return self._stream.process(data) + self._stream.flush()
+        return self._stream.compress(data) + self._stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.brotli:
+            return self._stream.process(data) + self._stream.finish()
+        return self._stream.compress(data) + self._stream.flush()
+
+
+def _compressible(start: dict, headers: MutableHeaders) -> bool:
+    return (
+        start["status"] not in (204, 206, 304)
+        and "content-encoding" not in headers
+        and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON and text responses with brotli (when the brotli package is
+    installed) or gzip, as negotiated with Accept-Encoding.
+
+    Responses below COMPRESSION_MIN_BYTES, and bodies that already carry a
+    Content-Encoding, such as stored gzip documents, are sent as they are.
+    Streamed responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            encoding = negotiate(Headers(scope=scope))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder: Optional[_Encoder] = None
+
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows the size
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is None:
+                # A later chunk, once the response was started
+                if encoder is not None:
+                    body = encoder.chunk(body) if more_body else encoder.finish(body)
+                    message = {**message, "body": body}
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start)
+            if not _compressible(start, headers) or (
+                not more_body and len(body) < self.minimum_size
+            ):
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            encoder = _Encoder(encoding)
+            headers["Content-Encoding"] = encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                # The compressed bytes differ from the identity body
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                del headers["Content-Length"]
+                message = {**message, "body": encoder.chunk(body)}
+            else:
+                body = encoder.finish(body)
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
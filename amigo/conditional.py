@@ -0,0 +1,73 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+
+
+def make_etag(version: int) -> str:
+    """
+    Strong ETag of a row, derived from its version counter.
+    """
+    return f'"{version}"'
+
+
+def _etags(header: str) -> set:
+    # Weak and strong validators compare equal for our purposes
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    Answer a conditional GET whose If-None-Match lists the current ETag.
+
+    Returns:
+        Optional[Response]: An empty 304 response, or None if the client's
+        copy is missing or stale.
+    """
+    header = request.headers.get("if-none-match")
+    if header is not None and (header.strip() == "*" or etag in _etags(header)):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def if_match_versions(request: Request) -> Optional[List[int]]:
+    """
+    The row versions an update is conditional on, from its If-Match header.
+
+    Returns:
+        Optional[List[int]]: The versions listed, or None if the update is
+        unconditional (no header, or "*"). Tags that are not ours match
+        nothing.
+    """
+    header = request.headers.get("if-match")
+    if header is None or header.strip() == "*":
+        return None
+    tags = (tag.strip('"') for tag in _etags(header))
+    return [int(tag) for tag in tags if tag.isdigit()]
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(
+        status_code=412, detail="Resource was modified by another request"
+    )
+
+
+@asynccontextmanager
+async def rejecting_stale_writes(db: AsyncSession) -> AsyncIterator[None]:
+    """
+    Turn a concurrent modification of a versioned row, detected by the
+    writes or the commit made inside the block, into a 412 error.
+
+    Versioned rows are updated with `WHERE version = <version read>`, so a
+    write racing between our read and our update matches no row; SQLAlchemy
+    raises as soon as it sees the row count, which for executemany updates
+    is at execution rather than at commit.
+    """
+    try:
+        yield
+    except StaleDataError:
+        await db.rollback()
+        raise precondition_failed()
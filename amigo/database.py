@@ -1,38 +1,295 @@
+from functools import partial
 from os import getenv
+from typing import List
 
-from dotenv import load_dotenv
-from sqlalchemy import URL, create_engine
+from sqlalchemy import URL, create_engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from starlette.concurrency import run_in_threadpool
 
-# Load environment variables
-load_dotenv()
+from .metrics import instrument_statements
+from .pooling import PoolMetrics, engine_options, instrument_engine
+from .profiling import instrument_profiling
 
 PGUSER = getenv("PGUSER")
 PGPASSWORD = getenv("PGPASSWORD")
 PGHOST = getenv("PGHOST")
 PGDATABASE = getenv("PGDATABASE")
 
-connection_string = URL.create(
-    "postgresql",
-    username=PGUSER,
-    password=PGPASSWORD,
-    host=PGHOST,
-    database=PGDATABASE,
-    query={"sslmode": "require"},
-)
+# Overrides the PG* settings, e.g. "sqlite:///./amigo.db" for local runs
+DATABASE_URL = getenv("DATABASE_URL")
 
-engine = create_engine(connection_string)
+# Serve requests through an asyncio driver instead of the blocking one
+DB_ASYNC = getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Comma-separated URLs of read replicas of the primary, which serve GET requests
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_connection_url(async_mode: bool = DB_ASYNC) -> URL:
+    """
+    Build the database URL from the environment.
+
+    Args:
+        async_mode (bool): Whether to use the asyncio driver for the backend.
+
+    Returns:
+        URL: The connection URL for the configured database.
+    """
+    if DATABASE_URL:
+        url = make_url(DATABASE_URL)
+    else:
+        url = URL.create(
+            "postgresql",
+            username=PGUSER,
+            password=PGPASSWORD,
+            host=PGHOST,
+            database=PGDATABASE,
+            query={"sslmode": "require"},
+        )
+    return _with_driver(url, async_mode)
+
+
+def get_replica_urls(async_mode: bool = DB_ASYNC) -> List[URL]:
+    """
+    The connection URLs of the read replicas, with the same driver as the
+    primary.
+    """
+    return [_with_driver(make_url(url), async_mode) for url in DATABASE_REPLICA_URLS]
+
+
+def _with_driver(url: URL, async_mode: bool) -> URL:
+    if async_mode:
+        url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+        if "sslmode" in url.query:
+            # asyncpg takes "ssl" rather than libpq's "sslmode"
+            url = url.difference_update_query(["sslmode"]).update_query_dict(
+                {"ssl": url.query["sslmode"]}
+            )
+    return url
+
+
+def build_engine(url: URL, metrics: PoolMetrics):
+    """
+    Create an instrumented engine for `url` with the configured driver.
+
+    Args:
+        url (URL): The connection URL.
+        metrics (PoolMetrics): Where the engine's pool reports its usage.
+
+    Returns:
+        An `AsyncEngine`, or an `Engine` in blocking mode.
+    """
+    options = engine_options(url, DB_ASYNC, metrics)
+    if DB_ASYNC:
+        new_engine = create_async_engine(url, **options)
+        sync_engine = new_engine.sync_engine
+    else:
+        new_engine = sync_engine = create_engine(url, **options)
+    instrument_engine(sync_engine, metrics)
+    instrument_statements(sync_engine)
+    instrument_profiling(sync_engine)
+    return new_engine
+
+
+pool_metrics = PoolMetrics()
+
+# Built on first use by `get_engine`, so importing the app opens nothing
+engine = None
+SessionLocal = None
+
+
+def get_engine():
+    """
+    Return the engine, creating it and the session factory on first use.
+
+    Returns:
+        An `AsyncEngine`, or an `Engine` in blocking mode.
+    """
+    global engine, SessionLocal
+    if engine is not None:
+        return engine
+
+    engine = build_engine(get_connection_url(), pool_metrics)
+    if DB_ASYNC:
+        SessionLocal = async_sessionmaker(
+            bind=engine, autoflush=False, expire_on_commit=False
+        )
+    else:
+        SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+        )
+    return engine
+
+
+def get_pool_status() -> dict:
+    """
+    Report the live state and event counters of the engine's pool.
+    """
+    return pool_metrics.snapshot(get_engine().pool)
+
+
+class ThreadedSession:
+    """
+    Awaitable facade over a blocking Session.
+
+    Implements the subset of `AsyncSession` used by the routers, running each
+    database call in Starlette's threadpool, so the same `async def` handlers
+    serve both the blocking and the asyncio drivers.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, execution_options=None, **kw):
+        # Buffer the rows in the worker thread, as AsyncSession does
+        options = {"prebuffer_rows": True, **(execution_options or {})}
+        return await run_in_threadpool(
+            partial(
+                self.sync_session.execute,
+                statement,
+                params,
+                execution_options=options,
+                **kw,
+            )
+        )
+
+    async def stream(self, statement, params=None, execution_options=None, **kw):
+        options = {"stream_results": True, **(execution_options or {})}
+        result = await run_in_threadpool(
+            partial(
+                self.sync_session.execute,
+                statement,
+                params,
+                execution_options=options,
+                **kw,
+            )
+        )
+        return ThreadedStreamResult(result)
+
+    async def scalar(self, statement, params=None, **kw):
+        result = await self.execute(statement, params, **kw)
+        return result.scalar()
+
+    async def scalars(self, statement, params=None, **kw):
+        result = await self.execute(statement, params, **kw)
+        return result.scalars()
+
+    async def connection(self, **kw):
+        return await run_in_threadpool(partial(self.sync_session.connection, **kw))
+
+    async def get(self, entity, ident, **kw):
+        return await run_in_threadpool(
+            partial(self.sync_session.get, entity, ident, **kw)
+        )
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def refresh(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+class ThreadedStreamResult:
+    """
+    Awaitable facade over a streaming Result, fetching each partition of rows
+    in the threadpool like `AsyncResult.partitions`.
+    """
+
+    def __init__(self, result):
+        self._result = result
+
+    async def partitions(self, size=None):
+        partitions = self._result.partitions(size)
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                return
+            yield partition
+
+
+def new_session(bind=None):
+    """
+    Open a session for the configured driver.
+
+    Args:
+        bind: The engine to use instead of the primary's, e.g. a replica's,
+            or the `bind` of another session to read from the same database.
+
+    Returns:
+        An `AsyncSession`, or a `ThreadedSession` in blocking mode.
+    """
+    get_engine()
+    options = {} if bind is None else {"bind": bind}
+    if DB_ASYNC:
+        return SessionLocal(**options)
+    return ThreadedSession(SessionLocal(**options))
+
+
+async def create_tables(metadata) -> None:
+    """
+    Create any missing tables of `metadata` on the configured engine.
+    """
+    engine = get_engine()
+    if DB_ASYNC:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+    else:
+        await run_in_threadpool(partial(metadata.create_all, bind=engine))
+
+
+async def dispose_engine() -> None:
+    """
+    Close the pooled connections, e.g. on shutdown. The engine stays usable
+    and reconnects on its next checkout.
+    """
+    if engine is None:
+        return
+    if DB_ASYNC:
+        await engine.dispose()
+    else:
+        await run_in_threadpool(engine.dispose)
 
 
 # Dependency to get the database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with new_session() as db:
         yield db
-    finally:
-        db.close()
 
 
 Base = declarative_base()
@@ -0,0 +1,398 @@
+import codecs
+import zlib
+from os import getenv
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .compression import accepts_encoding
+from .conditional import make_etag, not_modified
+from .database import new_session
+from .pagination import paginate
+from .search import index_text, search
+from .serialization import json_response
+from .writes import delete_returning, insert_returning, update_returning
+
+# Compression of newly written bodies: "gzip", "zstd" (needs the zstandard
+# package) or "identity". Each row records its own, so changing it is safe.
+DOCUMENT_COMPRESSION = getenv("DOCUMENT_COMPRESSION", "gzip").lower()
+# Largest accepted body, uncompressed
+MAX_DOCUMENT_BYTES = int(getenv("MAX_DOCUMENT_BYTES", str(64 * 1024 * 1024)))
+# Compressed bytes read from the database per chunk of a streamed body
+DOCUMENT_CHUNK_SIZE = 256 * 1024
+# Bodies larger than this are compressed in the threadpool
+INLINE_COMPRESSION_LIMIT = 64 * 1024
+# Leading text of a body kept for the search index; Postgres caps a tsvector
+# at 1 MB
+SEARCH_TEXT_BYTES = 256 * 1024
+
+TEXT_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    decompress = compress
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def compressor(encoding: str):
+    """
+    Incremental compressor for `encoding`, with `compress` and `flush`.
+    """
+    if encoding == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compressobj()
+    return _Identity()
+
+
+def decompressor(encoding: str):
+    """
+    Incremental decompressor for `encoding`, with `decompress` and `flush`.
+    """
+    if encoding == "gzip":
+        return zlib.decompressobj(31)
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj()
+    return _Identity()
+
+
+def storage_encoding() -> str:
+    """
+    The encoding new bodies are stored with.
+    """
+    if DOCUMENT_COMPRESSION == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise RuntimeError(
+                "DOCUMENT_COMPRESSION=zstd requires the zstandard package"
+            )
+    if DOCUMENT_COMPRESSION not in ("gzip", "zstd"):
+        return "identity"
+    return DOCUMENT_COMPRESSION
+
+
+class StoredText(NamedTuple):
+    data: bytes
+    encoding: str
+    # Size of the uncompressed text in bytes
+    size: int
+    # The first SEARCH_TEXT_BYTES of the text, for the search index
+    head: str
+
+
+def _head(data: bytes) -> str:
+    # A multi-byte character cut at the limit is dropped
+    return data[:SEARCH_TEXT_BYTES].decode(errors="ignore")
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413, detail=f"Body exceeds {MAX_DOCUMENT_BYTES} bytes"
+    )
+
+
+def _compress(text: str, encoding: str) -> bytes:
+    stream = compressor(encoding)
+    return stream.compress(text.encode()) + stream.flush()
+
+
+async def compress_text(text: str) -> StoredText:
+    """
+    Compress a body received whole, e.g. in a JSON payload.
+    """
+    raw = text.encode()
+    size = len(raw)
+    if size > MAX_DOCUMENT_BYTES:
+        raise _too_large()
+    encoding = storage_encoding()
+    if size > INLINE_COMPRESSION_LIMIT:
+        data = await run_in_threadpool(_compress, text, encoding)
+    else:
+        data = _compress(text, encoding)
+    return StoredText(data, encoding, size, _head(raw))
+
+
+async def compress_upload(request: Request) -> StoredText:
+    """
+    Compress a UTF-8 request body chunk by chunk as it is received.
+
+    Only the compressed bytes and the head kept for the search index are
+    held in memory, never the whole text.
+
+    Raises:
+        HTTPException: 400 error if the body is not UTF-8, or 413 error if it
+        exceeds MAX_DOCUMENT_BYTES.
+    """
+    encoding = storage_encoding()
+    stream = compressor(encoding)
+    validator = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    head = bytearray()
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_DOCUMENT_BYTES:
+                raise _too_large()
+            validator.decode(chunk)
+            parts.append(stream.compress(chunk))
+            if len(head) < SEARCH_TEXT_BYTES:
+                head += chunk[: SEARCH_TEXT_BYTES - len(head)]
+        validator.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8 text")
+    parts.append(stream.flush())
+    return StoredText(b"".join(parts), encoding, size, _head(bytes(head)))
+
+
+async def _stored_chunks(
+    bind, model, column, ident: int, version: int, length: int
+) -> AsyncIterator[bytes]:
+    # The request's session is closed before the body is streamed, so the
+    # stream holds its own on the same database; each chunk is read only if
+    # the row is still at the version the response started with
+    async with new_session(bind) as db:
+        for offset in range(1, length + 1, DOCUMENT_CHUNK_SIZE):
+            chunk = await db.scalar(
+                select(func.substr(column, offset, DOCUMENT_CHUNK_SIZE)).where(
+                    model.id == ident, model.version == version
+                )
+            )
+            if chunk is None:
+                raise RuntimeError(f"{model.__tablename__} {ident} changed mid-stream")
+            yield chunk
+
+
+async def _decompressed(chunks: AsyncIterator[bytes], encoding: str):
+    stream = decompressor(encoding)
+    async for chunk in chunks:
+        data = stream.decompress(chunk)
+        if data:
+            yield data
+    tail = stream.flush()
+    if tail:
+        yield tail
+
+
+async def stream_document(
+    db: AsyncSession,
+    request: Request,
+    model,
+    column,
+    ident: int,
+    detail: str,
+) -> StreamingResponse:
+    """
+    Stream the text body stored in `column` of a row, chunk by chunk.
+
+    Only DOCUMENT_CHUNK_SIZE compressed bytes are read per query, so memory
+    stays flat whatever the size of the body. A client accepting the stored
+    encoding gets the compressed bytes as they are, with Content-Encoding;
+    others get the text decompressed on the fly.
+
+    Args:
+        db (AsyncSession): The database session.
+        request (Request): The incoming request, for Accept-Encoding and
+            If-None-Match.
+        model: The model holding the body.
+        column: The deferred body column; its encoding and size are read from
+            the `<name>_encoding` and `<name>_size` columns.
+        ident (int): The primary key of the row.
+        detail (str): The error detail when the row does not exist.
+
+    Returns:
+        StreamingResponse: The body, or an empty 304 if If-None-Match lists
+        the current ETag.
+
+    Raises:
+        HTTPException: 404 error if the row does not exist.
+    """
+    encoding_column = getattr(model, f"{column.key}_encoding")
+    size_column = getattr(model, f"{column.key}_size")
+    row = (
+        await db.execute(
+            select(
+                model.version,
+                encoding_column,
+                size_column,
+                func.coalesce(func.length(column), 0),
+            ).where(model.id == ident)
+        )
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail=detail)
+    version, encoding, size, length = row
+
+    etag = make_etag(version)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    chunks = _stored_chunks(db.bind, model, column, ident, version, length)
+    if encoding != "identity" and accepts_encoding(request.headers, encoding):
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(length)
+    else:
+        headers["Content-Length"] = str(size)
+        chunks = _decompressed(chunks, encoding)
+    return StreamingResponse(chunks, media_type=TEXT_MEDIA_TYPE, headers=headers)
+
+
+def stored_body(column, stored: StoredText) -> dict:
+    """
+    The column values storing a compressed body in `column`.
+    """
+    return {
+        column.key: stored.data,
+        f"{column.key}_encoding": stored.encoding,
+        f"{column.key}_size": stored.size,
+    }
+
+
+# Handlers shared by the document routers, notes and medical records. Each
+# takes the model and its body column; a document belongs to a user through
+# its owner column, the author of a note or the patient of a medical record.
+
+
+async def create_document(
+    db: AsyncSession,
+    model,
+    column,
+    owner_column,
+    owner_id: int,
+    text: str,
+    values: Optional[Dict[str, Any]] = None,
+):
+    """
+    Insert a document owned by a user, its body compressed and indexed.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: The document model.
+        column: The body column.
+        owner_column: The column referencing the owning user.
+        owner_id (int): The owning user.
+        text (str): The body.
+        values (Optional[Dict[str, Any]]): The other columns to set.
+
+    Returns:
+        The new row.
+
+    Raises:
+        HTTPException: 404 error if the user is not found, or 413 error if
+        the body exceeds MAX_DOCUMENT_BYTES.
+    """
+    if await db.get(models.User, owner_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    stored = await compress_text(text)
+    row = await insert_returning(
+        db,
+        model,
+        {
+            owner_column.key: owner_id,
+            **(values or {}),
+            **stored_body(column, stored),
+        },
+    )
+    await index_text(db, model, row.id, stored.head)
+    await db.commit()
+    return row
+
+
+async def list_documents(
+    db: AsyncSession,
+    model,
+    owner_column,
+    owner_id: int,
+    cursor: Optional[str],
+    limit: int,
+    schema,
+) -> Response:
+    """
+    One page of a user's documents, ordered by ID, serialized as `schema`.
+    """
+    statement = select(model).where(owner_column == owner_id)
+    page = await paginate(db, statement, model.id, cursor, limit)
+    return json_response(schema, page)
+
+
+async def search_documents(
+    db: AsyncSession,
+    model,
+    owner_id: int,
+    query: str,
+    cursor: Optional[str],
+    limit: int,
+    schema,
+) -> Response:
+    """
+    One page of a user's documents matching `query`, best first, serialized
+    as `schema`.
+    """
+    page = await search(db, model, owner_id, query, cursor, limit)
+    return json_response(schema, page)
+
+
+async def get_document(
+    db: AsyncSession, response: Response, model, ident: int, detail: str
+):
+    """
+    Load a document's metadata, setting its ETag on `response`.
+    """
+    row = await db.get(model, ident)
+    if row is None:
+        raise HTTPException(status_code=404, detail=detail)
+    response.headers["ETag"] = make_etag(row.version)
+    return row
+
+
+async def replace_document(
+    db: AsyncSession,
+    request: Request,
+    response: Response,
+    model,
+    column,
+    ident: int,
+    detail: str,
+):
+    """
+    Replace a document's body with the request body, compressed as it is
+    received, in the version named by If-Match if any.
+
+    Raises:
+        HTTPException: 400 error if the body is not UTF-8, 404 error if the
+        document is not found, 412 error if it changed since the If-Match
+        version, or 413 error if the body exceeds MAX_DOCUMENT_BYTES.
+    """
+    stored = await compress_upload(request)
+    row = await update_returning(
+        db, model, ident, stored_body(column, stored), request, detail
+    )
+    await index_text(db, model, ident, stored.head)
+    await db.commit()
+    response.headers["ETag"] = make_etag(row.version)
+    return row
+
+
+async def delete_document(db: AsyncSession, model, ident: int, detail: str) -> None:
+    """
+    Delete a document.
+    """
+    await delete_returning(db, model, ident, detail)
+    await db.commit()
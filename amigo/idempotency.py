@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+from os import getenv
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+
+from . import models
+from .admission import client_id
+from .cache import MemoryCache
+from .database import new_session
+from .models import utcnow
+
+# Seconds a response is replayed for retries of its request
+IDEMPOTENCY_TTL = int(getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+# Responses kept in each process in front of the idempotency_keys table
+IDEMPOTENCY_MAX_ENTRIES = int(getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Seconds a duplicate waits for the first request before getting 409
+IDEMPOTENCY_WAIT_SECONDS = float(getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# Seconds after which a request still marked in progress is presumed lost,
+# e.g. with its worker, and a retry may run again
+IDEMPOTENCY_LOCK_SECONDS = 60
+# Larger responses are not stored; retries run the handler again
+IDEMPOTENCY_MAX_BODY = 1024 * 1024
+# How often duplicates in other processes poll for the first response
+POLL_SECONDS = 0.05
+PURGE_INTERVAL_SECONDS = 600
+MAX_KEY_LENGTH = 255
+
+HEADER = "idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: int
+    headers: List[List[str]]
+    body: bytes
+
+
+def _sha256(*parts: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _stored(row) -> StoredResponse:
+    return StoredResponse(row.fingerprint, row.status_code, row.headers, row.body)
+
+
+class IdempotencyStore:
+    """
+    Responses of requests sent with an Idempotency-Key: an in-process LRU in
+    front of the idempotency_keys table, which also marks keys whose first
+    request is still running.
+    """
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.responses = MemoryCache(ttl, max_entries)
+        # Requests running in this process, awaited by their duplicates
+        self._running: Dict[str, asyncio.Future] = {}
+        self._purged_at = time.monotonic()
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Wait until the key's response is stored, or claim the key to run the
+        request.
+
+        Returns:
+            Optional[StoredResponse]: The stored response, or None if the
+            caller claimed the key and must run the request, then `save` or
+            `release` it.
+
+        Raises:
+            TimeoutError: If the first request is still running after
+            IDEMPOTENCY_WAIT_SECONDS.
+        """
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            stored = await self.responses.get(key)
+            if stored is not None:
+                return stored
+            running = self._running.get(key)
+            if running is not None:
+                await asyncio.wait_for(
+                    asyncio.shield(running), deadline - time.monotonic()
+                )
+                continue
+            self._running[key] = asyncio.get_running_loop().create_future()
+            try:
+                stored = await self._claim_row(key, fingerprint, deadline)
+            except BaseException:
+                self._finish(key)
+                raise
+            if stored is None:
+                return None
+            self._finish(key)
+            await self.responses.set(key, stored)
+            return stored
+
+    async def _claim_row(
+        self, key: str, fingerprint: str, deadline: float
+    ) -> Optional[StoredResponse]:
+        while True:
+            now = utcnow()
+            async with new_session() as db:
+                try:
+                    await db.execute(
+                        insert(models.IdempotencyKey).values(
+                            key=key,
+                            fingerprint=fingerprint,
+                            created_at=now,
+                            expires_at=now + timedelta(seconds=self.ttl),
+                        )
+                    )
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()
+                row = (
+                    await db.execute(
+                        select(models.IdempotencyKey).where(
+                            models.IdempotencyKey.key == key
+                        )
+                    )
+                ).scalar_one_or_none()
+                if row is None:
+                    continue
+                if row.status_code is not None and row.expires_at > now:
+                    return _stored(row)
+                lost = row.created_at < now - timedelta(
+                    seconds=IDEMPOTENCY_LOCK_SECONDS
+                )
+                if row.status_code is not None or lost:
+                    # Expired, or abandoned mid-request: start over
+                    await db.execute(
+                        delete(models.IdempotencyKey).where(
+                            models.IdempotencyKey.key == key,
+                            models.IdempotencyKey.created_at == row.created_at,
+                        )
+                    )
+                    await db.commit()
+                    continue
+            # Running in another process
+            if time.monotonic() >= deadline:
+                raise TimeoutError(key)
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def save(self, key: str, stored: StoredResponse) -> None:
+        """
+        Store the response of a claimed key for its retries.
+        """
+        try:
+            async with new_session() as db:
+                await db.execute(
+                    update(models.IdempotencyKey)
+                    .where(models.IdempotencyKey.key == key)
+                    .values(
+                        status_code=stored.status,
+                        headers=stored.headers,
+                        body=stored.body,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            await self.responses.set(key, stored)
+        finally:
+            self._finish(key)
+        await self._purge()
+
+    async def release(self, key: str) -> None:
+        """
+        Forget a claimed key without a response, so a retry runs again.
+        """
+        try:
+            async with new_session() as db:
+                await db.execute(
+                    delete(models.IdempotencyKey).where(
+                        models.IdempotencyKey.key == key,
+                        models.IdempotencyKey.status_code.is_(None),
+                    )
+                )
+                await db.commit()
+        finally:
+            self._finish(key)
+
+    def _finish(self, key: str) -> None:
+        running = self._running.pop(key, None)
+        if running is not None and not running.done():
+            running.set_result(None)
+
+    async def _purge(self) -> None:
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = time.monotonic()
+        async with new_session() as db:
+            await db.execute(
+                delete(models.IdempotencyKey).where(
+                    models.IdempotencyKey.expires_at < utcnow(),
+                    models.IdempotencyKey.status_code.is_not(None),
+                )
+            )
+            await db.commit()
+
+
+store = IdempotencyStore(IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_ENTRIES)
+
+
+async def _replay(stored: StoredResponse, send) -> None:
+    headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in stored.headers
+    ]
+    await send(
+        {
+            "type": "http.response.start",
+            "status": stored.status,
+            "headers": headers + [(REPLAYED_HEADER, b"true")],
+        }
+    )
+    await send({"type": "http.response.body", "body": stored.body})
+
+
+class IdempotencyMiddleware:
+    """
+    Run each POST request sent with an Idempotency-Key header at most once.
+
+    Retries from the same client with the same key, method, path and query
+    string get the stored response, marked with an Idempotent-Replayed
+    header, without reaching the handler;
+    duplicates arriving while the first request runs wait for its response.
+    Responses with a 5xx status are not stored, so those requests can be
+    retried. Reusing a key with a different body is rejected with 422.
+    """
+
+    def __init__(self, app, store: IdempotencyStore = store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        header = Headers(scope=scope).get(HEADER)
+        if header is None:
+            await self.app(scope, receive, send)
+            return
+        if not header or len(header) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                {"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"},
+                status_code=400,
+            )
+            await response(scope, receive, send)
+            return
+
+        # The body is read up front to fingerprint it, then handed on as is
+        messages = []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request" or not message.get("more_body"):
+                break
+        body = b"".join(message.get("body", b"") for message in messages)
+        # Scoped to the client, so one cannot replay another's response
+        key = _sha256(
+            client_id(scope).encode(),
+            b"POST",
+            scope["path"].encode(),
+            scope["query_string"],
+            header.encode(),
+        )
+        fingerprint = _sha256(body)
+
+        try:
+            stored = await self.store.claim(key, fingerprint)
+        except (TimeoutError, asyncio.TimeoutError):
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is in progress"},
+                status_code=409,
+            )
+            await response(scope, receive, send)
+            return
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                response = JSONResponse(
+                    {"detail": "Idempotency-Key was used for a different request"},
+                    status_code=422,
+                )
+                await response(scope, receive, send)
+                return
+            await _replay(stored, send)
+            return
+
+        async def buffered_receive():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        start = None
+        parts = []
+        size = 0
+
+        async def send_and_record(message):
+            nonlocal start, size
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= IDEMPOTENCY_MAX_BODY:
+                    parts.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, buffered_receive, send_and_record)
+        except BaseException:
+            await self.store.release(key)
+            raise
+        if start is None or start["status"] >= 500 or size > IDEMPOTENCY_MAX_BODY:
+            await self.store.release(key)
+            return
+        headers = [
+            [name.decode("latin-1"), value.decode("latin-1")]
+            for name, value in start.get("headers", [])
+        ]
+        await self.store.save(
+            key, StoredResponse(fingerprint, start["status"], headers, b"".join(parts))
+        )
@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+
+from . import cache
+from .database import get_pool_status
+from .replicas import replica_status
+
+router = APIRouter(prefix="/internal", include_in_schema=False)
+
+
+@router.get("/pool", tags=["internal"])
+async def pool_status() -> dict:
+    """
+    Report connection pool usage: connections checked out, overflow in use,
+    checkout counts and the time requests spent waiting for a connection.
+    """
+    return get_pool_status()
+
+
+@router.get("/replicas", tags=["internal"])
+async def replicas_status() -> dict:
+    """
+    Report the health and pool usage of each read replica.
+    """
+    return replica_status()
+
+
+@router.get("/cache", tags=["internal"])
+async def cache_status() -> dict:
+    """
+    Report the hits, misses and evictions of the single-entity response cache.
+    """
+    return {"backend": type(cache.cache).__name__, **cache.cache.stats.as_dict()}
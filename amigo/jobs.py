@@ -0,0 +1,194 @@
+from datetime import timedelta
+from os import getenv
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .models import utcnow
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from .replicas import get_read_db
+from .serialization import json_response
+from .writes import insert_returning
+
+# Seconds without progress after which a running job is presumed abandoned,
+# e.g. by a killed worker, and handed to another worker
+JOB_STALE_SECONDS = float(getenv("JOB_STALE_SECONDS", "300"))
+# Claims of a job before it is failed instead of being retried again
+JOB_MAX_ATTEMPTS = 3
+# Failed items kept on a job for its status
+JOB_MAX_ERRORS = 100
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+router = APIRouter()
+
+
+async def submit_job(
+    db: AsyncSession, kind: str, payload: Dict[str, Any], total: Optional[int] = None
+) -> models.Job:
+    """
+    Queue a job for the workers and commit it.
+
+    Args:
+        db (AsyncSession): The database session.
+        kind (str): The job kind, one of the worker's PROCESSORS.
+        payload (Dict[str, Any]): The JSON input of the job.
+        total (Optional[int]): The number of items to process, if known.
+
+    Returns:
+        models.Job: The queued job.
+    """
+    job = await insert_returning(
+        db,
+        models.Job,
+        {"kind": kind, "payload": payload, "total": total, "created_at": utcnow()},
+    )
+    await db.commit()
+    return job
+
+
+async def claim_job(db: AsyncSession, worker: str) -> Optional[Dict[str, Any]]:
+    """
+    Take the oldest queued or abandoned job, in its own transaction.
+
+    On Postgres the candidate row is selected FOR UPDATE SKIP LOCKED, so
+    concurrent workers each claim a different job without waiting on one
+    another; SQLite serializes the UPDATE instead.
+
+    Args:
+        db (AsyncSession): The database session.
+        worker (str): The claiming worker's name.
+
+    Returns:
+        Optional[Dict[str, Any]]: Every column of the claimed job, payload
+        included, or None if there is nothing to do.
+    """
+    now = utcnow()
+    claimable = (
+        select(models.Job.id)
+        .where(
+            or_(
+                models.Job.status == "queued",
+                and_(
+                    models.Job.status == "running",
+                    models.Job.heartbeat_at
+                    < now - timedelta(seconds=JOB_STALE_SECONDS),
+                ),
+            )
+        )
+        .order_by(models.Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    row = (
+        await db.execute(
+            update(models.Job)
+            .where(models.Job.id == claimable)
+            .values(
+                status="running",
+                worker=worker,
+                attempts=models.Job.attempts + 1,
+                started_at=now,
+                heartbeat_at=now,
+            )
+            .returning(*models.Job.__table__.columns)
+            .execution_options(synchronize_session=False)
+        )
+    ).first()
+    await db.commit()
+    return None if row is None else dict(row._mapping)
+
+
+async def save_progress(
+    db: AsyncSession,
+    job: Dict[str, Any],
+    worker: str,
+    status: Optional[JobStatus] = None,
+) -> bool:
+    """
+    Record a job's progress in the transaction of the batch it made, without
+    committing, and optionally move it to a new status.
+
+    Returns:
+        bool: False if another worker has taken the job over since it was
+        claimed, in which case the batch must be rolled back.
+    """
+    now = utcnow()
+    values = {
+        "total": job["total"],
+        "processed": job["processed"],
+        "failed": job["failed"],
+        "cursor": job["cursor"],
+        "errors": job["errors"],
+        "error": job["error"],
+        "heartbeat_at": now,
+    }
+    if status is not None:
+        values["status"] = status
+        if status in ("succeeded", "failed"):
+            values["finished_at"] = now
+        elif status == "queued":
+            values["worker"] = None
+    result = await db.execute(
+        update(models.Job)
+        .where(
+            models.Job.id == job["id"],
+            models.Job.worker == worker,
+            models.Job.status == "running",
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def record_failures(job: Dict[str, Any], failures: List[dict]) -> None:
+    """
+    Count failed items on a job, keeping the first JOB_MAX_ERRORS of them.
+    """
+    job["failed"] += len(failures)
+    errors = job["errors"] or []
+    job["errors"] = errors + failures[: JOB_MAX_ERRORS - len(errors)]
+
+
+@router.get("/jobs/", tags=["jobs"], response_model=schemas.Page[schemas.Job])
+async def get_jobs(
+    status: Optional[JobStatus] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Retrieve one page of background jobs, ordered by ID.
+
+    Parameters:
+    - status: Only list jobs that are queued, running, succeeded or failed
+    """
+    statement = select(models.Job)
+    if status is not None:
+        statement = statement.where(models.Job.status == status)
+    page = await paginate(db, statement, models.Job.id, cursor, limit)
+    return json_response(schemas.Page[schemas.Job], page)
+
+
+@router.get("/jobs/{job_id}", tags=["jobs"], response_model=schemas.Job)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_read_db)) -> models.Job:
+    """
+    Retrieve the status and progress of a background job.
+
+    Returns:
+    - The job: its status, the items processed and failed out of the total,
+      the first failed items, and why the job failed, if it did
+
+    Raises:
+    - HTTPException: 404 error if the job is not found
+    """
+    job = await db.get(models.Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,19 +1,51 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import engine
-from .models import Base
+from .admission import AdmissionMiddleware, buckets
+from .cache import cache
+from .compression import CompressionMiddleware
+from .database import dispose_engine, get_engine
+from .idempotency import IdempotencyMiddleware
+from .metrics import MetricsMiddleware
+from .profiling import ProfilingMiddleware
+from .replicas import (
+    ReadYourWritesMiddleware,
+    dispose_replicas,
+    get_replicas,
+    monitor_replicas,
+)
 from .routers import include_routers
+from .security import password_hasher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The schema is managed by `python -m amigo.bootstrap`, not on startup
+    get_engine()
+    monitor = None
+    if get_replicas():
+        monitor = asyncio.create_task(monitor_replicas())
+    yield
+    if monitor is not None:
+        monitor.cancel()
+    password_hasher.shutdown()
+    await cache.close()
+    await buckets.close()
+    await dispose_replicas()
+    await dispose_engine()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
 ]
 
+# Innermost, so stored responses are replayed through the other middleware
+app.add_middleware(IdempotencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -21,5 +53,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+# Outside everything but the metrics, so rejected requests cost next to nothing
+# and are still counted
+app.add_middleware(AdmissionMiddleware)
+# Added last so it is the outermost middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 include_routers(app)
@@ -0,0 +1,206 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .database import get_db
+from .documents import (
+    create_document,
+    delete_document,
+    get_document,
+    list_documents,
+    replace_document,
+    search_documents,
+    stream_document,
+)
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .replicas import get_read_db
+from .search import MAX_SEARCH_RESULTS
+
+router = APIRouter()
+
+
+@router.post(
+    "/users/{user_id}/medical-records",
+    tags=["medical records"],
+    response_model=schemas.MedicalRecord,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_medical_record(
+    user_id: int,
+    medical_record: schemas.MedicalRecordCreate,
+    db: AsyncSession = Depends(get_db),
+) -> models.MedicalRecord:
+    """
+    Create a medical record for a user, stored compressed.
+
+    Large documents are better sent with PUT /medical-records/{id}/record,
+    which compresses them as they are received.
+
+    Raises:
+    - HTTPException: 404 error if the user is not found
+    - HTTPException: 413 error if the record exceeds MAX_DOCUMENT_BYTES
+    """
+    return await create_document(
+        db,
+        models.MedicalRecord,
+        models.MedicalRecord.record,
+        models.MedicalRecord.user_id,
+        user_id,
+        medical_record.record,
+    )
+
+
+@router.get(
+    "/users/{user_id}/medical-records",
+    tags=["medical records"],
+    response_model=schemas.Page[schemas.MedicalRecord],
+)
+async def get_medical_records(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Retrieve one page of a user's medical records, ordered by ID, without
+    their text.
+    """
+    return await list_documents(
+        db,
+        models.MedicalRecord,
+        models.MedicalRecord.user_id,
+        user_id,
+        cursor,
+        limit,
+        schemas.Page[schemas.MedicalRecord],
+    )
+
+
+@router.get(
+    "/users/{user_id}/medical-records/search",
+    tags=["medical records"],
+    response_model=schemas.Page[schemas.MedicalRecordSearchResult],
+)
+async def search_medical_records(
+    user_id: int,
+    q: str = Query(min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Search a patient's medical records, best matches first.
+
+    Parameters:
+    - q: the words to search for; every word must match, in any form
+      ("migraines" finds "migraine")
+    - cursor: the `next_cursor` returned with the previous page
+    - limit: maximum number of results in the page
+
+    Returns:
+    - A page of matches, each with its rank, and the cursor for the next
+      page, if any; at most MAX_SEARCH_RESULTS matches are reachable
+    """
+    return await search_documents(
+        db,
+        models.MedicalRecord,
+        user_id,
+        q,
+        cursor,
+        limit,
+        schemas.Page[schemas.MedicalRecordSearchResult],
+    )
+
+
+@router.get(
+    "/medical-records/{record_id}",
+    tags=["medical records"],
+    response_model=schemas.MedicalRecord,
+)
+async def get_medical_record(
+    record_id: int, response: Response, db: AsyncSession = Depends(get_read_db)
+) -> models.MedicalRecord:
+    """
+    Retrieve a medical record's metadata; its text is not loaded.
+    """
+    return await get_document(
+        db, response, models.MedicalRecord, record_id, "Medical record not found"
+    )
+
+
+@router.get(
+    "/medical-records/{record_id}/record",
+    tags=["medical records"],
+    response_class=StreamingResponse,
+)
+async def get_medical_record_text(
+    record_id: int, request: Request, db: AsyncSession = Depends(get_read_db)
+) -> Response:
+    """
+    Stream the text of a medical record, gzip-encoded as stored when the
+    client accepts it.
+    """
+    return await stream_document(
+        db,
+        request,
+        models.MedicalRecord,
+        models.MedicalRecord.record,
+        record_id,
+        "Medical record not found",
+    )
+
+
+@router.put(
+    "/medical-records/{record_id}/record",
+    tags=["medical records"],
+    response_model=schemas.MedicalRecord,
+    openapi_extra={
+        "requestBody": {"content": {"text/plain": {"schema": {"type": "string"}}}}
+    },
+)
+async def replace_medical_record_text(
+    record_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+) -> models.MedicalRecord:
+    """
+    Replace the text of a medical record with the raw UTF-8 request body,
+    compressed while it is received.
+
+    With an If-Match header the text is only replaced in the version the
+    client last read; otherwise it is rejected with 412.
+
+    Raises:
+    - HTTPException: 400 error if the body is not UTF-8
+    - HTTPException: 404 error if the medical record is not found
+    - HTTPException: 413 error if the body exceeds MAX_DOCUMENT_BYTES
+    """
+    return await replace_document(
+        db,
+        request,
+        response,
+        models.MedicalRecord,
+        models.MedicalRecord.record,
+        record_id,
+        "Medical record not found",
+    )
+
+
+@router.delete(
+    "/medical-records/{record_id}",
+    tags=["medical records"],
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_medical_record(
+    record_id: int, db: AsyncSession = Depends(get_db)
+) -> None:
+    """
+    Delete a medical record.
+    """
+    await delete_document(
+        db, models.MedicalRecord, record_id, "Medical record not found"
+    )
@@ -0,0 +1,307 @@
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from os import getenv
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this many seconds are logged with their SQL
+SLOW_REQUEST_SECONDS = float(getenv("SLOW_REQUEST_SECONDS", "1.0"))
+# Statements kept per request for the slow request log
+MAX_LOGGED_STATEMENTS = 100
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels) -> str:
+    if not names:
+        return ""
+    escaped = (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in values
+    )
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """
+    A monotonically increasing value per label set.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    """
+    A value per label set that goes up and down.
+    """
+
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    """
+    Observations per label set, counted into cumulative buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: a count per bucket (the last one is +Inf) and the sum
+        self.series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            bounds = [*map(str, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(names, labels + (bound,))} "
+                    f"{cumulative}"
+                )
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {total[0]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+REQUESTS = Counter(
+    "amigo_http_requests_total",
+    "HTTP requests handled, by route and status.",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "amigo_http_request_duration_seconds",
+    "HTTP request latency, from the first byte received to the last sent.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "amigo_http_requests_in_flight",
+    "HTTP requests currently being handled.",
+    ("method",),
+)
+REQUEST_STATEMENTS = Histogram(
+    "amigo_http_request_sql_statements",
+    "SQL statements executed per HTTP request.",
+    ("method", "route"),
+    STATEMENT_BUCKETS,
+)
+REQUEST_SQL_DURATION = Histogram(
+    "amigo_http_request_sql_duration_seconds",
+    "Time spent executing SQL per HTTP request.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+STATEMENTS = Counter(
+    "amigo_sql_statements_total", "SQL statements executed, in or out of requests."
+)
+SQL_DURATION = Counter(
+    "amigo_sql_duration_seconds_total", "Time spent executing SQL statements."
+)
+REJECTIONS = Counter(
+    "amigo_http_requests_rejected_total",
+    "HTTP requests turned away by admission control, by reason.",
+    ("reason",),
+)
+REGISTRY = [
+    REQUESTS,
+    REQUEST_DURATION,
+    IN_FLIGHT,
+    REQUEST_STATEMENTS,
+    REQUEST_SQL_DURATION,
+    STATEMENTS,
+    SQL_DURATION,
+    REJECTIONS,
+]
+
+
+def render_metrics() -> str:
+    """
+    Render every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    """
+    The SQL statements executed on behalf of one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        if len(self.statements) < MAX_LOGGED_STATEMENTS:
+            self.statements.append((statement, duration))
+
+
+# The stats of the request being handled; SQLAlchemy's greenlets and the
+# threadpool used in blocking mode both run with a copy of this context
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    STATEMENTS.inc()
+    SQL_DURATION.inc(amount=duration)
+    stats = current_request.get()
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+def instrument_statements(sync_engine) -> None:
+    """
+    Count and time every statement executed through the engine.
+    """
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def log_slow_request(
+    method: str, path: str, status: int, duration: float, stats: RequestStats
+) -> None:
+    """
+    Log a slow request with its SQL, repeated statements first, so an N+1
+    pattern stands out as one statement run many times.
+    """
+    repeats: Dict[str, List[float]] = {}
+    for statement, seconds in stats.statements:
+        repeats.setdefault(statement, []).append(seconds)
+    lines = [
+        f"{len(timings)}x {1000 * sum(timings):.1f} ms  {' '.join(statement.split())}"
+        for statement, timings in sorted(
+            repeats.items(), key=lambda item: len(item[1]), reverse=True
+        )
+    ]
+    logger.warning(
+        "Slow request %s %s -> %s in %.0f ms, %d SQL statements in %.0f ms\n%s",
+        method,
+        path,
+        status,
+        1000 * duration,
+        stats.count,
+        1000 * stats.duration,
+        "\n".join(lines),
+    )
+
+
+class MetricsMiddleware:
+    """
+    Time every HTTP request and attribute the SQL it runs to its route.
+
+    A pure ASGI middleware, so streamed responses are timed until their last
+    chunk and the request body is never buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        stats = RequestStats()
+        token = current_request.set(stats)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            IN_FLIGHT.dec((method,))
+            current_request.reset(token)
+            # The template, e.g. /users/{user_id}, keeps the label set bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS.inc((method, route, str(status)))
+            REQUEST_DURATION.observe((method, route), duration)
+            REQUEST_STATEMENTS.observe((method, route), stats.count)
+            REQUEST_SQL_DURATION.observe((method, route), stats.duration)
+            if duration >= SLOW_REQUEST_SECONDS:
+                log_slow_request(method, scope["path"], status, duration, stats)
+
+
+router = APIRouter(include_in_schema=False)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    Serve the request and SQL metrics of this process to Prometheus.
+    """
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,18 +1,28 @@
+from datetime import datetime, timezone
+
 from sqlalchemy import (
+    JSON,
+    BigInteger,
     Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     Numeric,
     String,
-    Text,
 )
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import declarative_base, deferred, relationship
 
 Base = declarative_base()
 
 
+def utcnow() -> datetime:
+    # Naive UTC, as stored in the DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(Base):
     """
     User model representing both patients and clinicians.
@@ -26,12 +36,21 @@ class User(Base):
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
     is_clinician = Column(Boolean, default=False)
+    # Incremented on every update, used for ETags and optimistic concurrency
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Set by database triggers on every write: when the row last changed, and
+    # its position in the change feed of amigo.changes, from a counter shared
+    # by the synced tables
+    updated_at = Column(DateTime)
+    change_seq = Column(BigInteger, index=True)
 
     appointments = relationship("Appointment", back_populates="user")
     billings = relationship("Billing", back_populates="user")
     medical_records = relationship("MedicalRecord", back_populates="user")
     notes = relationship("Note", back_populates="author")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Appointment(Base):
     """
@@ -39,16 +58,27 @@ class Appointment(Base):
     """
 
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Serves the per-user overlap checks and calendar range queries
+        Index(
+            "ix_appointments_user_id_start_time", "user_id", "start_time", "end_time"
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     description = Column(String)
     notes = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime)
+    change_seq = Column(BigInteger, index=True)
 
     user = relationship("User", back_populates="appointments")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Billing(Base):
     """
@@ -56,15 +86,53 @@ class Billing(Base):
     """
 
     __tablename__ = "billings"
+    __table_args__ = (
+        # Serves per-user balance queries and the billing summaries
+        Index("ix_billings_user_id_paid_date", "user_id", "paid", "date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     amount = Column(Numeric(10, 2))
     date = Column(DateTime)
     paid = Column(Boolean, default=False)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime)
+    change_seq = Column(BigInteger, index=True)
 
     user = relationship("User", back_populates="billings")
 
+    __mapper_args__ = {"version_id_col": version}
+
+
+class Tombstone(Base):
+    """
+    A row deleted from one of the synced tables, recorded by a database
+    trigger so the change feed can report the deletion.
+    """
+
+    __tablename__ = "tombstones"
+
+    change_seq = Column(BigInteger, primary_key=True, autoincrement=False)
+    table_name = Column(String(32), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False)
+
+
+class BillingSummary(Base):
+    """
+    Billing totals per user, month and paid state, kept up to date by
+    database triggers on the billings table.
+    """
+
+    __tablename__ = "billing_summaries"
+
+    user_id = Column(Integer, primary_key=True)
+    month = Column(String(7), primary_key=True)
+    paid = Column(Boolean, primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(Numeric(14, 2), nullable=False)
+
 
 class MedicalRecord(Base):
     """
@@ -74,11 +142,21 @@ class MedicalRecord(Base):
     __tablename__ = "medical_records"
 
     id = Column(Integer, primary_key=True, index=True)
-    record = Column(Text)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    # The record text, compressed with record_encoding. Deferred, so loading
+    # a record never pulls its body; it is streamed in chunks instead.
+    record = deferred(Column(LargeBinary))
+    record_encoding = Column(
+        String(16), nullable=False, default="identity", server_default="identity"
+    )
+    # Size of the uncompressed text in bytes
+    record_size = Column(Integer, nullable=False, default=0, server_default="0")
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     user = relationship("User", back_populates="medical_records")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Note(Base):
     """
@@ -88,8 +166,75 @@ class Note(Base):
     __tablename__ = "notes"
 
     id = Column(Integer, primary_key=True, index=True)
-    content = Column(Text)
+    # Compressed and deferred like MedicalRecord.record
+    content = deferred(Column(LargeBinary))
+    content_encoding = Column(
+        String(16), nullable=False, default="identity", server_default="identity"
+    )
+    content_size = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime)
-    author_id = Column(Integer, ForeignKey("users.id"))
+    author_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     author = relationship("User", back_populates="notes")
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class Job(Base):
+    """
+    Background job, queued in this table and processed in batches by the
+    workers of `python -m amigo.worker`.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Serves the workers' search for the oldest claimable job
+        Index("ix_jobs_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(32), nullable=False)
+    # queued, running, succeeded or failed
+    status = Column(
+        String(16), nullable=False, default="queued", server_default="queued"
+    )
+    # The job's input, e.g. every item of a billing run; deferred, so
+    # status reads never load it
+    payload = deferred(Column(JSON, nullable=False))
+    total = Column(Integer)
+    processed = Column(Integer, nullable=False, default=0, server_default="0")
+    failed = Column(Integer, nullable=False, default=0, server_default="0")
+    # Where the next batch starts, so a job taken over by another worker
+    # resumes after its last committed batch
+    cursor = Column(Integer, nullable=False, default=0, server_default="0")
+    # The first failed items, as bulk item results
+    errors = Column(JSON)
+    # Why the job as a whole failed
+    error = Column(String)
+    worker = Column(String(64))
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class IdempotencyKey(Base):
+    """
+    The response of a request sent with an Idempotency-Key header, replayed
+    to its retries until `expires_at`.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    # SHA-256 of the method, path and header value
+    key = Column(String(64), primary_key=True)
+    # SHA-256 of the request body, to reject a key reused for another request
+    fingerprint = Column(String(64), nullable=False)
+    # NULL while the first request is running
+    status_code = Column(Integer)
+    headers = Column(JSON)
+    body = Column(LargeBinary)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,199 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .database import get_db
+from .documents import (
+    create_document,
+    delete_document,
+    get_document,
+    list_documents,
+    replace_document,
+    search_documents,
+    stream_document,
+)
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .replicas import get_read_db
+from .search import MAX_SEARCH_RESULTS
+
+router = APIRouter()
+
+
+@router.post(
+    "/users/{user_id}/notes",
+    tags=["notes"],
+    response_model=schemas.Note,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_note(
+    user_id: int, note: schemas.NoteCreate, db: AsyncSession = Depends(get_db)
+) -> models.Note:
+    """
+    Create a note authored by a user, stored compressed.
+
+    Long notes are better sent with PUT /notes/{id}/content, which
+    compresses them as they are received.
+
+    Raises:
+    - HTTPException: 404 error if the user is not found
+    - HTTPException: 413 error if the content exceeds MAX_DOCUMENT_BYTES
+    """
+    return await create_document(
+        db,
+        models.Note,
+        models.Note.content,
+        models.Note.author_id,
+        user_id,
+        note.content,
+        {"created_at": note.created_at},
+    )
+
+
+@router.get(
+    "/users/{user_id}/notes",
+    tags=["notes"],
+    response_model=schemas.Page[schemas.Note],
+)
+async def get_notes(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Retrieve one page of the notes a user authored, ordered by ID, without
+    their content.
+    """
+    return await list_documents(
+        db,
+        models.Note,
+        models.Note.author_id,
+        user_id,
+        cursor,
+        limit,
+        schemas.Page[schemas.Note],
+    )
+
+
+@router.get(
+    "/users/{user_id}/notes/search",
+    tags=["notes"],
+    response_model=schemas.Page[schemas.NoteSearchResult],
+)
+async def search_notes(
+    user_id: int,
+    q: str = Query(min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    db: AsyncSession = Depends(get_read_db),
+) -> Response:
+    """
+    Search the notes a user authored, best matches first.
+
+    Parameters:
+    - q: the words to search for; every word must match, in any form
+      ("migraines" finds "migraine")
+    - cursor: the `next_cursor` returned with the previous page
+    - limit: maximum number of results in the page
+
+    Returns:
+    - A page of matches, each with its rank, and the cursor for the next
+      page, if any; at most MAX_SEARCH_RESULTS matches are reachable
+    """
+    return await search_documents(
+        db,
+        models.Note,
+        user_id,
+        q,
+        cursor,
+        limit,
+        schemas.Page[schemas.NoteSearchResult],
+    )
+
+
+@router.get(
+    "/notes/{note_id}",
+    tags=["notes"],
+    response_model=schemas.Note,
+)
+async def get_note(
+    note_id: int, response: Response, db: AsyncSession = Depends(get_read_db)
+) -> models.Note:
+    """
+    Retrieve a note's metadata; its content is not loaded.
+    """
+    return await get_document(db, response, models.Note, note_id, "Note not found")
+
+
+@router.get(
+    "/notes/{note_id}/content",
+    tags=["notes"],
+    response_class=StreamingResponse,
+)
+async def get_note_content(
+    note_id: int, request: Request, db: AsyncSession = Depends(get_read_db)
+) -> Response:
+    """
+    Stream the content of a note, gzip-encoded as stored when the client
+    accepts it.
+    """
+    return await stream_document(
+        db,
+        request,
+        models.Note,
+        models.Note.content,
+        note_id,
+        "Note not found",
+    )
+
+
+@router.put(
+    "/notes/{note_id}/content",
+    tags=["notes"],
+    response_model=schemas.Note,
+    openapi_extra={
+        "requestBody": {"content": {"text/plain": {"schema": {"type": "string"}}}}
+    },
+)
+async def replace_note_content(
+    note_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+) -> models.Note:
+    """
+    Replace the content of a note with the raw UTF-8 request body,
+    compressed while it is received.
+
+    With an If-Match header the content is only replaced in the version the
+    client last read; otherwise it is rejected with 412.
+
+    Raises:
+    - HTTPException: 400 error if the body is not UTF-8
+    - HTTPException: 404 error if the note is not found
+    - HTTPException: 413 error if the body exceeds MAX_DOCUMENT_BYTES
+    """
+    return await replace_document(
+        db,
+        request,
+        response,
+        models.Note,
+        models.Note.content,
+        note_id,
+        "Note not found",
+    )
+
+
+@router.delete(
+    "/notes/{note_id}",
+    tags=["notes"],
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_note(note_id: int, db: AsyncSession = Depends(get_db)) -> None:
+    """
+    Delete a note.
+    """
+    await delete_document(db, models.Note, note_id, "Note not found")
@@ -0,0 +1,92 @@
+import base64
+import binascii
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(last_id: int, kind: str = "id") -> str:
+    """
+    Encode the last seen primary key into an opaque cursor string.
+
+    Args:
+        last_id (int): The ID of the last row on the current page.
+        kind (str): What the value is, e.g. "offset" for ranked results.
+
+    Returns:
+        str: A URL-safe cursor for the next page.
+    """
+    return base64.urlsafe_b64encode(f"{kind}:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str = "id") -> int:
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str): The opaque cursor sent by the client.
+        kind (str): The kind of value the cursor must hold.
+
+    Returns:
+        int: The ID of the last row of the previous page.
+
+    Raises:
+        HTTPException: 400 error if the cursor is malformed.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        prefix, _, value = base64.urlsafe_b64decode(padded).decode().partition(":")
+        if prefix != kind:
+            raise ValueError(cursor)
+        return int(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def plain_columns(model) -> Tuple[List[str], list]:
+    """
+    The attribute names and columns of a model, without deferred columns,
+    for selecting rows as plain values.
+    """
+    attributes = [prop for prop in inspect(model).column_attrs if not prop.deferred]
+    return [prop.key for prop in attributes], [prop.columns[0] for prop in attributes]
+
+
+async def paginate(
+    db: AsyncSession, statement: Select, id_column, cursor: Optional[str], limit: int
+) -> dict:
+    """
+    Fetch one page of rows using keyset pagination on `id_column`.
+
+    The statement is ordered by `id_column` and resumed with `id > last_id`,
+    so every page is an index range scan no matter how deep the client is.
+
+    Rows are fetched as plain column values rather than ORM objects, leaving
+    out deferred columns, since pages are only serialized; this skips the
+    identity map and attribute instrumentation, which cost more than the
+    query itself for large pages.
+
+    Args:
+        db (AsyncSession): The database session.
+        statement (Select): The filtered select for the listed model.
+        id_column: The primary key column used as the keyset.
+        cursor (Optional[str]): The cursor returned with the previous page.
+        limit (int): The maximum number of rows to return.
+
+    Returns:
+        dict: The page items, as dicts, and the cursor for the following page,
+        if any.
+    """
+    if cursor is not None:
+        statement = statement.where(id_column > decode_cursor(cursor))
+    keys, columns = plain_columns(id_column.class_)
+    statement = statement.with_only_columns(*columns)
+    result = await db.execute(statement.order_by(id_column).limit(limit + 1))
+    rows = [dict(zip(keys, row)) for row in result]
+    next_cursor = encode_cursor(rows[limit - 1]["id"]) if len(rows) > limit else None
+    return {"items": rows[:limit], "next_cursor": next_cursor}
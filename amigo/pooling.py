@@ -0,0 +1,181 @@
+import math
+import threading
+import time
+from os import getenv
+from uuid import uuid4
+
+from sqlalchemy import URL, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+# "queue" keeps a local pool; "pgbouncer" leaves pooling to PgBouncer
+DB_POOL_MODE = getenv("DB_POOL_MODE", "queue").lower()
+DB_POOL_SIZE = int(getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Seconds over which the recent checkout wait decays by a factor e
+RECENT_WAIT_DECAY_SECONDS = 1.0
+
+
+class PoolMetrics:
+    """
+    Counters collected from the pool events of one engine.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._recent_wait = 0.0
+        self._recent_at = time.monotonic()
+
+    def on_connect(self, *args) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, *args) -> None:
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+
+    def on_checkin(self, *args) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+    def on_invalidate(self, *args) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+            now = time.monotonic()
+            self._recent_wait = max(seconds, self._decayed_wait(now))
+            self._recent_at = now
+
+    def _decayed_wait(self, now: float) -> float:
+        elapsed = now - self._recent_at
+        return self._recent_wait * math.exp(-elapsed / RECENT_WAIT_DECAY_SECONDS)
+
+    def recent_wait(self) -> float:
+        """
+        The longest recent checkout wait, decaying over time, so it falls
+        back to zero once the pool stops being contended even when no more
+        connections are checked out.
+        """
+        with self._lock:
+            return self._decayed_wait(time.monotonic())
+
+    def snapshot(self, pool) -> dict:
+        """
+        Report the counters along with the live state of `pool`.
+
+        Args:
+            pool: The pool these metrics were collected from.
+
+        Returns:
+            dict: A JSON-serializable view of the pool.
+        """
+        with self._lock:
+            average_wait = self.wait_total / self.wait_count if self.wait_count else 0
+            return {
+                "pool_class": type(pool).__name__,
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": self.in_use,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_count": self.wait_count,
+                "wait_seconds_total": self.wait_total,
+                "wait_seconds_avg": average_wait,
+                "wait_seconds_max": self.wait_max,
+                "wait_seconds_recent": self._decayed_wait(time.monotonic()),
+            }
+
+
+def timed_pool_class(base, metrics: PoolMetrics):
+    """
+    Subclass a queue pool so that the time spent waiting for a connection is
+    recorded in `metrics`.
+
+    The metrics live on the class so they survive `Pool.recreate()`, which
+    `Engine.dispose()` calls with `self.__class__`.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except PoolTimeoutError:
+            self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    return type(
+        f"Timed{base.__name__}", (base,), {"metrics": metrics, "_do_get": _do_get}
+    )
+
+
+def engine_options(url: URL, async_mode: bool, metrics: PoolMetrics) -> dict:
+    """
+    Build the pool keyword arguments for `create_engine`/`create_async_engine`.
+
+    Args:
+        url (URL): The connection URL of the engine.
+        async_mode (bool): Whether the engine uses an asyncio driver.
+        metrics (PoolMetrics): Where the pool reports its wait times.
+
+    Returns:
+        dict: Keyword arguments for the engine factory.
+    """
+    connect_args = {}
+    if url.get_backend_name() == "sqlite":
+        connect_args["check_same_thread"] = False
+
+    if DB_POOL_MODE == "pgbouncer":
+        # PgBouncer in transaction mode hands each transaction a different
+        # server connection, so nothing may be pooled or prepared client-side
+        if url.drivername == "postgresql+asyncpg":
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = (
+                lambda: f"__asyncpg_{uuid4()}__"
+            )
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    base = AsyncAdaptedQueuePool if async_mode else QueuePool
+    return {
+        "poolclass": timed_pool_class(base, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+def instrument_engine(sync_engine, metrics: PoolMetrics) -> None:
+    """
+    Feed the pool events of `sync_engine` into `metrics`.
+    """
+    event.listen(sync_engine, "connect", metrics.on_connect)
+    event.listen(sync_engine, "checkout", metrics.on_checkout)
+    event.listen(sync_engine, "checkin", metrics.on_checkin)
+    event.listen(sync_engine, "invalidate", metrics.on_invalidate)
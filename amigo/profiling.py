@@ -0,0 +1,258 @@
+import random
+import secrets
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from os import getenv
+from typing import Any, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+# Fraction of requests profiled without being asked to, e.g. 0.001
+PROFILE_SAMPLE_RATE = float(getenv("PROFILE_SAMPLE_RATE", "0"))
+# Secret a client sends in the X-Profile header to profile its request;
+# profiling on demand is disabled while it is unset
+PROFILE_TOKEN = getenv("PROFILE_TOKEN", "")
+# Statements slower than this many milliseconds get their plan explained
+PROFILE_EXPLAIN_THRESHOLD_MS = float(getenv("PROFILE_EXPLAIN_THRESHOLD_MS", "50"))
+# Profiles kept for GET /internal/profiles, the oldest are dropped first
+PROFILE_HISTORY = int(getenv("PROFILE_HISTORY", "100"))
+# Statements kept per profile
+MAX_PROFILED_STATEMENTS = 500
+# Parameters described per statement
+MAX_DESCRIBED_PARAMETERS = 50
+
+PROFILE_HEADER = "x-profile"
+PROFILES_PATH = "/internal/profiles"
+
+
+class Profile:
+    """
+    The statements one profiled request executed, with their timings and,
+    for slow ones, their query plans.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.id = secrets.token_hex(8)
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.duration_ms = 0.0
+        self.sql_duration_ms = 0.0
+        self.statement_count = 0
+        self.statements: List[dict] = []
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3),
+            "sql_duration_ms": round(self.sql_duration_ms, 3),
+            "statement_count": self.statement_count,
+        }
+
+    def as_dict(self) -> dict:
+        return {**self.summary(), "statements": self.statements}
+
+
+current_profile: ContextVar[Optional[Profile]] = ContextVar(
+    "current_profile", default=None
+)
+profiles: "OrderedDict[str, Profile]" = OrderedDict()
+
+
+def explain(conn, statement: str, parameters) -> List[str]:
+    """
+    Fetch the plan of a statement on the connection that just ran it.
+
+    SQLite gets EXPLAIN QUERY PLAN. Postgres gets EXPLAIN (ANALYZE, BUFFERS)
+    for reads, which runs the query again, and a plain EXPLAIN for writes,
+    which must not be repeated. A savepoint keeps a failing EXPLAIN from
+    aborting the request's transaction.
+    """
+    dialect = conn.dialect.name
+    cursor = conn.connection.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        if dialect != "postgresql":
+            return []
+        is_read = statement.lstrip().upper().startswith(("SELECT", "WITH"))
+        options = "(ANALYZE, BUFFERS) " if is_read else ""
+        cursor.execute("SAVEPOINT amigo_explain")
+        try:
+            cursor.execute(f"EXPLAIN {options}{statement}", parameters)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT amigo_explain")
+            cursor.execute("RELEASE SAVEPOINT amigo_explain")
+    finally:
+        cursor.close()
+
+
+def _describe(value: Any) -> str:
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def describe_parameters(parameters, executemany: bool) -> str:
+    """
+    Describe a statement's parameters by type, and length for strings and
+    bytes, without their values: those include emails, password hashes and
+    patient documents, which profiles must never hold.
+    """
+    if executemany:
+        rows = list(parameters)
+        first = describe_parameters(rows[0], False) if rows else "()"
+        return f"{len(rows)} x {first}"
+    if isinstance(parameters, dict):
+        items = [f"{key}: {_describe(value)}" for key, value in parameters.items()]
+        brackets = "{}"
+    else:
+        items = [_describe(value) for value in parameters or ()]
+        brackets = "()"
+    if len(items) > MAX_DESCRIBED_PARAMETERS:
+        extra = len(items) - MAX_DESCRIBED_PARAMETERS
+        items = items[:MAX_DESCRIBED_PARAMETERS] + [f"... {extra} more"]
+    return brackets[0] + ", ".join(items) + brackets[1]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is None or not conn.info.get("profile_start"):
+        return
+    duration_ms = 1000 * (time.perf_counter() - conn.info["profile_start"].pop())
+    profile.statement_count += 1
+    profile.sql_duration_ms += duration_ms
+    if len(profile.statements) >= MAX_PROFILED_STATEMENTS:
+        return
+
+    entry = {
+        "sql": statement,
+        "parameters": describe_parameters(parameters, executemany),
+        "duration_ms": round(duration_ms, 3),
+        "plan": None,
+    }
+    if duration_ms >= PROFILE_EXPLAIN_THRESHOLD_MS and not executemany:
+        try:
+            entry["plan"] = explain(conn, statement, parameters)
+        except Exception as exc:
+            entry["plan_error"] = str(exc)
+    profile.statements.append(entry)
+
+
+def instrument_profiling(sync_engine) -> None:
+    """
+    Capture the statements of profiled requests executed through the engine.
+    """
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def should_profile(scope) -> bool:
+    # Reading profiles sends the token too, but is not worth a profile itself
+    if scope["path"].startswith(PROFILES_PATH):
+        return False
+    if PROFILE_TOKEN:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode() and secrets.compare_digest(
+                value, PROFILE_TOKEN.encode()
+            ):
+                return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """
+    Profile the SQL of requests asked for with the X-Profile header, or of a
+    sample of all requests.
+
+    The response carries a Server-Timing header with the SQL totals and an
+    X-Profile-Id header naming the full report at /internal/profiles/{id}.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+
+        async def send_with_report(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                timing = (
+                    f"sql;dur={profile.sql_duration_ms:.3f};"
+                    f'desc="{profile.statement_count} statements"'
+                )
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timing)
+                headers.append("X-Profile-Id", profile.id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_report)
+        finally:
+            current_profile.reset(token)
+            profile.duration_ms = 1000 * (time.perf_counter() - started)
+            profiles[profile.id] = profile
+            while len(profiles) > PROFILE_HISTORY:
+                profiles.popitem(last=False)
+
+
+def require_profile_token(request: Request) -> None:
+    """
+    Only let through requests carrying PROFILE_TOKEN in their X-Profile
+    header: profiles show the SQL and query plans of other clients' requests.
+
+    Raises:
+        HTTPException: 403 error if the token is missing or wrong, or if
+        PROFILE_TOKEN is unset.
+    """
+    token = request.headers.get(PROFILE_HEADER, "")
+    if not PROFILE_TOKEN or not secrets.compare_digest(
+        token.encode(), PROFILE_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+router = APIRouter(
+    prefix=PROFILES_PATH,
+    include_in_schema=False,
+    dependencies=[Depends(require_profile_token)],
+)
+
+
+@router.get("", tags=["internal"])
+async def list_profiles() -> List[dict]:
+    """
+    Summarize the recent profiles, newest first.
+    """
+    return [profile.summary() for profile in reversed(profiles.values())]
+
+
+@router.get("/{profile_id}", tags=["internal"])
+async def get_profile(profile_id: str) -> dict:
+    """
+    Report the statements, timings and query plans of a profiled request.
+    """
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.as_dict()
@@ -0,0 +1,28 @@
+"""
+Recompute the trigger-maintained billing_summaries table from the billing
+rows. Run it once before switching an existing database to
+BILLING_SUMMARY_SOURCE=table, or after loading billings with the triggers
+disabled:
+
+    python -m amigo.rebuild_summaries
+"""
+
+import asyncio
+
+from .billing_summary import rebuild_billing_summaries
+from .database import dispose_engine, new_session
+
+
+async def rebuild() -> None:
+    """
+    Rewrite the billing_summaries table on the configured database.
+    """
+    try:
+        async with new_session() as db:
+            await rebuild_billing_summaries(db)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
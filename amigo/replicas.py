@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import time
+from os import getenv
+from typing import List, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError, SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+from . import database
+from .database import build_engine, get_replica_urls, new_session
+from .pooling import PoolMetrics
+
+# How a replica is picked for each read: "round_robin" or "least_loaded"
+REPLICA_SELECTION = getenv("REPLICA_SELECTION", "round_robin").lower()
+# Seconds between health checks, and before a failed replica is tried again
+REPLICA_CHECK_INTERVAL = float(getenv("REPLICA_CHECK_INTERVAL", "10"))
+REPLICA_CHECK_TIMEOUT = 2.0
+# Retry-After of a read whose replica failed after the request started
+REPLICA_RETRY_AFTER = 1
+# Seconds after a client's own write during which its reads go to the
+# primary, so it sees the write whatever the replication lag
+READ_YOUR_WRITES_SECONDS = int(getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+READ_YOUR_WRITES_COOKIE = "amigo_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class Replica:
+    """
+    A read replica: its engine, the counters of its pool and its health.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.metrics = PoolMetrics()
+        self.engine = build_engine(url, self.metrics)
+        self.down_until = 0.0
+        self.failures = 0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self) -> None:
+        # Skipped until the next health check, or REPLICA_CHECK_INTERVAL
+        # without one
+        self.failures += 1
+        self.down_until = time.monotonic() + REPLICA_CHECK_INTERVAL
+
+    def mark_up(self) -> None:
+        self.down_until = 0.0
+
+    def status(self) -> dict:
+        return {
+            "url": self.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "pool": self.metrics.snapshot(self.engine.pool),
+        }
+
+
+# Built on first use, like the primary's engine
+_replicas: Optional[List[Replica]] = None
+_turns = itertools.count()
+
+
+def get_replicas() -> List[Replica]:
+    """
+    Return the configured replicas, creating their engines on first use.
+    """
+    global _replicas
+    if _replicas is None:
+        _replicas = [Replica(url) for url in get_replica_urls()]
+    return _replicas
+
+
+def wrote_recently(request: Request) -> bool:
+    """
+    Whether the client made a write within the last READ_YOUR_WRITES_SECONDS.
+    """
+    until = request.cookies.get(READ_YOUR_WRITES_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+def choose_replica(request: Request) -> Optional[Replica]:
+    """
+    Pick the replica serving a read, or None to read from the primary: when
+    no replica is configured or healthy, or the client wrote recently.
+    """
+    if wrote_recently(request):
+        return None
+    healthy = [replica for replica in get_replicas() if replica.healthy]
+    if not healthy:
+        return None
+    # Rotating the candidates also breaks ties between equally loaded ones
+    turn = next(_turns) % len(healthy)
+    candidates = healthy[turn:] + healthy[:turn]
+    if REPLICA_SELECTION == "least_loaded":
+        return min(candidates, key=lambda replica: replica.metrics.in_use)
+    return candidates[0]
+
+
+def read_bind(request: Request):
+    """
+    The engine to read from for `request`, or None for the primary.
+    """
+    replica = choose_replica(request)
+    return None if replica is None else replica.engine
+
+
+async def _select_one(engine) -> None:
+    if database.DB_ASYNC:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        return
+
+    def select_one():
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    await run_in_threadpool(select_one)
+
+
+async def check_replica(replica: Replica) -> bool:
+    """
+    Run a trivial query on a replica and record whether it answered in time.
+    """
+    try:
+        await asyncio.wait_for(_select_one(replica.engine), REPLICA_CHECK_TIMEOUT)
+    except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+        replica.mark_down()
+        return False
+    replica.mark_up()
+    return True
+
+
+async def monitor_replicas() -> None:
+    """
+    Check every replica each REPLICA_CHECK_INTERVAL, until cancelled.
+    """
+    while True:
+        await asyncio.gather(*(check_replica(replica) for replica in get_replicas()))
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+
+def replica_status() -> dict:
+    """
+    Report the selection policy and the health and pool usage of each replica.
+    """
+    return {
+        "selection": REPLICA_SELECTION,
+        "replicas": [replica.status() for replica in get_replicas()],
+    }
+
+
+async def dispose_replicas() -> None:
+    """
+    Close the pooled connections of the replicas, e.g. on shutdown.
+    """
+    for replica in _replicas or ():
+        if database.DB_ASYNC:
+            await replica.engine.dispose()
+        else:
+            await run_in_threadpool(replica.engine.dispose)
+
+
+def reads_from_replica(request: Request) -> bool:
+    """
+    Whether `get_read_db` gave the request a replica's session, whose reads
+    may lag behind the primary.
+    """
+    return getattr(request.state, "replica", None) is not None
+
+
+def _replica_failed() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Read replica unavailable, please retry",
+        headers={"Retry-After": str(REPLICA_RETRY_AFTER)},
+    )
+
+
+# Dependency to get a database session for a read-only request
+async def get_read_db(request: Request):
+    replica = choose_replica(request)
+    if replica is not None:
+        async with new_session(replica.engine) as db:
+            try:
+                # Connect up front, so an unreachable replica is replaced by
+                # the primary before the handler runs
+                await db.connection()
+            except (OperationalError, InterfaceError):
+                replica.mark_down()
+            else:
+                request.state.replica = replica
+                try:
+                    yield db
+                except (OperationalError, InterfaceError):
+                    # Lost mid-request: later reads go elsewhere until the
+                    # replica passes a health check
+                    replica.mark_down()
+                    raise _replica_failed()
+                return
+    async with new_session() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pin a client's reads to the primary for READ_YOUR_WRITES_SECONDS after
+    each of its successful writes, through a cookie holding the deadline.
+
+    Only active when replicas are configured.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or not database.DATABASE_REPLICA_URLS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + READ_YOUR_WRITES_SECONDS
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; "
+                    f"Max-Age={READ_YOUR_WRITES_SECONDS}; Path=/; HttpOnly; "
+                    f"SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
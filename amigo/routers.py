@@ -1,5 +1,12 @@
 from .appointments import router as appointments_router
 from .billing import router as billing_router
+from .changes import router as changes_router
+from .internal import router as internal_router
+from .jobs import router as jobs_router
+from .medical_records import router as medical_records_router
+from .metrics import router as metrics_router
+from .notes import router as notes_router
+from .profiling import router as profiling_router
 from .user import router as user_router
 
 
@@ -7,3 +14,10 @@ def include_routers(app):
     app.include_router(user_router)
     app.include_router(appointments_router)
     app.include_router(billing_router)
+    app.include_router(medical_records_router)
+    app.include_router(notes_router)
+    app.include_router(jobs_router)
+    app.include_router(changes_router)
+    app.include_router(internal_router)
+    app.include_router(metrics_router)
+    app.include_router(profiling_router)
@@ -0,0 +1,300 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import DDL, event, exists, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# Name of the Postgres exclusion constraint backing the overlap checks
+NO_OVERLAP_CONSTRAINT = "appointments_no_overlap"
+
+# On Postgres the database itself rejects overlapping appointments, which also
+# covers two requests racing past the application check
+event.listen(
+    models.Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+event.listen(
+    models.Appointment.__table__,
+    "after_create",
+    DDL(
+        f"ALTER TABLE appointments ADD CONSTRAINT {NO_OVERLAP_CONSTRAINT} "
+        "EXCLUDE USING gist (user_id WITH =, tsrange(start_time, end_time) WITH &&)"
+    ).execute_if(dialect="postgresql"),
+)
+
+Interval = Tuple[datetime, datetime]
+
+
+def check_interval(start_time: datetime, end_time: datetime) -> None:
+    """
+    Raises:
+        HTTPException: 422 error if the appointment does not end after it starts.
+    """
+    if end_time <= start_time:
+        raise HTTPException(status_code=422, detail="end_time must be after start_time")
+
+
+async def has_conflict(
+    db: AsyncSession,
+    user_id: int,
+    start_time: datetime,
+    end_time: datetime,
+    exclude_id: Optional[int] = None,
+) -> bool:
+    """
+    Check whether [start_time, end_time) overlaps another appointment of the user.
+
+    A user's appointments never overlap each other, so sorted by start time
+    they are also sorted by end time. Only two rows can therefore collide:
+    the last appointment starting before `start_time`, and any appointment
+    starting inside the interval. Both are single seeks on the
+    (user_id, start_time, end_time) index, whatever the calendar size.
+
+    Args:
+        db (AsyncSession): The database session.
+        user_id (int): The owner of the appointment.
+        start_time (datetime): The start of the proposed interval.
+        end_time (datetime): The end of the proposed interval.
+        exclude_id (Optional[int]): The appointment being updated, if any.
+
+    Returns:
+        bool: True if the interval overlaps an existing appointment.
+    """
+    appointment = models.Appointment
+    same_calendar = [appointment.user_id == user_id]
+    if exclude_id is not None:
+        same_calendar.append(appointment.id != exclude_id)
+
+    previous_end = (
+        select(appointment.end_time)
+        .where(*same_calendar, appointment.start_time < start_time)
+        .order_by(appointment.start_time.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    starts_inside = exists().where(
+        *same_calendar,
+        appointment.start_time >= start_time,
+        appointment.start_time < end_time,
+    )
+    return bool(await db.scalar(select(or_(starts_inside, previous_end > start_time))))
+
+
+async def ensure_no_conflict(
+    db: AsyncSession,
+    user_id: int,
+    start_time: datetime,
+    end_time: datetime,
+    exclude_id: Optional[int] = None,
+) -> None:
+    """
+    Raises:
+        HTTPException: 422 error if the interval is empty, or 409 error if it
+        overlaps another appointment of the user.
+    """
+    check_interval(start_time, end_time)
+    if await has_conflict(db, user_id, start_time, end_time, exclude_id):
+        raise HTTPException(
+            status_code=409, detail="Appointment overlaps an existing appointment"
+        )
+
+
+@asynccontextmanager
+async def rejecting_overlaps(db: AsyncSession) -> AsyncIterator[None]:
+    """
+    Turn a violation of the overlap constraint by the writes made inside the
+    block into a 409 error.
+    """
+    try:
+        yield
+    except IntegrityError as exc:
+        await db.rollback()
+        if NO_OVERLAP_CONSTRAINT in str(exc.orig):
+            raise HTTPException(
+                status_code=409, detail="Appointment overlaps an existing appointment"
+            )
+        raise
+
+
+def overlapping_indices(
+    existing: Iterable[Interval], proposed: List[Tuple[int, Interval]]
+) -> Set[int]:
+    """
+    Find the proposed intervals that overlap an existing interval or an
+    earlier proposed one, for a single calendar.
+
+    Args:
+        existing (Iterable[Interval]): Disjoint intervals already booked.
+        proposed (List[Tuple[int, Interval]]): (index, interval) pairs to add.
+
+    Returns:
+        Set[int]: The indices of the proposed intervals that must be rejected.
+    """
+    booked = sorted(existing)
+    starts = [start for start, _ in booked]
+    rejected = set()
+    accepted = []
+    for index, (start, end) in proposed:
+        position = bisect_left(starts, start)
+        if (position > 0 and booked[position - 1][1] > start) or (
+            position < len(booked) and booked[position][0] < end
+        ):
+            rejected.add(index)
+        else:
+            accepted.append((start, end, index))
+
+    # Sweep the remaining proposals by start time against each other
+    last_end = None
+    for start, end, index in sorted(accepted):
+        if last_end is not None and start < last_end:
+            rejected.add(index)
+        else:
+            last_end = end
+    return rejected
+
+
+def free_slots(
+    busy: Iterable[Interval],
+    window_start: datetime,
+    window_end: datetime,
+    duration: timedelta,
+) -> List[Interval]:
+    """
+    Compute the free intervals of at least `duration` within a window.
+
+    Sweeps the busy intervals in start order, merging overlapping or
+    adjacent ones, and emits every gap between them that is long enough.
+
+    Args:
+        busy (Iterable[Interval]): Booked intervals, sorted by start time.
+        window_start (datetime): The start of the searched window.
+        window_end (datetime): The end of the searched window.
+        duration (timedelta): The minimum length of a free interval.
+
+    Returns:
+        List[Interval]: The free intervals, in order.
+    """
+    free = []
+    cursor = window_start
+    for start, end in busy:
+        if start - cursor >= duration:
+            free.append((cursor, min(start, window_end)))
+        cursor = max(cursor, end)
+        if cursor >= window_end:
+            return free
+    if window_end - cursor >= duration:
+        free.append((cursor, window_end))
+    return free
+
+
+async def find_availability(
+    db: AsyncSession,
+    user_ids: List[int],
+    window_start: datetime,
+    window_end: datetime,
+    duration: timedelta,
+) -> Dict[int, List[Interval]]:
+    """
+    Compute the free intervals of several users with one range query.
+
+    Args:
+        db (AsyncSession): The database session.
+        user_ids (List[int]): The users whose calendars are searched.
+        window_start (datetime): The start of the searched window.
+        window_end (datetime): The end of the searched window.
+        duration (timedelta): The minimum length of a free interval.
+
+    Returns:
+        Dict[int, List[Interval]]: The free intervals of each user.
+    """
+    appointment = models.Appointment
+    rows = await db.execute(
+        select(appointment.user_id, appointment.start_time, appointment.end_time)
+        .where(
+            appointment.user_id.in_(user_ids),
+            appointment.start_time < window_end,
+            appointment.end_time > window_start,
+        )
+        .order_by(appointment.user_id, appointment.start_time)
+    )
+    busy: Dict[int, List[Interval]] = defaultdict(list)
+    for user_id, start_time, end_time in rows:
+        busy[user_id].append((start_time, end_time))
+    return {
+        user_id: free_slots(busy[user_id], window_start, window_end, duration)
+        for user_id in user_ids
+    }
+
+
+async def check_bulk_conflicts(db: AsyncSession, valid: list) -> Tuple[list, list]:
+    """
+    Split out the items of a bulk appointment request that overlap existing
+    appointments or each other.
+
+    The existing appointments of every user in the batch are read with one
+    range query over the batch's time span, then checked in memory.
+
+    Args:
+        db (AsyncSession): The database session.
+        valid (list): The (index, item) pairs that passed validation. Items
+            with an `id` replace that appointment.
+
+    Returns:
+        Tuple[list, list]: The items without conflicts, and an error result for
+        each rejected item.
+    """
+    errors = [
+        {
+            "index": index,
+            "status": "error",
+            "detail": "end_time must be after start_time",
+        }
+        for index, item in valid
+        if item.end_time <= item.start_time
+    ]
+    valid = [(i, item) for i, item in valid if item.end_time > item.start_time]
+    if not valid:
+        return valid, errors
+
+    appointment = models.Appointment
+    replaced = {getattr(item, "id", None) for _, item in valid}
+    rows = await db.execute(
+        select(
+            appointment.id,
+            appointment.user_id,
+            appointment.start_time,
+            appointment.end_time,
+        ).where(
+            appointment.user_id.in_({item.user_id for _, item in valid}),
+            appointment.start_time < max(item.end_time for _, item in valid),
+            appointment.end_time > min(item.start_time for _, item in valid),
+        )
+    )
+    existing: Dict[int, List[Interval]] = defaultdict(list)
+    for row_id, user_id, start_time, end_time in rows:
+        if row_id not in replaced:
+            existing[user_id].append((start_time, end_time))
+    proposed: Dict[int, List[Tuple[int, Interval]]] = defaultdict(list)
+    for index, item in valid:
+        proposed[item.user_id].append((index, (item.start_time, item.end_time)))
+
+    rejected = set()
+    for user_id, intervals in proposed.items():
+        rejected |= overlapping_indices(existing[user_id], intervals)
+    errors += [
+        {
+            "index": index,
+            "status": "error",
+            "detail": "Appointment overlaps an existing appointment",
+        }
+        for index in sorted(rejected)
+    ]
+    return [(i, item) for i, item in valid if i not in rejected], errors
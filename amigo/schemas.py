@@ -1,7 +1,49 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import (
+    Annotated,
+    Any,
+    Dict,
+    Generic,
+    List,
+    Literal,
+    Optional,
+    TypeVar,
+    Union,
+)
 
-from pydantic import BaseModel, EmailStr
+from pydantic import AfterValidator, BaseModel, EmailStr, Field
+
+T = TypeVar("T")
+
+BULK_MAX_ITEMS = 10000
+# Items per billing run job
+JOB_MAX_ITEMS = 100000
+
+
+# Keyset-paginated list responses
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+# Bulk requests, validated item by item so failures can be reported per item
+class BulkRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(min_length=1, max_length=BULK_MAX_ITEMS)
+    # Reject the whole batch if any item fails, instead of writing the rest
+    atomic: bool = True
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    detail: Optional[Any] = None
+
+
+class BulkResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
 
 
 # Shared properties
@@ -45,10 +87,24 @@ class UserInDB(UserInDBBase):
     hashed_password: str
 
 
+def naive_utc(value: datetime) -> datetime:
+    """
+    Convert an aware datetime to naive UTC, the form stored in the DateTime
+    columns; naive values are taken as UTC already.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# A datetime compared with stored ones: aware input is normalized on the way in
+NaiveUTC = Annotated[datetime, AfterValidator(naive_utc)]
+
+
 # Appointment schemas
 class AppointmentBase(BaseModel):
-    start_time: datetime
-    end_time: datetime
+    start_time: NaiveUTC
+    end_time: NaiveUTC
     description: Optional[str] = None
     notes: Optional[str] = None
     user_id: int
@@ -62,14 +118,29 @@ class AppointmentUpdate(AppointmentBase):
     pass
 
 
+class AppointmentBulkUpdate(AppointmentUpdate):
+    id: int
+
+
 class Appointment(AppointmentBase):
     id: int
-    user_id: int
+    # None once the appointment's user was deleted
+    user_id: Optional[int] = None
 
     class ConfigDict:
         orm_mode = True
 
 
+class TimeSlot(BaseModel):
+    start_time: datetime
+    end_time: datetime
+
+
+class Availability(BaseModel):
+    user_id: int
+    free: List[TimeSlot]
+
+
 # Billing schemas
 class BillingBase(BaseModel):
     amount: float
@@ -85,14 +156,36 @@ class BillingUpdate(BillingBase):
     pass
 
 
+class BillingBulkUpdate(BillingUpdate):
+    id: int
+
+
 class Billing(BillingBase):
     id: int
-    user_id: int
+    # None once the billing's user was deleted
+    user_id: Optional[int] = None
 
     class ConfigDict:
         orm_mode = True
 
 
+class BillingMonth(BaseModel):
+    month: str
+    count: int
+    total: float
+    unpaid_count: int
+    unpaid_balance: float
+
+
+class BillingSummary(BaseModel):
+    user_id: int
+    count: int
+    total: float
+    unpaid_count: int
+    unpaid_balance: float
+    months: List[BillingMonth]
+
+
 # MedicalRecord schemas
 class MedicalRecordBase(BaseModel):
     record: str
@@ -105,14 +198,21 @@ class MedicalRecordCreate(MedicalRecordBase):
     pass
 
 
-class MedicalRecord(MedicalRecordBase):
+# The record text is served by GET /medical-records/{id}/record
+class MedicalRecord(BaseModel):
     id: int
-    user_id: int
+    user_id: Optional[int]
+    # Size of the record text in bytes
+    record_size: int
 
     class ConfigDict:
         orm_mode = True
 
 
+class MedicalRecordSearchResult(MedicalRecord):
+    rank: float
+
+
 # Note schemas
 class NoteBase(BaseModel):
     content: str
@@ -123,9 +223,80 @@ class NoteCreate(NoteBase):
     pass
 
 
-class Note(NoteBase):
+# The note text is served by GET /notes/{id}/content
+class Note(BaseModel):
+    id: int
+    author_id: Optional[int]
+    created_at: datetime
+    # Size of the note text in bytes
+    content_size: int
+
+    class ConfigDict:
+        orm_mode = True
+
+
+class NoteSearchResult(Note):
+    rank: float
+
+
+# Patient chart: a user with the newest rows of the requested relationships
+class ChartSlice(BaseModel, Generic[T]):
+    items: List[T]
+    # Whether older rows were left out of the slice
+    has_more: bool
+
+
+class UserChart(User):
+    appointments: Optional[ChartSlice[Appointment]] = None
+    billings: Optional[ChartSlice[Billing]] = None
+    medical_records: Optional[ChartSlice[MedicalRecord]] = None
+    notes: Optional[ChartSlice[Note]] = None
+
+
+# Job schemas
+class BillingRunRequest(BaseModel):
+    # BillingCreate items, validated by the worker
+    items: List[Dict[str, Any]] = Field(min_length=1, max_length=JOB_MAX_ITEMS)
+
+
+class MarkPaidRequest(BaseModel):
+    user_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+
+
+class Job(BaseModel):
     id: int
-    author_id: int
+    kind: str
+    status: str
+    total: Optional[int] = None
+    processed: int
+    failed: int
+    errors: Optional[List[BulkItemResult]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
     class ConfigDict:
         orm_mode = True
+
+
+# Change feed schemas
+class Change(BaseModel):
+    table: Literal["users", "appointments", "billings"]
+    id: int
+    # Position in the feed, increasing with every write
+    seq: int
+    updated_at: Optional[datetime] = None
+    deleted: bool = False
+    # The row as it is now, None when it was deleted
+    data: Optional[Union[User, Appointment, Billing]] = None
+
+
+class ChangeFeed(BaseModel):
+    changes: List[Change]
+    # Sent back as `since` to get the changes after these
+    next_token: str
+    # Whether more changes are waiting after this batch
+    has_more: bool
@@ -0,0 +1,176 @@
+from os import getenv
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import (
+    DDL,
+    cast,
+    column,
+    event,
+    func,
+    literal_column,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import get_engine
+from .pagination import decode_cursor, encode_cursor, plain_columns
+
+# Postgres text search configuration used to parse documents and queries
+SEARCH_CONFIG = getenv("SEARCH_CONFIG", "english")
+MAX_SEARCH_RESULTS = 100
+
+# The searchable texts, with the column scoping a search to its owner: notes
+# are searched per author, medical records per patient
+SEARCHABLE = {
+    models.Note: models.Note.author_id,
+    models.MedicalRecord: models.MedicalRecord.user_id,
+}
+
+# Texts are stored compressed, so the database cannot index them by itself:
+# the application writes the index along with each text. On Postgres that is
+# a tsvector column, not mapped so it is never loaded, behind a GIN index
+# that also covers the owner column (hence btree_gin), so a scoped search is
+# one index scan. SQLite uses an FTS5 table per searchable table instead, the
+# rowid being the row's id. The statements are idempotent so they also
+# upgrade existing databases.
+event.listen(
+    models.Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gin").execute_if(dialect="postgresql"),
+)
+for _model, _owner in SEARCHABLE.items():
+    _table = _model.__tablename__
+    for _statement in (
+        f"ALTER TABLE {_table} ADD COLUMN IF NOT EXISTS search_vector tsvector",
+        f"CREATE INDEX IF NOT EXISTS ix_{_table}_search ON {_table} "
+        f"USING gin ({_owner.key}, search_vector)",
+    ):
+        event.listen(
+            models.Base.metadata,
+            "after_create",
+            DDL(_statement).execute_if(dialect="postgresql"),
+        )
+    for _statement in (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {_table}_search "
+        f"USING fts5(content, tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {_table}_search_delete AFTER DELETE ON {_table} "
+        f"BEGIN DELETE FROM {_table}_search WHERE rowid = OLD.id; END",
+    ):
+        event.listen(
+            models.Base.metadata,
+            "after_create",
+            DDL(_statement).execute_if(dialect="sqlite"),
+        )
+
+
+def _dialect() -> str:
+    return get_engine().dialect.name
+
+
+async def index_text(db: AsyncSession, model, ident: int, content: str) -> None:
+    """
+    Index the text of a note or medical record, in the transaction writing it.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: Note or MedicalRecord.
+        ident (int): The primary key of the row.
+        content (str): The text, or its leading part for very large ones.
+    """
+    name = model.__tablename__
+    dialect = _dialect()
+    if dialect == "postgresql":
+        statement = (
+            f"UPDATE {name} SET search_vector = "
+            f"to_tsvector(CAST(:config AS regconfig), :content) WHERE id = :id"
+        )
+        params = {"config": SEARCH_CONFIG, "content": content, "id": ident}
+    elif dialect == "sqlite":
+        statement = (
+            f"INSERT OR REPLACE INTO {name}_search (rowid, content) "
+            f"VALUES (:id, :content)"
+        )
+        params = {"content": content, "id": ident}
+    else:
+        return
+    await db.execute(text(statement), params)
+
+
+def _fts5_query(query: str) -> str:
+    # Every word must match; quoting keeps FTS5 operators in user input literal
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def search_statement(model, owner_id: int, query: str):
+    """
+    Select the rows of `model` owned by `owner_id` matching `query`, best
+    matches first, as plain columns plus a `rank`.
+    """
+    name = model.__tablename__
+    owner = SEARCHABLE[model]
+    _, columns = plain_columns(model)
+    if _dialect() == "postgresql":
+        vector = literal_column(f"{name}.search_vector")
+        tsquery = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), query)
+        rank = func.ts_rank_cd(vector, tsquery)
+        statement = select(*columns, rank.label("rank")).where(vector.op("@@")(tsquery))
+    else:
+        index = table(f"{name}_search", column("rowid"))
+        # bm25 is lower for better matches
+        rank = -func.bm25(literal_column(index.name))
+        statement = (
+            select(*columns, rank.label("rank"))
+            .join_from(model, index, index.c.rowid == model.id)
+            .where(literal_column(index.name).op("MATCH")(_fts5_query(query)))
+        )
+    return statement.where(owner == owner_id).order_by(
+        literal_column("rank").desc(), model.id.desc()
+    )
+
+
+async def search(
+    db: AsyncSession,
+    model,
+    owner_id: int,
+    query: str,
+    cursor: Optional[str],
+    limit: int,
+) -> dict:
+    """
+    Fetch one page of ranked search results.
+
+    Ranked results have no stable key to resume from, so the cursor holds the
+    offset of the next page; MAX_SEARCH_RESULTS bounds how deep it goes.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: Note or MedicalRecord.
+        owner_id (int): The author of the notes or the patient of the records.
+        query (str): The words to search for.
+        cursor (Optional[str]): The cursor returned with the previous page.
+        limit (int): The maximum number of results to return.
+
+    Returns:
+        dict: The page items, as dicts with their rank, and the cursor for
+        the following page, if any.
+
+    Raises:
+        HTTPException: 400 error if the cursor is malformed or negative.
+    """
+    offset = 0 if cursor is None else decode_cursor(cursor, "offset")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    limit = min(limit, MAX_SEARCH_RESULTS - offset)
+    if limit <= 0 or not query.split():
+        return {"items": [], "next_cursor": None}
+    statement = search_statement(model, owner_id, query).offset(offset).limit(limit + 1)
+    rows = [row._asdict() for row in await db.execute(statement)]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(offset + limit, "offset")
+    return {"items": rows[:limit], "next_cursor": next_cursor}
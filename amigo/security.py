@@ -1,19 +1,35 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from os import getenv
+from typing import Optional, Tuple
+
 import bcrypt
 
+# bcrypt work factor for new hashes; existing hashes are upgraded on verify
+BCRYPT_ROUNDS = int(getenv("BCRYPT_ROUNDS", "12"))
+# Processes dedicated to hashing and how many hashes may be queued for them
+HASH_WORKERS = int(getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(getenv("HASH_QUEUE_LIMIT", str(HASH_WORKERS * 8)))
+# Seconds a client is asked to wait when the hashing queue is full
+HASH_RETRY_AFTER = int(getenv("HASH_RETRY_AFTER", "1"))
+
 
-def get_password_hash(password: str) -> str:
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
     """
     Hash a password using bcrypt.
 
     Args:
         password (str): The plain text password.
+        rounds (Optional[int]): The work factor, `BCRYPT_ROUNDS` by default.
 
     Returns:
         str: The hashed password.
     """
     # Convert the password to bytes, then hash it
     password_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(password_bytes, salt)
     return hashed_password.decode("utf-8")
 
@@ -32,3 +48,97 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     plain_password_bytes = plain_password.encode("utf-8")
     hashed_password_bytes = hashed_password.encode("utf-8")
     return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Check whether a hash was made with a different work factor than the
+    configured `BCRYPT_ROUNDS`.
+
+    Args:
+        hashed_password (str): A bcrypt hash such as "$2b$12$...".
+
+    Returns:
+        bool: True if the hash should be replaced.
+    """
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing queue is full and the request should be retried.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, bounded process pool.
+
+    Hashing never blocks the event loop or the request threadpool, and at
+    most `queue_limit` hashes are pending at once; callers beyond that get
+    `HashingBusy` immediately instead of queueing without bound.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking a process that runs threads is unsafe, spawn instead
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        if self.pending >= self.queue_limit:
+            raise HashingBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password with the configured work factor.
+        """
+        return await self._submit(get_password_hash, password, BCRYPT_ROUNDS)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify a password against a given hash.
+        """
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    async def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and rehash it if the work factor has changed.
+
+        Returns:
+            Tuple[bool, Optional[str]]: Whether the password is correct, and a
+            replacement hash to store when the old one used another cost.
+        """
+        if not await self.verify(plain_password, hashed_password):
+            return False, None
+        if needs_rehash(hashed_password):
+            return True, await self.hash(plain_password)
+        return True, None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+password_hasher = PasswordHasher(HASH_WORKERS, HASH_QUEUE_LIMIT)
@@ -1,14 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import List
 
-from . import models, schemas
-from .database import engine, get_db
-from .security import get_password_hash
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response
+from sqlalchemy import exists, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-models.Base.metadata.create_all(bind=engine)
+from . import models, schemas
+from .cache import cache_key, invalidate, read_through, serialize
+from .chart import (
+    CHART_SECTIONS,
+    DEFAULT_CHART_LIMIT,
+    MAX_CHART_LIMIT,
+    ChartSection,
+    load_chart,
+)
+from .conditional import make_etag
+from .database import get_db
+from .replicas import get_read_db
+from .security import HASH_RETRY_AFTER, HashingBusy, password_hasher
+from .writes import delete_returning, insert_returning, update_returning
 
 router = APIRouter()
 
+# Records that outlive their user, with the column pointing at the user
+DETACHED_ON_DELETE = [
+    (models.Appointment, models.Appointment.user_id),
+    (models.Billing, models.Billing.user_id),
+    (models.MedicalRecord, models.MedicalRecord.user_id),
+    (models.Note, models.Note.author_id),
+]
+
 
 @router.post(
     "/users/",
@@ -16,7 +38,9 @@ router = APIRouter()
     response_model=schemas.User,
     status_code=status.HTTP_201_CREATED,
 )
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)) -> models.User:
+async def create_user(
+    user: schemas.UserCreate, db: AsyncSession = Depends(get_db)
+) -> models.User:
     """
     Create a new user in the database.
 
@@ -26,24 +50,45 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)) -> mode
 
     Returns:
     - The created User model instance
+
+    Raises:
+    - HTTPException: 400 error if the email is already registered
+    - HTTPException: 503 error if the password hashing queue is full
     """
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if db_user:
+    # A seek on the email index, so duplicate signups cost no bcrypt hash; the
+    # unique index still rejects a duplicate racing past this check
+    taken = await db.scalar(select(exists().where(models.User.email == user.email)))
+    if taken:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HashingBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many signups in progress, please retry",
+            headers={"Retry-After": str(HASH_RETRY_AFTER)},
+        )
+    try:
+        new_user = await insert_returning(
+            db,
+            models.User,
+            {
+                "email": user.email,
+                "full_name": user.full_name,
+                "hashed_password": hashed_password,
+            },
+        )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Email already registered")
-
-    hashed_password = get_password_hash(user.password)
-    new_user = models.User(
-        email=user.email, full_name=user.full_name, hashed_password=hashed_password
-    )
-
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
     return new_user
 
 
 @router.get("/users/{user_id}", tags=["users"], response_model=schemas.User)
-def get_user(user_id: int, db: Session = Depends(get_db)) -> models.User:
+async def get_user(
+    user_id: int, request: Request, db: AsyncSession = Depends(get_read_db)
+) -> Response:
     """
     Retrieve a user by ID.
 
@@ -52,17 +97,58 @@ def get_user(user_id: int, db: Session = Depends(get_db)) -> models.User:
     - db: Session dependency to interact with the database
 
     Returns:
-    - The User model instance
+    - The User, served from the cache when possible, with its ETag; 304 if
+      If-None-Match lists the current ETag
+    """
+
+    async def load():
+        user = await db.get(models.User, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return make_etag(user.version), serialize(schemas.User, user)
+
+    return await read_through(request, cache_key(models.User, user_id), load)
+
+
+@router.get(
+    "/users/{user_id}/chart",
+    tags=["users"],
+    response_model=schemas.UserChart,
+    response_model_exclude_unset=True,
+)
+async def get_user_chart(
+    user_id: int,
+    include: List[ChartSection] = Query(list(CHART_SECTIONS)),
+    limit: int = Query(DEFAULT_CHART_LIMIT, ge=1, le=MAX_CHART_LIMIT),
+    db: AsyncSession = Depends(get_read_db),
+) -> dict:
+    """
+    Retrieve a user's chart: the user with the newest appointments, billings,
+    medical records and notes, in one query per included relationship.
+
+    Parameters:
+    - user_id: integer representing the User ID
+    - include: the relationships to return, repeated, e.g.
+      `?include=appointments&include=notes`; all of them by default
+    - limit: the maximum number of rows per relationship
+
+    Returns:
+    - The User with a slice per included relationship, newest first, and
+      whether older rows were left out
+
+    Raises:
+    - HTTPException: 404 error if the user is not found
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return await load_chart(db, user_id, include, limit)
 
 
 @router.put("/users/{user_id}", tags=["users"], response_model=schemas.User)
-def update_user(
-    user_id: int, user: schemas.UserUpdate, db: Session = Depends(get_db)
+async def update_user(
+    user_id: int,
+    user: schemas.UserUpdate,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
 ) -> models.User:
     """
     Update user information.
@@ -73,30 +159,27 @@ def update_user(
     - db: Session dependency to interact with the database
 
     Returns:
-    - The updated User model instance
+    - The updated User model instance, with its new ETag
+
+    Raises:
+    - HTTPException: 404 error if the user is not found
+    - HTTPException: 412 error if If-Match does not list the current ETag
     """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    if user.email is not None:
-        db_user.email = user.email
-    if user.full_name is not None:
-        db_user.full_name = user.full_name
-    if user.phone_number is not None:
-        db_user.phone_number = user.phone_number
-    if user.role is not None:
-        db_user.role = user.role
-
-    db.commit()
-    db.refresh(db_user)
+    # phone_number and role have no column to be stored in
+    values = user.model_dump(include={"email", "full_name"}, exclude_none=True)
+    db_user = await update_returning(
+        db, models.User, user_id, values, request, "User not found"
+    )
+    await db.commit()
+    await invalidate(models.User, [user_id])
+    response.headers["ETag"] = make_etag(db_user.version)
     return db_user
 
 
 @router.delete(
     "/users/{user_id}", tags=["users"], status_code=status.HTTP_204_NO_CONTENT
 )
-def delete_user(user_id: int, db: Session = Depends(get_db)) -> None:
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)) -> None:
     """
     Deletes a user.
 
@@ -107,10 +190,22 @@ def delete_user(user_id: int, db: Session = Depends(get_db)) -> None:
 
     Returns:
     - 204 Code meaning User was deleted.
-    """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
 
-    db.delete(db_user)
-    db.commit()
+    Raises:
+    - HTTPException: 404 error if the user is not found
+    """
+    await delete_returning(db, models.User, user_id, "User not found")
+    # Keep the user's records, unlinked from the deleted user
+    detached = []
+    for model, column in DETACHED_ON_DELETE:
+        values = {column.key: None}
+        if "version" in model.__table__.columns:
+            values["version"] = model.version + 1
+        ids = await db.scalars(
+            update(model).where(column == user_id).values(values).returning(model.id)
+        )
+        detached.append((model, ids.all()))
+    await db.commit()
+    await invalidate(models.User, [user_id])
+    for model, ids in detached:
+        await invalidate(model, ids)
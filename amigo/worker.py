@@ -0,0 +1,240 @@
+"""
+Process the background jobs queued in the jobs table, batch by batch, each
+batch in its own transaction along with the job's progress.
+
+Run it next to the API, with as many processes as the database can take,
+sharing the API's Redis cache (or with caching off) so it can invalidate
+the rows it changes:
+
+    python -m amigo.worker --processes 4
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+from os import getenv
+from typing import Any, Dict, List, NamedTuple
+
+from sqlalchemy import func, insert, update
+
+from . import models, schemas
+from .billing import filter_billings
+from .bulk import check_users_exist, validate_items
+from .cache import CACHE_BACKEND, invalidate
+from .database import dispose_engine, new_session
+from .jobs import JOB_MAX_ATTEMPTS, claim_job, record_failures, save_progress
+
+# Items processed per batch, and so per transaction
+JOB_BATCH_SIZE = int(getenv("JOB_BATCH_SIZE", "500"))
+# Seconds an idle worker waits before looking for jobs again
+JOB_POLL_SECONDS = float(getenv("JOB_POLL_SECONDS", "1"))
+JOB_WORKERS = int(getenv("JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+logger = logging.getLogger(__name__)
+
+
+class Batch(NamedTuple):
+    # Whether the job has nothing left to process
+    done: bool
+    # Billing records changed by the batch, whose cached copies are dropped
+    changed: List[int]
+
+
+async def create_billings_batch(db, job: Dict[str, Any]) -> Batch:
+    """
+    Insert the next items of a billing run, reporting invalid ones and those
+    of unknown users as failed.
+    """
+    items = job["payload"]["items"]
+    start = job["cursor"]
+    batch = items[start : start + JOB_BATCH_SIZE]
+    valid, failures = validate_items(batch, schemas.BillingCreate)
+    valid, missing = await check_users_exist(db, valid)
+    if valid:
+        await db.execute(
+            insert(models.Billing), [item.model_dump() for _, item in valid]
+        )
+    record_failures(
+        job,
+        [
+            {**failure, "index": start + failure["index"]}
+            for failure in sorted(failures + missing, key=lambda f: f["index"])
+        ],
+    )
+    job["processed"] += len(batch)
+    job["cursor"] = start + len(batch)
+    return Batch(job["cursor"] >= len(items), [])
+
+
+async def mark_paid_batch(db, job: Dict[str, Any]) -> Batch:
+    """
+    Mark the next unpaid billing records matching the job's filters as paid,
+    in ID order from the last batch's last ID.
+    """
+    filters = schemas.MarkPaidRequest.model_validate(job["payload"])
+    unpaid = filter_billings(
+        user_id=filters.user_id,
+        paid=False,
+        date_from=filters.date_from,
+        date_to=filters.date_to,
+    )
+    if job["total"] is None:
+        job["total"] = await db.scalar(
+            unpaid.with_only_columns(func.count(models.Billing.id))
+        )
+    ids = list(
+        await db.scalars(
+            unpaid.with_only_columns(models.Billing.id)
+            .where(models.Billing.id > job["cursor"])
+            .order_by(models.Billing.id)
+            .limit(JOB_BATCH_SIZE)
+        )
+    )
+    if ids:
+        await db.execute(
+            update(models.Billing)
+            .where(models.Billing.id.in_(ids), models.Billing.paid.is_(False))
+            .values(paid=True, version=models.Billing.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        job["processed"] += len(ids)
+        job["cursor"] = ids[-1]
+    return Batch(len(ids) < JOB_BATCH_SIZE, ids)
+
+
+PROCESSORS = {
+    "billing_run": create_billings_batch,
+    "mark_paid": mark_paid_batch,
+}
+
+
+async def _fail(job: Dict[str, Any], worker: str, error: str) -> None:
+    job["error"] = error
+    async with new_session() as db:
+        if await save_progress(db, job, worker, "failed"):
+            await db.commit()
+
+
+async def process_job(job: Dict[str, Any], worker: str, stop: asyncio.Event) -> None:
+    """
+    Run a claimed job batch by batch until it is done, it fails, another
+    worker takes it over, or `stop` is set, which puts it back in the queue.
+    """
+    processor = PROCESSORS.get(job["kind"])
+    if processor is None:
+        await _fail(job, worker, f"Unknown job kind {job['kind']!r}")
+        return
+    if job["attempts"] > JOB_MAX_ATTEMPTS:
+        await _fail(job, worker, f"Abandoned {JOB_MAX_ATTEMPTS} times")
+        return
+
+    while True:
+        async with new_session() as db:
+            try:
+                batch = await processor(db, job)
+            except Exception as exc:
+                await db.rollback()
+                logger.exception("Job %s failed", job["id"])
+                await _fail(job, worker, f"{type(exc).__name__}: {exc}")
+                return
+            if batch.done:
+                status = "succeeded"
+            elif stop.is_set():
+                status = "queued"
+            else:
+                status = None
+            if not await save_progress(db, job, worker, status):
+                await db.rollback()
+                logger.warning("Job %s was taken over by another worker", job["id"])
+                return
+            await db.commit()
+        if batch.changed:
+            await invalidate(models.Billing, batch.changed)
+        if status is not None:
+            return
+
+
+async def work_once(worker: str, stop: asyncio.Event) -> bool:
+    """
+    Claim one job and process it.
+
+    Returns:
+        bool: False if no job was waiting.
+    """
+    async with new_session() as db:
+        job = await claim_job(db, worker)
+    if job is None:
+        return False
+    await process_job(job, worker, stop)
+    return True
+
+
+async def run_worker(worker: str, stop: asyncio.Event) -> None:
+    """
+    Process jobs until `stop` is set, polling every JOB_POLL_SECONDS when the
+    queue is empty.
+    """
+    try:
+        while not stop.is_set():
+            if await work_once(worker, stop):
+                continue
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await dispose_engine()
+
+
+def _run_process() -> None:
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        await run_worker(f"{socket.gethostname()}:{os.getpid()}", stop)
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Process queued background jobs.")
+    parser.add_argument("--processes", type=int, default=JOB_WORKERS)
+    args = parser.parse_args(argv)
+    if CACHE_BACKEND == "memory":
+        # Invalidations would only reach the worker's own cache: the API
+        # processes would keep serving the rows jobs change
+        parser.error("workers need CACHE_BACKEND=redis (shared with the API) or none")
+    if args.processes <= 1:
+        _run_process()
+        return 0
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_run_process, name=f"amigo-worker-{n}")
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        # Each process finishes its current batch, requeues its job and exits
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+from typing import Any, Dict, Type, TypeVar
+
+from fastapi import HTTPException, Request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .conditional import if_match_versions, precondition_failed
+
+ModelT = TypeVar("ModelT", bound=models.Base)
+
+
+async def insert_returning(
+    db: AsyncSession, model: Type[ModelT], values: Dict[str, Any]
+) -> ModelT:
+    """
+    Insert a row and load it back in the same statement.
+
+    INSERT ... RETURNING fills in the primary key and the column defaults, so
+    the new object needs no refresh after the commit.
+    """
+    return await db.scalar(insert(model).values(**values).returning(model))
+
+
+async def update_returning(
+    db: AsyncSession,
+    model: Type[ModelT],
+    ident: int,
+    values: Dict[str, Any],
+    request: Request,
+    detail: str,
+) -> ModelT:
+    """
+    Update a row by primary key and load it back in the same statement.
+
+    The row's version is incremented, and an If-Match precondition becomes
+    part of the WHERE clause, so checking it costs no extra read.
+
+    Args:
+        db (AsyncSession): The database session.
+        model (Type[ModelT]): The versioned model to update.
+        ident (int): The primary key of the row.
+        values (Dict[str, Any]): The columns to change.
+        request (Request): The incoming request, for If-Match.
+        detail (str): The error detail when the row does not exist.
+
+    Returns:
+        ModelT: The updated object.
+
+    Raises:
+        HTTPException: 404 error if the row does not exist, or 412 error if it
+        does not have a version listed by If-Match.
+    """
+    statement = update(model).where(model.id == ident)
+    versions = if_match_versions(request)
+    if versions is not None:
+        statement = statement.where(model.version.in_(versions))
+    updated = await db.scalar(
+        statement.values(**values, version=model.version + 1).returning(model)
+    )
+    if updated is not None:
+        return updated
+    # Only a failed write pays for telling a missing row from a stale one
+    if versions is not None and await db.scalar(
+        select(model.id).where(model.id == ident)
+    ):
+        raise precondition_failed()
+    raise HTTPException(status_code=404, detail=detail)
+
+
+async def delete_returning(
+    db: AsyncSession, model: Type[models.Base], ident: int, detail: str
+) -> int:
+    """
+    Delete a row by primary key, learning from DELETE ... RETURNING whether
+    it existed.
+
+    Raises:
+        HTTPException: 404 error if the row does not exist.
+    """
+    deleted = await db.scalar(
+        delete(model).where(model.id == ident).returning(model.id)
+    )
+    if deleted is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return deleted
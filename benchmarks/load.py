@@ -0,0 +1,443 @@
+"""
+Load-test every router in-process and record latency, throughput and
+allocations per endpoint.
+
+The database (a throwaway SQLite file unless DATABASE_URL is set) is seeded
+with users, appointments and billings, then each scenario is driven through
+the ASGI app by concurrent clients. Results are written as JSON; pass an
+earlier file as --baseline to fail on latency regressions. Any request
+answered with an unexpected status also fails the run.
+
+    python -m benchmarks.load --users 10000 --per-user 10 --requests 2000 \\
+        --concurrency 32 --output results.json --baseline main.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/amigo_benchmark.db"
+)
+os.environ.setdefault("DB_ASYNC", "true")
+# Every request comes from one client as fast as it can: rate limiting and
+# load shedding would answer most of them with 429 or 503 instead
+os.environ.setdefault("RATE_LIMIT_RATE", "0")
+os.environ.setdefault("SHED_MAX_IN_FLIGHT", "0")
+os.environ.setdefault("SHED_POOL_WAIT_SECONDS", "0")
+
+import httpx  # noqa: E402
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from amigo import database, models  # noqa: E402
+from amigo.main import app  # noqa: E402
+from amigo.security import get_password_hash, password_hasher  # noqa: E402
+
+SEED_BATCH_SIZE = 10000
+SEED_START = datetime(2030, 1, 1, 8)
+
+
+@dataclass
+class Seeded:
+    """
+    The primary key ranges of the seeded rows, to pick request targets from.
+    """
+
+    users: range
+    appointments: range
+    billings: range
+
+
+async def seed(users: int, per_user: int) -> Seeded:
+    """
+    Insert `users` users with `per_user` appointments and billings each.
+
+    Appointments are back-to-back hour slots per user, so they never
+    overlap; every user gets a mix of paid and unpaid billings spread over
+    the months. All users share one password hash, bcrypt would dominate
+    the seeding time otherwise.
+    """
+    await database.create_tables(models.Base.metadata)
+    hashed_password = get_password_hash("benchmark")
+    async with database.new_session() as db:
+        first_user = (await db.scalar(select(func.max(models.User.id)))) or 0
+        for start in range(0, users, SEED_BATCH_SIZE):
+            await db.execute(
+                insert(models.User),
+                [
+                    {
+                        "email": f"user{first_user + i}@benchmark.example",
+                        "full_name": f"Benchmark User {i}",
+                        "hashed_password": hashed_password,
+                        "is_clinician": i % 10 == 0,
+                    }
+                    for i in range(start, min(start + SEED_BATCH_SIZE, users))
+                ],
+            )
+            await db.commit()
+        user_ids = range(first_user + 1, first_user + users + 1)
+
+        rows = ((user_id, n) for user_id in user_ids for n in range(per_user))
+        while batch := list(itertools.islice(rows, SEED_BATCH_SIZE)):
+            await db.execute(
+                insert(models.Appointment),
+                [
+                    {
+                        "user_id": user_id,
+                        "start_time": SEED_START + timedelta(hours=n),
+                        "end_time": SEED_START + timedelta(hours=n, minutes=45),
+                        "description": "Check-up",
+                    }
+                    for user_id, n in batch
+                ],
+            )
+            await db.execute(
+                insert(models.Billing),
+                [
+                    {
+                        "user_id": user_id,
+                        "amount": 20 + n % 7 * 5,
+                        "date": SEED_START + timedelta(days=n * 9),
+                        "paid": n % 3 != 0,
+                    }
+                    for user_id, n in batch
+                ],
+            )
+            await db.commit()
+
+        async def id_range(model) -> range:
+            low, high = (
+                await db.execute(select(func.min(model.id), func.max(model.id)))
+            ).one()
+            return range(low or 0, (high or -1) + 1)
+
+        return Seeded(
+            user_ids,
+            await id_range(models.Appointment),
+            await id_range(models.Billing),
+        )
+
+
+@dataclass
+class Scenario:
+    """
+    One endpoint under test: `build` returns the method, URL and JSON body of
+    the next request.
+    """
+
+    name: str
+    build: Callable[[], tuple]
+    expected: int = 200
+
+
+def scenarios(seeded: Seeded) -> List[Scenario]:
+    pick = random.choice
+    new_slots = itertools.count()
+    new_users = itertools.count()
+    far_future = datetime(2040, 1, 1)
+
+    def slot(n: int) -> dict:
+        start = far_future + timedelta(hours=n)
+        return {
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=30)).isoformat(),
+        }
+
+    def billing_body() -> dict:
+        return {
+            "amount": 42.0,
+            "date": datetime(2031, 6, 1).isoformat(),
+            "user_id": pick(seeded.users),
+        }
+
+    window = {
+        "from": SEED_START.isoformat(),
+        "to": (SEED_START + timedelta(days=7)).isoformat(),
+    }
+    return [
+        Scenario(
+            "create_user",
+            lambda: (
+                "POST",
+                "/users/",
+                {
+                    "email": f"load{time.time_ns()}-{next(new_users)}@benchmark.example",
+                    "full_name": "Load Test",
+                    "password": "benchmark",
+                },
+            ),
+            expected=201,
+        ),
+        Scenario("get_user", lambda: ("GET", f"/users/{pick(seeded.users)}", None)),
+        Scenario(
+            "update_user",
+            lambda: (
+                "PUT",
+                f"/users/{pick(seeded.users)}",
+                {"full_name": "Renamed"},
+            ),
+        ),
+        Scenario(
+            "get_appointments",
+            lambda: (
+                "GET",
+                f"/appointments/?user_id={pick(seeded.users)}&limit=50",
+                None,
+            ),
+        ),
+        Scenario(
+            "get_appointments_page",
+            lambda: ("GET", "/appointments/?limit=100", None),
+        ),
+        Scenario(
+            "get_appointment",
+            lambda: ("GET", f"/appointments/{pick(seeded.appointments)}", None),
+        ),
+        Scenario(
+            "create_appointment",
+            lambda: (
+                "POST",
+                "/appointments/",
+                {"user_id": pick(seeded.users), **slot(next(new_slots))},
+            ),
+            expected=201,
+        ),
+        Scenario(
+            "get_user_availability",
+            lambda: (
+                "GET",
+                f"/users/{pick(seeded.users)}/availability?"
+                + "&".join(f"{k}={v}" for k, v in window.items()),
+                None,
+            ),
+        ),
+        Scenario(
+            "get_billings",
+            lambda: (
+                "GET",
+                f"/billings/?user_id={pick(seeded.users)}&paid=false",
+                None,
+            ),
+        ),
+        Scenario(
+            "get_billing",
+            lambda: ("GET", f"/billings/{pick(seeded.billings)}", None),
+        ),
+        Scenario("create_billing", lambda: ("POST", "/billings/", billing_body()), 201),
+        Scenario(
+            "update_billing",
+            lambda: ("PUT", f"/billings/{pick(seeded.billings)}", billing_body()),
+        ),
+        Scenario(
+            "get_user_billing_summary",
+            lambda: ("GET", f"/users/{pick(seeded.users)}/billing-summary", None),
+        ),
+        Scenario(
+            "export_billings",
+            lambda: ("GET", f"/billings/export?user_id={pick(seeded.users)}", None),
+        ),
+    ]
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def drive(
+    client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int
+) -> dict:
+    """
+    Send `requests` requests for a scenario from `concurrency` clients.
+    """
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = itertools.count(requests, -1)
+
+    async def worker():
+        while next(remaining) > 0:
+            method, url, body = scenario.build()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != scenario.expected:
+                key = str(response.status_code)
+                errors[key] = errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "p50_ms": 1000 * percentile(latencies, 0.50),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+    }
+
+
+async def measure_allocations(
+    client: httpx.AsyncClient, scenario: Scenario, requests: int
+) -> dict:
+    """
+    Trace memory over sequential requests, separately from the timed run
+    since tracing slows every allocation down.
+    """
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(requests):
+            method, url, body = scenario.build()
+            await client.request(method, url, json=body)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_kib": (peak - baseline) / 1024,
+        "retained_kib_per_request": (current - baseline) / 1024 / requests,
+    }
+
+
+def find_failures(results: dict) -> List[str]:
+    """
+    List the endpoints that answered any request with an unexpected status.
+    """
+    return [
+        f"{name}: {sum(result['errors'].values())} of {result['requests']} "
+        f"requests got {result['errors']}"
+        for name, result in results["endpoints"].items()
+        if result["errors"]
+    ]
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    List the endpoints whose p95 latency grew by more than `tolerance`.
+    """
+    regressions = []
+    for name, result in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {before['p95_ms']:.2f} ms -> {result['p95_ms']:.2f} ms"
+            )
+    return regressions
+
+
+async def run(args) -> dict:
+    started = time.perf_counter()
+    seeded = await seed(args.users, args.per_user)
+    seed_seconds = time.perf_counter() - started
+
+    selected = [
+        scenario
+        for scenario in scenarios(seeded)
+        if not args.only or scenario.name in args.only
+    ]
+    endpoints = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for scenario in selected:
+            # Warm up connections, caches and code paths before timing
+            await drive(client, scenario, min(50, args.requests), args.concurrency)
+            result = await drive(client, scenario, args.requests, args.concurrency)
+            if args.allocations:
+                result.update(
+                    await measure_allocations(client, scenario, min(200, args.requests))
+                )
+            endpoints[scenario.name] = result
+            print(
+                f"{scenario.name:<26} {result['rps']:>8.0f} req/s  "
+                f"p50 {result['p50_ms']:>7.2f}  p95 {result['p95_ms']:>7.2f}  "
+                f"p99 {result['p99_ms']:>7.2f} ms"
+                + (f"  errors {result['errors']}" if result["errors"] else ""),
+                flush=True,
+            )
+    password_hasher.shutdown()
+    await database.dispose_engine()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "database": database.get_engine().url.get_backend_name(),
+            "async": database.DB_ASYNC,
+            "python": platform.python_version(),
+            "users": args.users,
+            "per_user": args.per_user,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed_seconds": seed_seconds,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--per-user",
+        type=int,
+        default=10,
+        help="appointments and billings seeded per user",
+    )
+    parser.add_argument("--requests", type=int, default=500, help="per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--only", nargs="*", help="endpoints to run, e.g. get_user")
+    parser.add_argument(
+        "--no-allocations",
+        dest="allocations",
+        action="store_false",
+        help="skip the tracemalloc pass",
+    )
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative p95 increase over the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    # Timings of failed requests say nothing about the endpoint
+    failed = find_failures(results)
+    for failure in failed:
+        print(f"FAILED {failure}", file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = find_regressions(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Measure the CPU cost of serializing list responses per 10k rows, and of
+compressing them.
+
+"response_model" is FastAPI's handling of a page of ORM objects, as the list
+endpoints used to return; "dump_json (orm)" serializes the same objects with
+amigo.serialization; "dump_json (rows)" serializes the plain column dicts
+that `paginate` now returns. No database is needed.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from amigo import models, schemas
+from amigo.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from amigo.main import app
+from amigo.serialization import dump_json
+
+SCHEMAS = {
+    "/appointments/": schemas.Page[schemas.Appointment],
+    "/billings/": schemas.Page[schemas.Billing],
+}
+
+
+def make_rows(path: str, count: int) -> list:
+    start = datetime(2030, 1, 1, 9)
+    if path == "/appointments/":
+        return [
+            models.Appointment(
+                id=n,
+                user_id=n % 100,
+                start_time=start + timedelta(hours=n),
+                end_time=start + timedelta(hours=n, minutes=50),
+                description="Follow-up session",
+                notes=None,
+            )
+            for n in range(count)
+        ]
+    return [
+        models.Billing(
+            id=n,
+            user_id=n % 100,
+            amount=120.5,
+            date=start + timedelta(days=n),
+            paid=bool(n % 2),
+        )
+        for n in range(count)
+    ]
+
+
+def response_field(path: str):
+    for route in app.routes:
+        if getattr(route, "path", None) == path and "GET" in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+def cpu_ms(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Best CPU time of `repeat` calls, in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        best = min(best, time.process_time() - started)
+    return 1000 * best
+
+
+def fastapi_default(field, page: dict) -> bytes:
+    content = asyncio.run(serialize_response(field=field, response_content=page))
+    return JSONResponse(content).body
+
+
+def column_dicts(rows: list) -> list:
+    keys = [column.key for column in rows[0].__table__.columns]
+    return [{key: getattr(row, key) for key in keys} for row in rows]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    per_10k = 10000 / args.rows
+
+    for path, schema in SCHEMAS.items():
+        rows = make_rows(path, args.rows)
+        orm_page = {"items": rows, "next_cursor": None}
+        row_page = {"items": column_dicts(rows), "next_cursor": None}
+        body = dump_json(schema, row_page)
+        print(f"{path} ({args.rows} rows, {len(body)} bytes), CPU ms per 10k rows")
+
+        variants = {
+            "response_model": partial(fastapi_default, response_field(path), orm_page),
+            "dump_json (orm)": partial(dump_json, schema, orm_page),
+            "dump_json (rows)": partial(dump_json, schema, row_page),
+            "gzip": partial(zlib.compress, body, GZIP_LEVEL),
+        }
+        if brotli is not None:
+            variants["br"] = partial(brotli.compress, body, quality=BROTLI_QUALITY)
+        for name, fn in variants.items():
+            line = f"  {name:>16}  {per_10k * cpu_ms(fn, args.repeat):8.2f}"
+            if name in ("gzip", "br"):
+                line += f"  ({len(fn())} bytes)"
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Time a cold start of the app: importing amigo.main, running the lifespan
+startup and serving the first request, each in a fresh interpreter.
+
+The database (a throwaway SQLite file unless DATABASE_URL is set) is
+bootstrapped once beforehand. Pass --create-tables to also create the schema
+on every startup, as the app did before the bootstrap command existed.
+
+    python -m benchmarks.startup --runs 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/amigo_startup.db"
+)
+os.environ.setdefault("DB_ASYNC", "true")
+
+PHASES = ("import_ms", "startup_ms", "first_request_ms")
+
+# Runs in the child interpreter and prints the timings of one cold start
+CHILD = """
+import asyncio, json, sys, time
+
+import httpx
+
+started = time.perf_counter()
+from amigo.main import app
+imported = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        if sys.argv[1] == "1":
+            from amigo.bootstrap import Base
+            from amigo.database import create_tables
+            await create_tables(Base.metadata)
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://a") as c:
+            response = await c.get("/users/1")
+        assert response.status_code in (200, 404), response.text
+        return ready, time.perf_counter()
+
+ready, served = asyncio.run(main())
+print(json.dumps({
+    "import_ms": 1000 * (imported - started),
+    "startup_ms": 1000 * (ready - imported),
+    "first_request_ms": 1000 * (served - ready),
+}))
+"""
+
+
+def cold_start(create_tables: bool) -> Dict[str, float]:
+    """
+    Start the app once in a new interpreter and return its phase timings.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD, "1" if create_tables else "0"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """
+    Median and worst time of each phase, and of the whole cold start.
+    """
+    totals = [sum(sample[phase] for phase in PHASES) for sample in samples]
+    summary = {}
+    for phase, values in [
+        *((phase, [sample[phase] for sample in samples]) for phase in PHASES),
+        ("total_ms", totals),
+    ]:
+        summary[phase] = {
+            "median": round(statistics.median(values), 2),
+            "max": round(max(values), 2),
+        }
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--create-tables",
+        action="store_true",
+        help="also create the schema during startup",
+    )
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    from amigo.bootstrap import bootstrap
+
+    asyncio.run(bootstrap())
+    summary = summarize([cold_start(args.create_tables) for _ in range(args.runs)])
+    for phase, timings in summary.items():
+        print(
+            f"{phase:>18}  median {timings['median']:8.2f}  max {timings['max']:8.2f}"
+        )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summary, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Compare the database round-trips of the write paths.
+
+The "orm" pattern is how the routers used to write: load the row, change it
+through the unit of work, commit, refresh. The "returning" pattern is the
+single INSERT/UPDATE/DELETE ... RETURNING statement they use now. Each
+operation runs in its own session, as it would in its own request.
+
+    python -m benchmarks.writes --operations 2000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/amigo_benchmark.db"
+)
+os.environ.setdefault("DB_ASYNC", "true")
+
+from sqlalchemy import event  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from amigo import database, models, routers  # noqa: E402, F401
+from amigo.writes import (  # noqa: E402
+    delete_returning,
+    insert_returning,
+    update_returning,
+)
+
+# An unconditional request, as update_returning reads If-Match from it
+REQUEST = Request({"type": "http", "headers": []})
+VALUES = {"amount": 10.0, "date": datetime(2030, 1, 1), "paid": False, "user_id": 1}
+
+
+@contextmanager
+def count_statements():
+    engine = database.get_engine()
+    sync_engine = getattr(engine, "sync_engine", engine)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record)
+
+
+async def orm_create():
+    async with database.new_session() as db:
+        billing = models.Billing(**VALUES)
+        db.add(billing)
+        await db.commit()
+        await db.refresh(billing)
+        return billing.id
+
+
+async def orm_update(billing_id):
+    async with database.new_session() as db:
+        billing = await db.get(models.Billing, billing_id)
+        billing.paid = True
+        await db.commit()
+        await db.refresh(billing)
+
+
+async def orm_delete(billing_id):
+    async with database.new_session() as db:
+        billing = await db.get(models.Billing, billing_id)
+        await db.delete(billing)
+        await db.commit()
+
+
+async def returning_create():
+    async with database.new_session() as db:
+        billing = await insert_returning(db, models.Billing, VALUES)
+        await db.commit()
+        return billing.id
+
+
+async def returning_update(billing_id):
+    async with database.new_session() as db:
+        await update_returning(
+            db, models.Billing, billing_id, {"paid": True}, REQUEST, "Not found"
+        )
+        await db.commit()
+
+
+async def returning_delete(billing_id):
+    async with database.new_session() as db:
+        await delete_returning(db, models.Billing, billing_id, "Not found")
+        await db.commit()
+
+
+PATTERNS = {
+    "orm": (orm_create, orm_update, orm_delete),
+    "returning": (returning_create, returning_update, returning_delete),
+}
+
+
+async def run(pattern: str, operations: int) -> dict:
+    create, update, delete = PATTERNS[pattern]
+    report = {}
+    ids = []
+    for name, step in [
+        ("create", lambda _: create()),
+        ("update", update),
+        ("delete", delete),
+    ]:
+        with count_statements() as statements:
+            started = time.perf_counter()
+            results = [await step(ids[i] if ids else None) for i in range(operations)]
+            elapsed = time.perf_counter() - started
+        if name == "create":
+            ids = results
+        report[name] = {
+            "statements_per_op": len(statements) / operations,
+            "ops_per_sec": operations / elapsed,
+        }
+    return report
+
+
+async def main(operations: int) -> None:
+    await database.create_tables(models.Base.metadata)
+    print(f"{'pattern':<10} {'write':<7} {'statements/op':>14} {'ops/s':>10}")
+    for pattern in PATTERNS:
+        for name, result in (await run(pattern, operations)).items():
+            print(
+                f"{pattern:<10} {name:<7} {result['statements_per_op']:>14.1f} "
+                f"{result['ops_per_sec']:>10.0f}"
+            )
+    await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--operations", type=int, default=1000)
+    asyncio.run(main(parser.parse_args().operations))
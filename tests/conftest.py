@@ -1,10 +1,28 @@
+import asyncio
+import os
+import tempfile
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
-from amigo.main import app
-from amigo.models import Base
+# Point the app at a throwaway SQLite database instead of Postgres. Tests run
+# on the asyncio driver by default; set DB_ASYNC=false to cover blocking mode.
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/amigo_test_app.db"
+)
+os.environ.setdefault("DB_ASYNC", "true")
+# The minimum bcrypt cost keeps signups fast in tests
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The suite sends requests far faster than any client is allowed to
+os.environ.setdefault("RATE_LIMIT_RATE", "0")
+
+from amigo import database  # noqa: E402
+from amigo.bootstrap import bootstrap  # noqa: E402
+from amigo.main import app  # noqa: E402
+from amigo.models import Base  # noqa: E402
 
 # Use a different database for tests, for example, a SQLite in-memory database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -28,7 +46,37 @@ def db_session():
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    # Create the app's schema once, as a deployment runs the bootstrap command
+    asyncio.run(bootstrap())
+
+
 @pytest.fixture(scope="module")
 def client():
     with TestClient(app) as test_client:
         yield test_client
+
+
+@contextmanager
+def _count_statements():
+    """
+    Collect the SQL statements sent to the application's database.
+    """
+    engine = database.get_engine()
+    sync_engine = getattr(engine, "sync_engine", engine)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def count_statements():
+    return _count_statements
@@ -0,0 +1,75 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from amigo import admission, database
+from amigo.admission import AdmissionMiddleware, MemoryBuckets
+from amigo.pooling import PoolMetrics
+
+
+def make_client(rate=1.0, burst=10.0) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/appointments/")
+    async def appointments():
+        return []
+
+    @app.get("/users/{user_id}")
+    async def user(user_id: int):
+        return {"id": user_id}
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return ""
+
+    @app.post("/appointments/bulk")
+    async def bulk():
+        return {"succeeded": 0}
+
+    app.add_middleware(AdmissionMiddleware, buckets=MemoryBuckets(rate, burst, 100))
+    return TestClient(app)
+
+
+def test_rate_limit_charges_route_costs_per_client():
+    client = make_client()
+    # A list costs 5 of the 10 tokens
+    assert client.get("/appointments/").status_code == 200
+    assert client.get("/appointments/").status_code == 200
+    response = client.get("/appointments/")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+    assert client.get("/users/1").status_code == 429
+
+    # Another API key has its own bucket
+    other = {"X-API-Key": "partner-2"}
+    assert client.get("/users/1", headers=other).status_code == 200
+    # Operational reads are never limited; a bulk write costs the whole burst
+    assert client.get("/metrics").status_code == 200
+    importer = {"X-API-Key": "importer"}
+    assert client.post("/appointments/bulk", headers=importer).status_code == 200
+    assert client.post("/appointments/bulk", headers=importer).status_code == 429
+
+
+def test_requests_are_shed_while_the_pool_is_contended(monkeypatch):
+    metrics = PoolMetrics()
+    monkeypatch.setattr(database, "pool_metrics", metrics)
+    client = make_client(rate=0)
+    assert client.get("/users/1").status_code == 200
+
+    metrics.record_wait(5.0)
+    response = client.get("/users/1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/metrics").status_code == 200
+
+    # The recorded wait decays once the pool is no longer contended
+    metrics._recent_at -= 10
+    assert client.get("/users/1").status_code == 200
+
+
+def test_in_flight_limit(monkeypatch):
+    monkeypatch.setattr(admission, "SHED_MAX_IN_FLIGHT", 2)
+    middleware = AdmissionMiddleware(None, MemoryBuckets(0, 0, 0))
+    middleware.in_flight = 1
+    assert middleware.overloaded() is None
+    middleware.in_flight = 2
+    assert middleware.overloaded() == "in_flight"
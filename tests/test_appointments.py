@@ -1,3 +1,4 @@
+import json
 from datetime import datetime, timedelta
 
 import pytest
@@ -19,10 +20,56 @@ def test_appointment(client):
     return appointment_data["id"]
 
 
-def test_get_appointments(client):
+def test_get_appointments(client, test_appointment):
     response = client.get("/appointments/")
     assert response.status_code == 200
-    assert len(response.json()) >= 1
+    assert len(response.json()["items"]) >= 1
+
+
+def test_get_appointments_pages_with_cursor(client):
+    start_time = datetime(2030, 1, 1, 9)
+    created = []
+    for hour in range(3):
+        response = client.post(
+            "/appointments/",
+            json={
+                "start_time": (start_time + timedelta(hours=hour)).isoformat(),
+                "end_time": (start_time + timedelta(hours=hour + 1)).isoformat(),
+                "user_id": 42,
+            },
+        )
+        created.append(response.json()["id"])
+
+    response = client.get("/appointments/", params={"user_id": 42, "limit": 2})
+    page = response.json()
+    assert [item["id"] for item in page["items"]] == created[:2]
+    assert page["next_cursor"] is not None
+
+    response = client.get(
+        "/appointments/",
+        params={"user_id": 42, "limit": 2, "cursor": page["next_cursor"]},
+    )
+    page = response.json()
+    assert [item["id"] for item in page["items"]] == created[2:]
+    assert page["next_cursor"] is None
+
+    response = client.get(
+        "/appointments/",
+        params={
+            "user_id": 42,
+            "start_time": (start_time + timedelta(hours=1)).isoformat(),
+            "end_time": (start_time + timedelta(hours=2)).isoformat(),
+        },
+    )
+    assert [item["id"] for item in response.json()["items"]] == created[1:2]
+
+    for appointment_id in created:
+        client.delete(f"/appointments/{appointment_id}")
+
+
+def test_get_appointments_rejects_invalid_cursor(client):
+    response = client.get("/appointments/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
 
 
 def test_get_appointment(client, test_appointment):
@@ -54,3 +101,236 @@ def test_delete_appointment(client, test_appointment):
     # Verify deletion
     response = client.get(f"/appointments/{test_appointment}")
     assert response.status_code == 404
+
+
+@pytest.fixture(scope="module")
+def bulk_user_id(client):
+    response = client.post(
+        "/users/",
+        json={
+            "email": "bulk_appointments@example.com",
+            "full_name": "Bulk User",
+            "password": "testpass",
+        },
+    )
+    return response.json()["id"]
+
+
+def test_bulk_create_and_update_appointments(client, bulk_user_id):
+    start_time = datetime(2031, 1, 1, 9)
+    items = [
+        {
+            "start_time": (start_time + timedelta(hours=hour)).isoformat(),
+            "end_time": (start_time + timedelta(hours=hour, minutes=30)).isoformat(),
+            "user_id": bulk_user_id,
+        }
+        for hour in range(5)
+    ]
+    response = client.post("/appointments/bulk", json={"items": items})
+    assert response.status_code == 200, response.json()
+    body = response.json()
+    assert body["succeeded"] == 5 and body["failed"] == 0
+    ids = [result["id"] for result in body["results"]]
+    assert [result["index"] for result in body["results"]] == list(range(5))
+
+    updates = [
+        dict(item, id=ids[i], description="Imported") for i, item in enumerate(items)
+    ]
+    response = client.put("/appointments/bulk", json={"items": updates})
+    assert response.json()["succeeded"] == 5
+    response = client.get(f"/appointments/{ids[3]}")
+    assert response.json()["description"] == "Imported"
+
+
+def test_bulk_create_appointments_atomic_rejects_whole_batch(client, bulk_user_id):
+    items = [
+        {
+            "start_time": datetime(2031, 2, 1, 9).isoformat(),
+            "end_time": datetime(2031, 2, 1, 10).isoformat(),
+            "user_id": bulk_user_id,
+        },
+        {"start_time": "not a date", "user_id": bulk_user_id},
+        {
+            "start_time": datetime(2031, 2, 1, 11).isoformat(),
+            "end_time": datetime(2031, 2, 1, 12).isoformat(),
+            "user_id": 999999,
+        },
+    ]
+    response = client.post("/appointments/bulk", json={"items": items})
+    assert response.status_code == 422
+    assert [error["index"] for error in response.json()["detail"]] == [1, 2]
+    response = client.get("/appointments/", params={"user_id": bulk_user_id})
+    assert all(
+        item["start_time"] != items[0]["start_time"]
+        for item in response.json()["items"]
+    )
+
+    response = client.post("/appointments/bulk", json={"items": items, "atomic": False})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 1 and body["failed"] == 2
+    assert [result["status"] for result in body["results"]] == [
+        "created",
+        "error",
+        "error",
+    ]
+    assert body["results"][2]["detail"] == "User not found"
+
+
+def test_export_appointments_ndjson(client, bulk_user_id):
+    response = client.get("/appointments/export", params={"user_id": bulk_user_id})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines and all(line["user_id"] == bulk_user_id for line in lines)
+    assert [line["id"] for line in lines] == sorted(line["id"] for line in lines)
+
+
+def _slot(day, start_hour, end_hour, user_id=43):
+    return {
+        "start_time": datetime(2033, 1, day, *start_hour).isoformat(),
+        "end_time": datetime(2033, 1, day, *end_hour).isoformat(),
+        "user_id": user_id,
+    }
+
+
+def test_overlapping_appointments_are_rejected(client):
+    response = client.post("/appointments/", json=_slot(1, (10,), (11,)))
+    assert response.status_code == 201
+    first = response.json()["id"]
+
+    response = client.post("/appointments/", json=_slot(1, (10, 30), (11, 30)))
+    assert response.status_code == 409
+    response = client.post("/appointments/", json=_slot(1, (9,), (12,)))
+    assert response.status_code == 409
+    response = client.post("/appointments/", json=_slot(1, (12,), (11,)))
+    assert response.status_code == 422
+
+    response = client.post("/appointments/", json=_slot(1, (11,), (12,)))
+    assert response.status_code == 201
+    second = response.json()["id"]
+
+    response = client.put(f"/appointments/{second}", json=_slot(1, (10, 45), (12,)))
+    assert response.status_code == 409
+    response = client.put("/appointments/99999", json=_slot(1, (10, 45), (12,)))
+    assert response.status_code == 404
+    # Moving an appointment within its own slot is not a conflict
+    response = client.put(f"/appointments/{first}", json=_slot(1, (10, 15), (11,)))
+    assert response.status_code == 200
+
+    for appointment_id in (first, second):
+        client.delete(f"/appointments/{appointment_id}")
+
+
+def test_bulk_create_rejects_overlaps_within_batch(client, bulk_user_id):
+    items = [
+        _slot(2, (9,), (10,), bulk_user_id),
+        _slot(2, (9, 30), (10, 30), bulk_user_id),
+        _slot(2, (10,), (11,), bulk_user_id),
+    ]
+    response = client.post("/appointments/bulk", json={"items": items})
+    assert response.status_code == 422
+    assert [error["index"] for error in response.json()["detail"]] == [1]
+
+    response = client.post("/appointments/bulk", json={"items": items, "atomic": False})
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "error", "created"]
+
+    response = client.post(
+        "/appointments/bulk", json={"items": [items[1]], "atomic": False}
+    )
+    assert response.json()["results"][0]["status"] == "error"
+
+
+def test_aware_times_are_checked_as_utc(client, bulk_user_id):
+    stored = _slot(3, (10,), (11,), bulk_user_id)
+    response = client.post("/appointments/", json=stored)
+    assert response.status_code == 201
+    stored_id = response.json()["id"]
+
+    # 11:30+02:00 is 09:30 UTC: ends within the stored slot
+    mixed = dict(stored, start_time="2033-01-03T11:30:00+02:00")
+    response = client.post("/appointments/", json=mixed)
+    assert response.status_code == 409
+    aware = {
+        "start_time": "2033-01-03T11:00:00Z",
+        "end_time": "2033-01-03T14:00:00+02:00",
+        "user_id": bulk_user_id,
+    }
+    response = client.post("/appointments/", json=aware)
+    assert response.status_code == 201
+    aware_id = response.json()["id"]
+    assert response.json()["start_time"] == "2033-01-03T11:00:00"
+    assert response.json()["end_time"] == "2033-01-03T12:00:00"
+
+    items = [
+        dict(aware, start_time="2033-01-03T12:30:00Z", end_time="2033-01-03T13:00Z"),
+        dict(aware, start_time="2033-01-03T09:30:00Z", end_time="2033-01-03T10:30Z"),
+    ]
+    response = client.post("/appointments/bulk", json={"items": items})
+    assert response.status_code == 422
+    assert [error["index"] for error in response.json()["detail"]] == [1]
+
+    for appointment_id in (stored_id, aware_id):
+        client.delete(f"/appointments/{appointment_id}")
+
+
+def test_availability_lists_free_slots(client, bulk_user_id):
+    items = [
+        _slot(10, (9,), (10,), bulk_user_id),
+        _slot(10, (10,), (10, 30), bulk_user_id),
+        _slot(10, (11,), (12,), bulk_user_id),
+    ]
+    response = client.post("/appointments/bulk", json={"items": items})
+    assert response.status_code == 200, response.json()
+    window = {
+        "from": datetime(2033, 1, 10, 8).isoformat(),
+        "to": datetime(2033, 1, 10, 13).isoformat(),
+        "duration": 30,
+    }
+
+    response = client.get(f"/users/{bulk_user_id}/availability", params=window)
+    assert response.status_code == 200
+    free = [(slot["start_time"], slot["end_time"]) for slot in response.json()["free"]]
+    assert free == [
+        ("2033-01-10T08:00:00", "2033-01-10T09:00:00"),
+        ("2033-01-10T10:30:00", "2033-01-10T11:00:00"),
+        ("2033-01-10T12:00:00", "2033-01-10T13:00:00"),
+    ]
+
+    response = client.get(
+        f"/users/{bulk_user_id}/availability", params=dict(window, duration=45)
+    )
+    assert len(response.json()["free"]) == 2
+
+    response = client.get(
+        "/availability", params=dict(window, user_ids=[bulk_user_id, 999999])
+    )
+    assert [entry["user_id"] for entry in response.json()] == [bulk_user_id, 999999]
+    assert response.json()[1]["free"] == [
+        {"start_time": window["from"], "end_time": window["to"]}
+    ]
+
+    # The same window given in UTC and at an offset
+    for start, end in [
+        ("2033-01-10T08:00:00Z", "2033-01-10T13:00:00Z"),
+        ("2033-01-10T10:00:00+02:00", "2033-01-10T15:00:00+02:00"),
+    ]:
+        aware = dict(window, **{"from": start, "to": end})
+        response = client.get(f"/users/{bulk_user_id}/availability", params=aware)
+        assert response.status_code == 200
+        assert [
+            (slot["start_time"], slot["end_time"]) for slot in response.json()["free"]
+        ] == free
+        response = client.get(
+            "/availability", params=dict(aware, user_ids=[bulk_user_id])
+        )
+        assert response.status_code == 200
+        assert len(response.json()[0]["free"]) == 3
+
+    response = client.get("/users/999999/availability", params=window)
+    assert response.status_code == 404
+    response = client.get(
+        f"/users/{bulk_user_id}/availability",
+        params=dict(window, to=datetime(2033, 3, 1).isoformat()),
+    )
+    assert response.status_code == 422
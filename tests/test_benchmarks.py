@@ -0,0 +1,36 @@
+from benchmarks.load import find_failures, find_regressions, percentile
+
+
+def test_percentile_uses_nearest_rank():
+    latencies = [float(n) for n in range(1, 101)]
+    assert percentile(latencies, 0.50) == 51.0
+    assert percentile(latencies, 0.99) == 100.0
+    assert percentile([], 0.95) == 0.0
+
+
+def test_find_regressions_flags_slower_p95():
+    baseline = {
+        "endpoints": {"get_user": {"p95_ms": 10.0}, "create_user": {"p95_ms": 5.0}}
+    }
+    results = {
+        "endpoints": {
+            "get_user": {"p95_ms": 11.0},
+            "create_user": {"p95_ms": 9.0},
+            "get_billing": {"p95_ms": 50.0},
+        }
+    }
+    assert find_regressions(results, baseline, tolerance=0.2) == [
+        "create_user: p95 5.00 ms -> 9.00 ms"
+    ]
+
+
+def test_find_failures_flags_unexpected_statuses():
+    results = {
+        "endpoints": {
+            "get_user": {"requests": 200, "errors": {}},
+            "create_billing": {"requests": 200, "errors": {"429": 194}},
+        }
+    }
+    assert find_failures(results) == [
+        "create_billing: 194 of 200 requests got {'429': 194}"
+    ]
@@ -1,7 +1,12 @@
+import csv
+import io
+import json
 from datetime import datetime
 
 import pytest
 
+from amigo import billing_summary, rebuild_summaries
+
 
 @pytest.fixture(scope="module")
 def billing_id(client):
@@ -27,6 +32,48 @@ def test_get_billing(client, billing_id):
     assert response.status_code == 200, f"Billing not found or error: {response.json()}"
 
 
+def test_get_billings_filters_and_pages(client):
+    created = []
+    for day, paid in [(1, False), (2, True), (3, False)]:
+        response = client.post(
+            "/billings/",
+            json={
+                "amount": 25.0,
+                "date": datetime(2030, 1, day).isoformat(),
+                "paid": paid,
+                "user_id": 42,
+            },
+        )
+        created.append(response.json()["id"])
+
+    response = client.get(
+        "/billings/", params={"user_id": 42, "paid": False, "limit": 1}
+    )
+    page = response.json()
+    assert [item["id"] for item in page["items"]] == [created[0]]
+
+    response = client.get(
+        "/billings/",
+        params={"user_id": 42, "paid": False, "cursor": page["next_cursor"]},
+    )
+    page = response.json()
+    assert [item["id"] for item in page["items"]] == [created[2]]
+    assert page["next_cursor"] is None
+
+    response = client.get(
+        "/billings/",
+        params={
+            "user_id": 42,
+            "date_from": datetime(2030, 1, 2).isoformat(),
+            "date_to": datetime(2030, 1, 2).isoformat(),
+        },
+    )
+    assert [item["id"] for item in response.json()["items"]] == [created[1]]
+
+    for billing in created:
+        client.delete(f"/billings/{billing}")
+
+
 def test_update_billing(client, billing_id):
     updated_data = {
         "amount": 150.0,
@@ -47,3 +94,130 @@ def test_delete_billing(client, billing_id):
     assert (
         response.status_code == 404
     ), "Billing should be deleted but is still accessible"
+
+
+def test_bulk_create_and_update_billings(client):
+    response = client.post(
+        "/users/",
+        json={
+            "email": "bulk_billings@example.com",
+            "full_name": "Bulk User",
+            "password": "testpass",
+        },
+    )
+    user_id = response.json()["id"]
+    items = [
+        {
+            "amount": 10.0 * day,
+            "date": datetime(2031, 1, day).isoformat(),
+            "user_id": user_id,
+        }
+        for day in range(1, 4)
+    ]
+    response = client.post("/billings/bulk", json={"items": items})
+    assert response.status_code == 200, response.json()
+    ids = [result["id"] for result in response.json()["results"]]
+    assert len(ids) == 3
+
+    updates = [
+        {"id": ids[0], "amount": 10.0, "date": items[0]["date"], "paid": True},
+        {"id": 999999, "amount": 1.0, "date": items[0]["date"], "paid": True},
+        {"id": ids[1], "amount": 5.0, "date": items[1]["date"], "paid": True},
+        {"id": ids[1], "amount": 6.0, "date": items[1]["date"], "paid": True},
+    ]
+    response = client.put("/billings/bulk", json={"items": updates, "atomic": False})
+    body = response.json()
+    assert body["succeeded"] == 2 and body["failed"] == 2
+    assert body["results"][1]["detail"] == "Not found"
+    assert body["results"][3]["detail"] == "Duplicate id in batch"
+    assert client.get(f"/billings/{ids[0]}").json()["paid"] is True
+    assert client.get(f"/billings/{ids[1]}").json()["amount"] == 5.0
+
+    # With atomic on, the duplicate rejects the whole batch instead of a 500
+    response = client.put("/billings/bulk", json={"items": updates[2:]})
+    assert response.status_code == 422
+
+
+def test_export_billings_streams_ndjson_and_csv(client):
+    created = []
+    for day in (1, 2):
+        response = client.post(
+            "/billings/",
+            json={
+                "amount": 12.5,
+                "date": datetime(2032, 3, day).isoformat(),
+                "paid": day == 2,
+                "user_id": 77,
+            },
+        )
+        created.append(response.json()["id"])
+
+    response = client.get("/billings/export", params={"user_id": 77})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == created
+    assert lines[0]["amount"] == 12.5
+
+    response = client.get(
+        "/billings/export", params={"user_id": 77, "paid": True, "format": "csv"}
+    )
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == created[1:]
+    assert rows[0]["paid"] == "True"
+
+    for billing in created:
+        client.delete(f"/billings/{billing}")
+
+
+def test_billing_summary(client, monkeypatch):
+    user = client.post(
+        "/users/",
+        json={"email": "summary@example.com", "full_name": "Sum", "password": "x"},
+    ).json()
+    billings = [
+        (datetime(2031, 1, 5), 10.0, True),
+        (datetime(2031, 1, 20), 20.25, False),
+        (datetime(2031, 2, 3), 5.0, False),
+    ]
+    created = [
+        client.post(
+            "/billings/",
+            json={
+                "amount": amount,
+                "date": date.isoformat(),
+                "paid": paid,
+                "user_id": user["id"],
+            },
+        ).json()["id"]
+        for date, amount, paid in billings
+    ]
+    client.put(
+        f"/billings/{created[2]}",
+        json={"amount": 5.0, "date": datetime(2031, 2, 3).isoformat(), "paid": True},
+    )
+
+    live = client.get(f"/users/{user['id']}/billing-summary").json()
+    assert live["count"] == 3
+    assert live["total"] == 35.25
+    assert (live["unpaid_count"], live["unpaid_balance"]) == (1, 20.25)
+    assert [(m["month"], m["count"], m["unpaid_balance"]) for m in live["months"]] == [
+        ("2031-01", 2, 20.25),
+        ("2031-02", 1, 0.0),
+    ]
+
+    # The trigger-maintained table agrees with the live aggregate
+    monkeypatch.setattr(billing_summary, "BILLING_SUMMARY_SOURCE", "table")
+    assert client.get(f"/users/{user['id']}/billing-summary").json() == live
+    client.portal.call(rebuild_summaries.rebuild)
+    response = client.get(
+        "/billings/summary", params={"user_ids": [user["id"], 999999]}
+    )
+    assert response.json()[0] == live
+    assert response.json()[1]["count"] == 0
+
+    client.delete(f"/billings/{created[0]}")
+    summary = client.get(f"/users/{user['id']}/billing-summary").json()
+    assert (summary["count"], summary["total"]) == (2, 25.25)
+    assert client.get("/users/999999/billing-summary").status_code == 404
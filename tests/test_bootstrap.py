@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect
+
+IMPORT_APP = "import amigo.main, amigo.database as d; assert d.engine is None"
+BOOTSTRAP = (
+    "import asyncio; from amigo.bootstrap import bootstrap; asyncio.run(bootstrap())"
+)
+
+
+def test_importing_the_app_leaves_the_database_alone(tmp_path):
+    path = tmp_path / "untouched.db"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+    subprocess.run([sys.executable, "-c", IMPORT_APP], env=env, check=True)
+    assert not path.exists()
+
+
+def test_bootstrap_creates_the_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bootstrapped.db'}"
+    env = dict(os.environ, DATABASE_URL=url)
+    subprocess.run([sys.executable, "-c", BOOTSTRAP], env=env, check=True)
+
+    inspector = inspect(create_engine(url))
+    assert {"users", "appointments", "billings", "billing_summaries"} <= set(
+        inspector.get_table_names()
+    )
+    assert "ix_billings_user_id_paid_date" in {
+        index["name"] for index in inspector.get_indexes("billings")
+    }
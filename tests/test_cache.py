@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime
+
+from amigo import cache as cache_module
+from amigo.cache import MemoryCache, RedisCache
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the redis.asyncio client.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = ex
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def aclose(self):
+        pass
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(ttl=60, max_entries=2)
+
+    async def run():
+        await cache.set("a", b"1")
+        await cache.set("b", b"2")
+        assert await cache.get("a") == b"1"
+        await cache.set("c", b"3")
+        return await cache.get("b"), await cache.get("a")
+
+    assert asyncio.run(run()) == (None, b"1")
+    assert cache.stats.as_dict()["evictions"] == 1
+    assert cache.stats.hits == 2 and cache.stats.misses == 1
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache(ttl=0, max_entries=10)
+
+    async def run():
+        await cache.set("a", b"1")
+        return await cache.get("a")
+
+    assert asyncio.run(run()) is None
+    assert cache.stats.evictions == 1
+
+
+def test_redis_cache_round_trip():
+    client = FakeRedis()
+    cache = RedisCache(client, ttl=30)
+
+    async def run():
+        assert await cache.get("users:1") is None
+        await cache.set("users:1", b"{}")
+        assert await cache.get("users:1") == b"{}"
+        await cache.delete("users:1", "users:2")
+        return await cache.get("users:1")
+
+    assert asyncio.run(run()) is None
+    assert client.expiry["amigo:users:1"] == 30
+    assert cache.stats.as_dict() == {
+        "hits": 1,
+        "misses": 2,
+        "hit_ratio": 1 / 3,
+        "evictions": 0,
+        "invalidations": 1,
+    }
+
+
+def test_get_billing_is_served_from_cache_until_updated(client, monkeypatch):
+    monkeypatch.setattr(cache_module, "cache", RedisCache(FakeRedis(), ttl=30))
+    payload = {"amount": 5.0, "date": datetime(2034, 1, 1).isoformat(), "user_id": 3}
+    billing_id = client.post("/billings/", json=payload).json()["id"]
+
+    assert client.get(f"/billings/{billing_id}").json()["amount"] == 5.0
+    assert client.get(f"/billings/{billing_id}").json()["amount"] == 5.0
+    stats = client.get("/internal/cache").json()
+    assert stats["backend"] == "RedisCache"
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+
+    client.put(f"/billings/{billing_id}", json=dict(payload, amount=7.0))
+    assert client.get(f"/billings/{billing_id}").json()["amount"] == 7.0
+
+    client.delete(f"/billings/{billing_id}")
+    assert client.get(f"/billings/{billing_id}").status_code == 404
+    assert client.get("/internal/cache").json()["invalidations"] == 2
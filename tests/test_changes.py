@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect
+
+from amigo import database
+
+
+def latest_token(client):
+    params = {"limit": 500}
+    while True:
+        feed = client.get("/changes", params=params).json()
+        params["since"] = feed["next_token"]
+        if not feed["has_more"]:
+            return feed["next_token"]
+
+
+def billing(amount, user_id):
+    return {
+        "amount": amount,
+        "date": datetime(2031, 5, 1).isoformat(),
+        "paid": False,
+        "user_id": user_id,
+    }
+
+
+def test_feed_lists_writes_and_deletes_since_token(client):
+    user = {"email": "sync@example.com", "password": "secret", "full_name": "Sync"}
+    user_id = client.post("/users/", json=user).json()["id"]
+    token = latest_token(client)
+    first = client.post("/billings/", json=billing(10.0, user_id)).json()["id"]
+    second = client.post("/billings/", json=billing(20.0, user_id)).json()["id"]
+    response = client.put(f"/billings/{first}", json=billing(15.0, user_id))
+    assert response.status_code == 200
+    response = client.delete(f"/billings/{second}")
+    assert response.status_code == 204
+    bulk = client.post(
+        "/billings/bulk",
+        json={"items": [billing(30.0, user_id), billing(40.0, user_id)]},
+    ).json()
+    added = [result["id"] for result in bulk["results"]]
+
+    feed = client.get("/changes", params={"since": token}).json()
+    assert not feed["has_more"]
+    changes = feed["changes"]
+    # The updated row once, at its latest write, then the deletion
+    assert [(c["table"], c["id"], c["deleted"]) for c in changes] == [
+        ("billings", first, False),
+        ("billings", second, True),
+        ("billings", added[0], False),
+        ("billings", added[1], False),
+    ]
+    assert changes[0]["data"]["amount"] == 15.0
+    assert changes[1]["data"] is None
+    assert all(c["updated_at"] for c in changes)
+    seqs = [c["seq"] for c in changes]
+    assert seqs == sorted(seqs)
+
+    # Bounded batches resume where the previous one stopped
+    batch = client.get("/changes", params={"since": token, "limit": 3}).json()
+    assert batch["has_more"]
+    rest = client.get("/changes", params={"since": batch["next_token"]}).json()
+    assert batch["changes"] + rest["changes"] == changes
+
+    # Nothing new: the same token comes back
+    empty = client.get("/changes", params={"since": feed["next_token"]}).json()
+    assert empty == {
+        "changes": [],
+        "next_token": feed["next_token"],
+        "has_more": False,
+    }
+
+
+def test_feed_lists_records_unlinked_from_a_deleted_user(client):
+    user = {"email": "leaving@example.com", "password": "secret", "full_name": "Bye"}
+    user_id = client.post("/users/", json=user).json()["id"]
+    billing_id = client.post("/billings/", json=billing(12.0, user_id)).json()["id"]
+    token = latest_token(client)
+    assert client.delete(f"/users/{user_id}").status_code == 204
+
+    feed = client.get("/changes", params={"since": token})
+    assert feed.status_code == 200
+    changes = {(c["table"], c["id"]): c for c in feed.json()["changes"]}
+    assert changes["users", user_id]["deleted"] is True
+    assert changes["billings", billing_id]["data"]["user_id"] is None
+    # A full resync reads past the unlinked rows too
+    assert client.get("/changes", params={"limit": 500}).status_code == 200
+
+
+def test_feed_rejects_invalid_token(client):
+    assert client.get("/changes", params={"since": "bogus"}).status_code == 400
+
+
+def test_change_seq_is_indexed(client):
+    url = database.get_engine().url.set(drivername="sqlite")
+    inspector = inspect(create_engine(url))
+    for table in ("users", "appointments", "billings"):
+        indexes = {index["name"] for index in inspector.get_indexes(table)}
+        assert f"ix_{table}_change_seq" in indexes
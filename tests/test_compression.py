@@ -0,0 +1,60 @@
+import json
+from datetime import datetime
+
+from amigo import schemas
+from amigo.compression import accepts_encoding
+from amigo.serialization import dump_json
+
+
+def test_accepts_encoding_honours_q_zero():
+    assert accepts_encoding({"accept-encoding": "br, gzip;q=0.5"}, "gzip")
+    assert not accepts_encoding({"accept-encoding": "gzip;q=0, br"}, "gzip")
+    assert accepts_encoding({"accept-encoding": "*"}, "gzip")
+    assert not accepts_encoding({}, "gzip")
+
+
+def test_large_lists_are_gzipped_and_small_responses_are_not(client):
+    for day in range(1, 29):
+        client.post(
+            "/billings/",
+            json={
+                "amount": day,
+                "date": datetime(2038, 2, day).isoformat(),
+                "user_id": 9,
+            },
+        )
+
+    response = client.get(
+        "/billings/", params={"user_id": 9}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(response.json()["items"]) == 28
+
+    response = client.get(
+        "/billings/",
+        params={"user_id": 9, "limit": 1},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert "Content-Encoding" not in response.headers
+
+    response = client.get(
+        "/billings/", params={"user_id": 9}, headers={"Accept-Encoding": "identity"}
+    )
+    assert "Content-Encoding" not in response.headers
+
+
+def test_streamed_exports_are_compressed_chunk_by_chunk(client):
+    response = client.get(
+        "/billings/export", params={"user_id": 9}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert len(response.text.splitlines()) == 28
+
+
+def test_dump_json_matches_the_response_model():
+    billing = {"id": 1, "user_id": 2, "amount": 1.5, "date": datetime(2030, 1, 1)}
+    page = {"items": [billing], "next_cursor": None}
+    expected = schemas.Page[schemas.Billing](**page).model_dump(mode="json")
+    assert json.loads(dump_json(schemas.Page[schemas.Billing], page)) == expected
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from amigo import cache as cache_module
+from amigo.cache import NullCache
+
+
+def _slot(day, **fields):
+    return {
+        "user_id": 61,
+        "start_time": datetime(2035, 3, day, 9).isoformat(),
+        "end_time": datetime(2035, 3, day, 10).isoformat(),
+        **fields,
+    }
+
+
+def _appointment(client, day):
+    return client.post("/appointments/", json=_slot(day)).json()["id"]
+
+
+def test_get_returns_304_for_current_etag(client):
+    appointment_id = _appointment(client, 1)
+    response = client.get(f"/appointments/{appointment_id}")
+    etag = response.headers["ETag"]
+    assert etag == '"1"'
+
+    cached = client.get(
+        f"/appointments/{appointment_id}", headers={"If-None-Match": etag}
+    )
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+
+def test_etag_changes_after_update(client, monkeypatch):
+    monkeypatch.setattr(cache_module, "cache", NullCache())
+    payload = {"amount": 3.0, "date": datetime(2035, 1, 1).isoformat(), "user_id": 3}
+    billing_id = client.post("/billings/", json=payload).json()["id"]
+    etag = client.get(f"/billings/{billing_id}").headers["ETag"]
+
+    updated = client.put(f"/billings/{billing_id}", json=dict(payload, amount=4.0))
+    assert updated.headers["ETag"] != etag
+    response = client.get(f"/billings/{billing_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["amount"] == 4.0
+
+
+def test_put_with_stale_if_match_is_rejected(client):
+    appointment_id = _appointment(client, 2)
+    etag = client.get(f"/appointments/{appointment_id}").headers["ETag"]
+    url = f"/appointments/{appointment_id}"
+
+    first = client.put(url, json=_slot(2, notes="first"), headers={"If-Match": etag})
+    assert first.status_code == 200
+    second = client.put(url, json=_slot(2, notes="second"), headers={"If-Match": etag})
+    assert second.status_code == 412
+    assert client.get(url).json()["notes"] == "first"
+
+    fresh = client.put(
+        url, json=_slot(2, notes="second"), headers={"If-Match": first.headers["ETag"]}
+    )
+    assert fresh.status_code == 200
@@ -0,0 +1,26 @@
+from amigo import database
+
+
+def test_connection_url_defaults_to_postgres(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", None)
+    monkeypatch.setattr(database, "PGHOST", "db.example.com")
+    url = database.get_connection_url(async_mode=False)
+    assert url.drivername == "postgresql"
+    assert url.host == "db.example.com"
+    assert url.query["sslmode"] == "require"
+
+
+def test_connection_url_switches_to_asyncpg(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", None)
+    url = database.get_connection_url(async_mode=True)
+    assert url.drivername == "postgresql+asyncpg"
+    assert "sslmode" not in url.query
+    assert url.query["ssl"] == "require"
+
+
+def test_connection_url_switches_to_aiosqlite(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", "sqlite:///./amigo.db")
+    assert database.get_connection_url(async_mode=False).drivername == "sqlite"
+    url = database.get_connection_url(async_mode=True)
+    assert url.drivername == "sqlite+aiosqlite"
+    assert url.database == "./amigo.db"
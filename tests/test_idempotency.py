@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+from fastapi.responses import JSONResponse
+
+from amigo.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+
+def signup(email):
+    return {"email": email, "password": "secret", "full_name": "Retry"}
+
+
+def test_retried_post_replays_the_first_response(client):
+    headers = {"Idempotency-Key": "retry-signup-1"}
+    first = client.post("/users/", json=signup("retry@example.com"), headers=headers)
+    # Without the key the retry would fail with "Email already registered"
+    retry = client.post("/users/", json=signup("retry@example.com"), headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    other = client.post(
+        "/users/",
+        json=signup("retry@example.com"),
+        headers={"Idempotency-Key": "retry-signup-2"},
+    )
+    assert other.status_code == 400
+
+
+def test_key_reused_for_another_body_is_rejected(client):
+    headers = {"Idempotency-Key": "retry-signup-3"}
+    response = client.post("/users/", json=signup("reuse@example.com"), headers=headers)
+    assert response.status_code == 201
+    response = client.post("/users/", json=signup("other@example.com"), headers=headers)
+    assert response.status_code == 422
+
+
+def test_keys_are_scoped_to_the_client_and_query(client):
+    headers = {"Idempotency-Key": "shared-key", "X-API-Key": "partner-a"}
+    first = client.post("/users/", json=signup("scoped@example.com"), headers=headers)
+    assert first.status_code == 201
+    # Another client sending the same key runs its own request
+    other = dict(headers, **{"X-API-Key": "partner-b"})
+    response = client.post("/users/", json=signup("scoped@example.com"), headers=other)
+    assert response.status_code == 400
+    assert "Idempotent-Replayed" not in response.headers
+    response = client.post(
+        "/users/?source=import", json=signup("scoped@example.com"), headers=headers
+    )
+    assert "Idempotent-Replayed" not in response.headers
+    response = client.post(
+        "/users/", json=signup("scoped@example.com"), headers=headers
+    )
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+
+def test_concurrent_duplicates_wait_for_the_first(client):
+    calls = []
+
+    async def slow_app(scope, receive, send):
+        calls.append(scope["path"])
+        await asyncio.sleep(0.1)
+        status = 503 if len(calls) == 1 and scope["path"] == "/flaky" else 201
+        await JSONResponse({"call": len(calls)}, status_code=status)(
+            scope, receive, send
+        )
+
+    app = IdempotencyMiddleware(slow_app, IdempotencyStore(60, 100))
+
+    async def send_duplicates(path, key):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return await asyncio.gather(
+                *(c.post(path, headers={"Idempotency-Key": key}) for _ in range(3))
+            )
+
+    responses = client.portal.call(send_duplicates, "/once", "concurrent-1")
+    assert len(calls) == 1
+    assert [r.json() for r in responses] == [{"call": 1}] * 3
+
+    # A failed first attempt is not stored: a duplicate runs it again
+    calls.clear()
+    responses = client.portal.call(send_duplicates, "/flaky", "concurrent-2")
+    assert sorted(r.status_code for r in responses) == [201, 201, 503]
+    assert len(calls) == 2
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from amigo import worker
+from amigo.database import new_session
+from amigo.jobs import claim_job
+
+
+@pytest.fixture(scope="module")
+def user_id(client):
+    response = client.post(
+        "/users/",
+        json={"email": "jobs@example.com", "password": "secret", "full_name": "Jobs"},
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def run_jobs(client):
+    async def drain():
+        while await worker.work_once("test-worker", asyncio.Event()):
+            pass
+
+    client.portal.call(drain)
+
+
+def test_billing_run_and_mark_paid(client, user_id, monkeypatch):
+    monkeypatch.setattr(worker, "JOB_BATCH_SIZE", 2)
+    items = [
+        {"user_id": user_id, "amount": 10 * n, "date": f"2031-01-0{n}T00:00:00"}
+        for n in range(1, 5)
+    ]
+    items.insert(2, {"user_id": 999999, "amount": 1, "date": "2031-01-01T00:00:00"})
+    items.append({"user_id": user_id, "amount": "lots"})
+
+    response = client.post("/billings/runs", json={"items": items})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert response.headers["Location"] == f"/jobs/{job['id']}"
+
+    run_jobs(client)
+    job = client.get(f"/jobs/{job['id']}").json()
+    assert job["status"] == "succeeded"
+    assert (job["total"], job["processed"], job["failed"]) == (6, 6, 2)
+    assert [error["index"] for error in job["errors"]] == [2, 5]
+    billings = client.get("/billings/", params={"user_id": user_id}).json()
+    assert len(billings["items"]) == 4
+
+    response = client.post(
+        "/billings/mark-paid",
+        json={"user_id": user_id, "date_to": "2031-01-03T00:00:00"},
+    )
+    assert response.status_code == 202
+    run_jobs(client)
+    job = client.get(f"/jobs/{response.json()['id']}").json()
+    assert (job["status"], job["total"], job["processed"]) == ("succeeded", 3, 3)
+    unpaid = client.get("/billings/", params={"user_id": user_id, "paid": False})
+    assert [item["amount"] for item in unpaid.json()["items"]] == [40]
+
+    listed = client.get("/jobs/", params={"status": "succeeded"}).json()
+    assert job["id"] in [item["id"] for item in listed["items"]]
+
+
+def test_claimed_job_is_not_claimed_twice(client):
+    response = client.post("/billings/mark-paid", json={"user_id": 999999})
+
+    async def claim_twice():
+        async with new_session() as db:
+            first = await claim_job(db, "first")
+        async with new_session() as db:
+            second = await claim_job(db, "second")
+        return first, second
+
+    first, second = client.portal.call(claim_twice)
+    assert first["id"] == response.json()["id"]
+    assert first["worker"] == "first"
+    assert second is None
+
+    # The first worker still owns it, so it completes normally
+    client.portal.call(worker.process_job, first, "first", asyncio.Event())
+    assert client.get(f"/jobs/{first['id']}").json()["status"] == "succeeded"
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get("/jobs/999999").status_code == 404
+
+
+def test_worker_refuses_a_per_process_cache(monkeypatch):
+    monkeypatch.setattr(worker, "CACHE_BACKEND", "memory")
+    with pytest.raises(SystemExit):
+        worker.main(["--processes", "1"])
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from amigo import documents
+
+TEXT = "Intake interview. " * 50000
+
+
+def _user(client, email):
+    user = {"email": email, "full_name": "Records", "password": "pw"}
+    return client.post("/users/", json=user).json()["id"]
+
+
+def test_record_text_is_stored_compressed_and_streamed(client, monkeypatch):
+    monkeypatch.setattr(documents, "DOCUMENT_CHUNK_SIZE", 1000)
+    user_id = _user(client, "records@example.com")
+    response = client.post(
+        f"/users/{user_id}/medical-records", json={"record": "draft"}
+    )
+    assert response.status_code == 201
+    record = response.json()
+    assert record == {"id": record["id"], "user_id": user_id, "record_size": 5}
+
+    url = f"/medical-records/{record['id']}/record"
+    replaced = client.put(url, content=TEXT.encode())
+    assert replaced.json()["record_size"] == len(TEXT)
+
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert response.text == TEXT
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Length"] == str(len(TEXT))
+
+    # Clients accepting gzip get the stored bytes, several chunks long
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    stored = response.headers["Content-Length"]
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert 1000 < int(stored) < len(TEXT) // 10
+    assert response.text == TEXT
+
+    cached = client.get(url, headers={"If-None-Match": replaced.headers["ETag"]})
+    assert cached.status_code == 304
+
+
+def test_listing_records_does_not_load_their_text(client, count_statements):
+    user_id = _user(client, "listing@example.com")
+    for text in ("first", "second"):
+        client.post(f"/users/{user_id}/medical-records", json={"record": text})
+
+    with count_statements() as statements:
+        page = client.get(f"/users/{user_id}/medical-records").json()
+    assert [item["record_size"] for item in page["items"]] == [5, 6]
+    assert "medical_records.record," not in statements[0]
+    assert "medical_records.record " not in statements[0]
+
+
+def test_upload_rejects_invalid_or_oversized_bodies(client, monkeypatch):
+    user_id = _user(client, "uploads@example.com")
+    note = {"content": "", "created_at": datetime(2030, 1, 1).isoformat()}
+    note_id = client.post(f"/users/{user_id}/notes", json=note).json()["id"]
+    url = f"/notes/{note_id}/content"
+
+    assert client.put(url, content=b"\xff\xfe").status_code == 400
+    monkeypatch.setattr(documents, "MAX_DOCUMENT_BYTES", 10)
+    assert client.put(url, content=b"x" * 11).status_code == 413
+    assert client.put(url, content="héllo".encode()).status_code == 200
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.text == "héllo"
+    assert client.delete(f"/notes/{note_id}").status_code == 204
+    assert client.get(url).status_code == 404
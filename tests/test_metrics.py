@@ -0,0 +1,85 @@
+import logging
+from datetime import datetime
+
+from amigo import metrics
+
+
+def _sample(text, name, **labels):
+    prefix = name + "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+    for line in text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.split()[-1])
+    return None
+
+
+def test_metrics_record_route_latency_and_sql(client):
+    billing = client.post(
+        "/billings/",
+        json={"amount": 1.0, "date": datetime(2037, 1, 1).isoformat(), "user_id": 9},
+    ).json()
+    client.get(f"/billings/{billing['id']}")
+    client.get("/billings/does-not-exist")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    route = "/billings/{billing_id}"
+    assert _sample(
+        text, "amigo_http_requests_total", method="GET", route=route, status="200"
+    )
+    assert _sample(
+        text, "amigo_http_requests_total", method="GET", route=route, status="422"
+    )
+    assert _sample(
+        text,
+        "amigo_http_request_duration_seconds_bucket",
+        method="POST",
+        route="/billings/",
+        le="+Inf",
+    )
+    # The create ran exactly one statement
+    creates = _sample(
+        text,
+        "amigo_http_request_sql_statements_count",
+        method="POST",
+        route="/billings/",
+    )
+    assert creates >= 1
+    assert _sample(
+        text,
+        "amigo_http_request_sql_statements_bucket",
+        method="POST",
+        route="/billings/",
+        le="1",
+    ) == _sample(
+        text,
+        "amigo_http_request_sql_statements_count",
+        method="POST",
+        route="/billings/",
+    )
+    assert "amigo_http_requests_in_flight" in text
+    assert "amigo_sql_statements_total" in text
+
+
+def test_slow_requests_are_logged_with_their_sql(client, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 0)
+    with caplog.at_level(logging.WARNING, logger="amigo.metrics"):
+        client.get("/appointments/", params={"user_id": 1})
+    (record,) = (r for r in caplog.records if "Slow request" in r.getMessage())
+    message = record.getMessage()
+    assert "GET /appointments/ -> 200" in message
+    assert "1x" in message and "FROM appointments" in message
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("h", "Test.", ("route",), (1, 5))
+    for value in (0.5, 1, 3, 7):
+        histogram.observe(("/",), value)
+    assert histogram.render() == [
+        'h_bucket{route="/",le="1"} 2',
+        'h_bucket{route="/",le="5"} 3',
+        'h_bucket{route="/",le="+Inf"} 4',
+        'h_sum{route="/"} 11.5',
+        'h_count{route="/"} 4',
+    ]
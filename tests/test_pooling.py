@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from amigo import pooling
+from amigo.pooling import PoolMetrics, instrument_engine, timed_pool_class
+
+
+def test_timed_pool_records_checkouts_and_waits(tmp_path):
+    metrics = PoolMetrics()
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/pool.db",
+        poolclass=timed_pool_class(QueuePool, metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    instrument_engine(engine, metrics)
+
+    connection = engine.connect()
+    status = metrics.snapshot(engine.pool)
+    assert status["checked_out"] == 1
+    assert status["connects"] == 1
+    assert status["wait_count"] == 1
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    assert metrics.snapshot(engine.pool)["timeouts"] == 1
+
+    connection.close()
+    status = metrics.snapshot(engine.pool)
+    assert status["checked_out"] == 0
+    assert status["checkouts"] == 1
+    assert status["wait_seconds_max"] >= 0.01
+
+
+def test_pgbouncer_mode_disables_client_side_pooling(monkeypatch):
+    monkeypatch.setattr(pooling, "DB_POOL_MODE", "pgbouncer")
+    url = make_url("postgresql+asyncpg://amigo@localhost/amigo")
+    options = pooling.engine_options(url, True, PoolMetrics())
+    assert options["poolclass"] is NullPool
+    assert options["connect_args"]["statement_cache_size"] == 0
+    assert "pool_size" not in options
+
+
+def test_pool_status_endpoint(client):
+    client.get("/appointments/")
+    response = client.get("/internal/pool")
+    assert response.status_code == 200
+    status = response.json()
+    assert status["checkouts"] >= 1
+    assert status["checked_out"] == 0
@@ -0,0 +1,48 @@
+from amigo import profiling
+
+
+def test_profile_requested_by_header(client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_EXPLAIN_THRESHOLD_MS", 0)
+
+    response = client.get(
+        "/billings/", params={"user_id": 1}, headers={"X-Profile": "secret"}
+    )
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"].startswith("sql;dur=")
+    profile_id = response.headers["X-Profile-Id"]
+
+    token = {"X-Profile": "secret"}
+    profile = client.get(f"/internal/profiles/{profile_id}", headers=token).json()
+    assert profile["path"] == "/billings/"
+    assert profile["status"] == 200
+    (statement,) = profile["statements"]
+    assert "FROM billings" in statement["sql"]
+    # The plan shows whether billings.user_id is served by an index
+    assert any("USING INDEX" in line for line in statement["plan"])
+    # Parameters are described, never stored
+    assert statement["parameters"].startswith("(int")
+    assert client.get("/internal/profiles", headers=token).json()[0]["id"] == profile_id
+    assert client.get("/internal/profiles").status_code == 403
+    assert client.get(f"/internal/profiles/{profile_id}").status_code == 403
+
+
+def test_requests_are_not_profiled_without_the_token(client, monkeypatch):
+    assert "X-Profile-Id" not in client.get("/billings/").headers
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    response = client.get("/billings/", headers={"X-Profile": "guess"})
+    assert "X-Profile-Id" not in response.headers
+    assert client.get("/internal/profiles/unknown").status_code == 403
+    unknown = client.get("/internal/profiles/unknown", headers={"X-Profile": "secret"})
+    assert unknown.status_code == 404
+
+
+def test_parameters_are_described_without_values():
+    described = profiling.describe_parameters(
+        ("alice@example.com", b"\x1f\x8b" * 10, 7, None), False
+    )
+    assert described == "(str[17], bytes[20], int, NoneType)"
+    assert "alice" not in described
+    assert profiling.describe_parameters([(1, "a"), (2, "b")], True) == (
+        "2 x (int, str[1])"
+    )
@@ -0,0 +1,133 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from amigo import database, replicas
+from amigo.main import app
+from amigo.replicas import READ_YOUR_WRITES_COOKIE
+
+
+@pytest.fixture
+def replica_url(tmp_path, monkeypatch):
+    """
+    Point the replicas at a copy of the test database, as it is when the
+    returned function is called: it never sees later writes, like a lagging
+    replica.
+    """
+    path = tmp_path / "replica.db"
+
+    def use(url=f"sqlite:///{path}"):
+        if url.endswith(str(path)):
+            primary = sqlite3.connect(database.get_engine().url.database)
+            copy = sqlite3.connect(path)
+            primary.backup(copy)
+            primary.close()
+            copy.close()
+        monkeypatch.setattr(database, "DATABASE_REPLICA_URLS", [url])
+        monkeypatch.setattr(replicas, "_replicas", None)
+
+    return use
+
+
+def create_user(client, email):
+    response = client.post(
+        "/users/",
+        json={"email": email, "password": "secret", "full_name": "Replica Test"},
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_reads_use_replica_except_after_own_write(replica_url):
+    replica_url()
+    with TestClient(app) as client:
+        user_id = create_user(client, "replica@example.com")
+        assert READ_YOUR_WRITES_COOKIE in client.cookies
+
+        # Within the read-your-writes window the write is visible
+        assert client.get(f"/users/{user_id}/chart").status_code == 200
+
+        # Other clients read from the replica, which never got the write
+        client.cookies.clear()
+        assert client.get(f"/users/{user_id}/chart").status_code == 404
+
+        status = client.get("/internal/replicas").json()
+        assert status["replicas"][0]["healthy"] is True
+        assert status["replicas"][0]["pool"]["checkouts"] >= 1
+
+
+def test_unhealthy_replica_falls_back_to_primary(replica_url, tmp_path):
+    replica_url(f"sqlite:///{tmp_path}/missing/replica.db")
+    with TestClient(app) as client:
+        user_id = create_user(client, "fallback@example.com")
+        client.cookies.clear()
+        (replica,) = replicas.get_replicas()
+        assert client.portal.call(replicas.check_replica, replica) is False
+        assert not replica.healthy
+        assert client.get(f"/users/{user_id}/chart").status_code == 200
+
+
+def test_pinned_reads_skip_entries_cached_from_replicas(replica_url):
+    with TestClient(app) as client:
+        user_id = create_user(client, "pinned@example.com")
+    replica_url()
+    with TestClient(app) as client:
+        update = {"email": "pinned@example.com", "full_name": "New"}
+        assert client.put(f"/users/{user_id}", json=update).status_code == 200
+        pinned = client.cookies[READ_YOUR_WRITES_COOKIE]
+
+        # Another client reads the old name from the replica...
+        client.cookies.clear()
+        assert client.get(f"/users/{user_id}").json()["full_name"] == "Replica Test"
+        # ...without caching it for the writer, or for anyone else
+        client.cookies[READ_YOUR_WRITES_COOKIE] = pinned
+        assert client.get(f"/users/{user_id}").json()["full_name"] == "New"
+
+
+def test_unreachable_replica_falls_back_within_the_request(replica_url, tmp_path):
+    replica_url(f"sqlite:///{tmp_path}/missing/replica.db")
+    with TestClient(app) as client:
+        user_id = create_user(client, "unreachable@example.com")
+        client.cookies.clear()
+        # No health check has run yet: the failed connection is enough
+        assert client.get(f"/users/{user_id}/chart").status_code == 200
+        (replica,) = replicas.get_replicas()
+        assert not replica.healthy
+
+
+def test_replica_failing_mid_request_is_retryable(replica_url, tmp_path):
+    # Connects fine, but has no tables
+    replica_url(f"sqlite:///{tmp_path}/empty.db")
+    with TestClient(app) as client:
+        user_id = create_user(client, "empty-replica@example.com")
+        client.cookies.clear()
+        response = client.get(f"/users/{user_id}/chart")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        (replica,) = replicas.get_replicas()
+        assert not replica.healthy
+        assert client.get(f"/users/{user_id}/chart").status_code == 200
+
+
+def test_replica_selection(monkeypatch):
+    def replica(in_use, healthy=True):
+        return SimpleNamespace(
+            healthy=healthy, metrics=SimpleNamespace(in_use=in_use), engine=None
+        )
+
+    busy, idle, down = replica(3), replica(0), replica(0, healthy=False)
+    monkeypatch.setattr(replicas, "_replicas", [busy, idle, down])
+    request = Request({"type": "http", "headers": []})
+
+    chosen = {id(replicas.choose_replica(request)) for _ in range(4)}
+    assert chosen == {id(busy), id(idle)}
+
+    monkeypatch.setattr(replicas, "REPLICA_SELECTION", "least_loaded")
+    assert all(replicas.choose_replica(request) is idle for _ in range(4))
+
+    cookie = f"{READ_YOUR_WRITES_COOKIE}=9999999999".encode()
+    pinned = Request({"type": "http", "headers": [(b"cookie", cookie)]})
+    assert replicas.choose_replica(pinned) is None
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from amigo import search
+from amigo.pagination import encode_cursor
+
+
+def _user(client, email):
+    user = {"email": email, "full_name": "Search", "password": "pw"}
+    return client.post("/users/", json=user).json()["id"]
+
+
+def _note(client, author_id, content):
+    note = {"content": content, "created_at": datetime(2031, 1, 1).isoformat()}
+    return client.post(f"/users/{author_id}/notes", json=note).json()["id"]
+
+
+def test_notes_are_ranked_and_scoped_to_their_author(client):
+    author = _user(client, "searcher@example.com")
+    other = _user(client, "other-searcher@example.com")
+    best = _note(client, author, "Migraines again. Migraine diary reviewed.")
+    weaker = _note(client, author, "Patient mentioned a migraine last week, sleep ok.")
+    _note(client, author, "Discussed sleep hygiene.")
+    _note(client, other, "Migraine follow-up.")
+
+    response = client.get(f"/users/{author}/notes/search", params={"q": "migraines"})
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == [best, weaker]
+    assert items[0]["rank"] > items[1]["rank"]
+
+    page = client.get(
+        f"/users/{author}/notes/search", params={"q": "migraine", "limit": 1}
+    ).json()
+    assert [item["id"] for item in page["items"]] == [best]
+    following = client.get(
+        f"/users/{author}/notes/search",
+        params={"q": "migraine", "limit": 1, "cursor": page["next_cursor"]},
+    ).json()
+    assert [item["id"] for item in following["items"]] == [weaker]
+    assert following["next_cursor"] is None
+    response = client.get(
+        f"/users/{author}/notes/search",
+        params={"q": "migraine", "cursor": encode_cursor(-1, "offset")},
+    )
+    assert response.status_code == 400
+
+    # Every word must match, and query syntax is taken literally
+    params = {"q": 'migraine "sleep'}
+    items = client.get(f"/users/{author}/notes/search", params=params).json()["items"]
+    assert [item["id"] for item in items] == [weaker]
+
+
+def test_replaced_and_deleted_texts_leave_the_index(client):
+    patient = _user(client, "indexed@example.com")
+    record = client.post(
+        f"/users/{patient}/medical-records", json={"record": "Reports insomnia."}
+    ).json()
+    url = f"/users/{patient}/medical-records/search"
+    assert len(client.get(url, params={"q": "insomnia"}).json()["items"]) == 1
+
+    client.put(f"/medical-records/{record['id']}/record", content=b"Reports anxiety.")
+    assert client.get(url, params={"q": "insomnia"}).json()["items"] == []
+    assert len(client.get(url, params={"q": "anxiety"}).json()["items"]) == 1
+
+    client.delete(f"/medical-records/{record['id']}")
+    assert client.get(url, params={"q": "anxiety"}).json()["items"] == []
+
+
+def test_fts5_query_quotes_every_word():
+    assert search._fts5_query('a "b OR c') == '"a" """b" "OR" "c"'
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from amigo import security
+from amigo.security import (
+    HashingBusy,
+    PasswordHasher,
+    get_password_hash,
+    needs_rehash,
+    verify_password,
+)
+
+
+def test_password_hash_uses_configured_rounds():
+    hashed = get_password_hash("secret", rounds=5)
+    assert hashed.startswith("$2b$05$")
+    assert verify_password("secret", hashed)
+    assert not verify_password("wrong", hashed)
+
+
+def test_needs_rehash_when_cost_changes(monkeypatch):
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", 5)
+    assert not needs_rehash(get_password_hash("secret", rounds=5))
+    assert needs_rehash(get_password_hash("secret", rounds=4))
+
+
+def test_hasher_verifies_and_upgrades_old_hashes():
+    hasher = PasswordHasher(workers=1, queue_limit=4)
+    old_hash = get_password_hash("secret", rounds=security.BCRYPT_ROUNDS + 1)
+
+    async def run():
+        return (
+            await hasher.verify_and_update("secret", old_hash),
+            await hasher.verify_and_update("wrong", old_hash),
+        )
+
+    try:
+        (ok, new_hash), (bad, no_hash) = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert ok and bad is False and no_hash is None
+    assert not needs_rehash(new_hash)
+    assert verify_password("secret", new_hash)
+
+
+def test_hasher_rejects_work_beyond_queue_limit():
+    hasher = PasswordHasher(workers=1, queue_limit=1)
+    hasher.pending = 1
+    with pytest.raises(HashingBusy):
+        asyncio.run(hasher.hash("secret"))
+
+
+def test_create_user_returns_503_when_hashing_is_saturated(client, monkeypatch):
+    monkeypatch.setattr(security.password_hasher, "queue_limit", 0)
+    response = client.post(
+        "/users/",
+        json={"email": "busy@example.com", "full_name": "Busy", "password": "x"},
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(security.HASH_RETRY_AFTER)
@@ -1,5 +1,9 @@
+from datetime import datetime, timedelta
+
 import pytest
 
+from amigo import schemas
+
 
 # Creating a pytest fixture for the test user.
 # We remove this test user if all tests are ran succesfully.
@@ -36,3 +40,45 @@ def test_update_user(client, user_id):
 def test_delete_user(client, user_id):
     response = client.delete(f"/users/{user_id}")
     assert response.status_code == 204
+
+
+def test_user_chart_loads_each_relationship_once(client, count_statements):
+    user = {"email": "chart@example.com", "full_name": "Chart", "password": "pw"}
+    user_id = client.post("/users/", json=user).json()["id"]
+    for day in range(1, 6):
+        start = datetime(2037, 1, day, 9)
+        client.post(
+            "/appointments/",
+            json={
+                "user_id": user_id,
+                "start_time": start.isoformat(),
+                "end_time": (start + timedelta(hours=1)).isoformat(),
+            },
+        )
+        client.post(
+            "/billings/",
+            json={"user_id": user_id, "amount": day, "date": start.isoformat()},
+        )
+
+    with count_statements() as statements:
+        response = client.get(f"/users/{user_id}/chart", params={"limit": 3})
+    assert response.status_code == 200
+    # The user, then one query per relationship, however many rows they hold
+    assert len(statements) == 5
+    chart = response.json()
+    assert chart["email"] == "chart@example.com"
+    assert [b["amount"] for b in chart["billings"]["items"]] == [5.0, 4.0, 3.0]
+    assert chart["billings"]["has_more"] is True
+    assert len(chart["appointments"]["items"]) == 3
+    assert chart["notes"] == {"items": [], "has_more": False}
+
+    with count_statements() as statements:
+        response = client.get(
+            f"/users/{user_id}/chart", params={"include": "billings", "limit": 10}
+        )
+    assert len(statements) == 2
+    chart = response.json()
+    assert set(chart) - set(schemas.User.model_fields) == {"billings"}
+    assert chart["billings"]["has_more"] is False
+
+    assert client.get("/users/999999/chart").status_code == 404
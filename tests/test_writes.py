@@ -0,0 +1,36 @@
+from datetime import datetime
+
+
+def test_billing_writes_are_one_statement_each(client, count_statements):
+    payload = {"amount": 8.0, "date": datetime(2036, 1, 1).isoformat(), "user_id": 5}
+    with count_statements() as statements:
+        billing = client.post("/billings/", json=payload).json()
+    assert len(statements) == 1
+    assert billing["amount"] == 8.0
+
+    with count_statements() as statements:
+        response = client.put(
+            f"/billings/{billing['id']}", json=dict(payload, amount=9.0)
+        )
+    assert len(statements) == 1
+    assert response.json()["amount"] == 9.0
+
+    with count_statements() as statements:
+        assert client.delete(f"/billings/{billing['id']}").status_code == 204
+    assert len(statements) == 1
+    assert client.delete(f"/billings/{billing['id']}").status_code == 404
+    assert client.put(f"/billings/{billing['id']}", json=payload).status_code == 404
+
+
+def test_create_user_rejects_duplicate_email(client, count_statements):
+    user = {"email": "twice@example.com", "full_name": "Twice", "password": "pw"}
+    with count_statements() as statements:
+        assert client.post("/users/", json=user).status_code == 201
+    # The email lookup, then the insert
+    assert len(statements) == 2
+    with count_statements() as statements:
+        response = client.post("/users/", json=user)
+    # Rejected by the lookup, before hashing the password
+    assert len(statements) == 1
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"